@@ -0,0 +1,99 @@
+"""Throughput and accuracy of the transcript parser.
+
+Runs ``parse_reading`` and ``extract_numeric_value`` over the transcripts
+in ``transcripts.json`` and prints a JSON report. The original
+single-regex extractor is measured alongside as a baseline.
+
+    python benchmarks/bench_parsing.py [--corpus PATH] [--seconds N] [--output PATH]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from logbook.parsing import extract_numeric_value, parse_reading  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transcripts.json')
+
+
+def legacy_extract(text, parameters=None):
+    """The regex extractor the app used before the tokenizer-based parser"""
+    numbers = re.findall(r"[-+]?\d*\.\d+|\d+", text)
+    return float(numbers[0]) if numbers else None
+
+
+def _throughput(parse, corpus, seconds):
+    calls = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        for case in corpus:
+            parse(case['text'], case['parameters'])
+        calls += len(corpus)
+        elapsed = time.perf_counter() - started
+    return calls / elapsed
+
+
+def _accuracy(corpus):
+    value_hits = unit_hits = parameter_hits = 0
+    failures = []
+    for case in corpus:
+        parsed = parse_reading(case['text'], case['parameters'])
+        value_ok = parsed.value is not None and abs(parsed.value - case['value']) < 1e-9
+        unit_ok = parsed.unit == case['unit']
+        parameter_ok = parsed.parameter == case['parameter']
+        value_hits += value_ok
+        unit_hits += unit_ok
+        parameter_hits += parameter_ok
+        if not (value_ok and unit_ok and parameter_ok):
+            failures.append({'text': case['text'], 'expected': [case['value'], case['unit'], case['parameter']],
+                             'got': [parsed.value, parsed.unit, parsed.parameter]})
+    total = len(corpus)
+    return {
+        'value_accuracy': value_hits / total,
+        'unit_accuracy': unit_hits / total,
+        'parameter_accuracy': parameter_hits / total,
+        'failures': failures,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--seconds', type=float, default=1.0, help="time spent on each throughput run")
+    parser.add_argument('--output', help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with open(args.corpus, encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    legacy_hits = sum(
+        1 for case in corpus
+        if legacy_extract(case['text']) is not None and abs(legacy_extract(case['text']) - case['value']) < 1e-9
+    )
+    report = {
+        'benchmark': 'parsing',
+        'transcripts': len(corpus),
+        'parse_reading': {'parses_per_second': _throughput(parse_reading, corpus, args.seconds), **_accuracy(corpus)},
+        'extract_numeric_value': {
+            'parses_per_second': _throughput(lambda text, parameters: extract_numeric_value(text), corpus, args.seconds),
+        },
+        'legacy_regex': {
+            'parses_per_second': _throughput(legacy_extract, corpus, args.seconds),
+            'value_accuracy': legacy_hits / len(corpus),
+        },
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""Latency and accuracy of speech recognition on recorded audio fixtures.
+
+Runs headless: utterances are read from the WAV files listed in
+``audio/fixtures.json`` instead of a microphone. For every engine the
+report gives recognition latency and how often the parsed value matches
+the one spoken, both free and constrained to the logbook's vocabulary;
+engines that are not installed or have no model are reported as skipped.
+The fixtures are then replayed in real time through the voice pipeline,
+against a throwaway store, to measure end-to-end entry latency with
+capture and recognition overlapping.
+
+The stages that need no engine are always measured, so there are numbers
+even where none is installed: fingerprinting an utterance, looking it up
+in the transcript cache, and parsing and validating what was said.
+
+Fixtures are recorded once on a machine with a microphone, or synthesized
+with espeak-ng (``pip install espeakng-loader``) where there is none. The
+checked-in fixtures are synthesized; recordings of operators on the plant
+floor make the accuracy figures mean more:
+
+    python benchmarks/bench_recognition.py --record "pressure two point five bar" \\
+        --area "Area 1 - Crude Processing" --parameter Pressure --value 2.5
+    python benchmarks/bench_recognition.py --synthesize "pressure two point five bar" \\
+        --area "Area 1 - Crude Processing" --parameter Pressure --value 2.5
+
+    python benchmarks/bench_recognition.py [--engines vosk whisper google] [--output PATH]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audio')
+DEFAULT_MANIFEST = os.path.join(FIXTURES_DIR, 'fixtures.json')
+DEFAULT_ENGINES = ('vosk', 'whisper')
+
+# Fixtures are stored at the rate the offline engines expect
+FIXTURE_RATE = 16000
+SYNTHESIS_VOICE = 'en-us'
+# The fixtures are few; the stages that need no engine go over them this often for steadier percentiles
+DEFAULT_ROUNDS = 50
+
+
+def load_fixtures(manifest=DEFAULT_MANIFEST):
+    """Fixtures listed in ``manifest``, each with its ``sr.AudioData`` under ``audio``"""
+    import speech_recognition as sr
+    if not os.path.exists(manifest):
+        return []
+    with open(manifest, encoding='utf-8') as f:
+        fixtures = json.load(f)
+    directory = os.path.dirname(manifest)
+    for fixture in fixtures:
+        with sr.AudioFile(os.path.join(directory, fixture['file'])) as source:
+            fixture['audio'] = sr.Recognizer().record(source)
+        fixture['seconds'] = len(fixture['audio'].frame_data) / (fixture['audio'].sample_rate
+                                                                 * fixture['audio'].sample_width)
+    return fixtures
+
+
+def _latency(samples):
+    samples = sorted(samples)
+    return {
+        'p50_ms': statistics.median(samples) * 1000,
+        'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+def bench_engine(engine, fixtures, grammar=False):
+    import speech_recognition as sr
+    from logbook.parsing import parse_reading
+    from logbook.speech import preload, recognize
+
+    recognizer = sr.Recognizer()
+    try:
+        preload(engine)
+    except sr.RequestError as e:
+        return {'skipped': str(e)}
+    durations, hits, errors = [], 0, 0
+    for fixture in fixtures:
+        started = time.perf_counter()
+        try:
+            # Every fixture is heard once; the cache would only hide the engine
+            result = recognize(recognizer, fixture['audio'], engine,
+                               phrases=[fixture['parameter']] if grammar else None, cache=False)
+        except sr.RequestError as e:
+            return {'skipped': str(e)}
+        except sr.UnknownValueError:
+            errors += 1
+            continue
+        finally:
+            durations.append(time.perf_counter() - started)
+        value = parse_reading(result.text, [fixture['parameter']]).value
+        hits += value is not None and abs(value - fixture['value']) < 1e-9
+    return {'utterances': len(fixtures), **_latency(durations),
+            'value_accuracy': hits / len(fixtures), 'not_understood': errors}
+
+
+def bench_stages(fixtures, rounds=DEFAULT_ROUNDS):
+    """Latency of the stages around recognition, which every engine shares"""
+    from logbook.pipeline import readings_from_text
+    from logbook.speech import RecognitionCache, RecognitionResult, fingerprint
+
+    # Primed the way recognize() leaves it after hearing every fixture once
+    cache = RecognitionCache()
+    for fixture in fixtures:
+        key = ('bench', (fixture['parameter'],), fingerprint(fixture['audio']))
+        cache.put(key, RecognitionResult(fixture['text'], 1.0, 0.0, 'bench'))
+    fingerprints, lookups, parses = [], [], []
+    hits = values = 0
+    for _ in range(rounds):
+        for fixture in fixtures:
+            started = time.perf_counter()
+            digest = fingerprint(fixture['audio'])
+            fingerprinted = time.perf_counter()
+            result = cache.get(('bench', (fixture['parameter'],), digest))
+            looked_up = time.perf_counter()
+            # The spoken text stands in for a perfect transcript
+            rows, _, _ = readings_from_text(fixture['area'], fixture['parameter'], fixture['text'])
+            parsed = time.perf_counter()
+            fingerprints.append(fingerprinted - started)
+            lookups.append(looked_up - started)
+            parses.append(parsed - looked_up)
+            hits += result is not None
+            values += bool(rows) and abs(rows[0][2] - fixture['value']) < 1e-9
+    count = rounds * len(fixtures)
+    return {
+        'utterances': count,
+        'fingerprint': _latency(fingerprints),
+        # Fingerprint included: that is what a repeated utterance costs instead of recognition
+        'cache_lookup': {**_latency(lookups), 'hit_rate': hits / count},
+        'parse': {**_latency(parses), 'value_accuracy': values / count},
+    }
+
+
+class ReplaySession:
+    """Stands in for ``AudioSession``: plays the fixtures back at the speed they were spoken"""
+
+    calibrated = True
+
+    def __init__(self, fixtures):
+        import speech_recognition as sr
+        self.recognizer = sr.Recognizer()
+        self._fixtures = iter(fixtures)
+
+    def listen(self, timeout=None, phrase_time_limit=None):
+        import speech_recognition as sr
+        fixture = next(self._fixtures, None)
+        if fixture is None:
+            time.sleep(timeout or 0)
+            raise sr.WaitTimeoutError()
+        time.sleep(fixture['seconds'])
+        return fixture['audio']
+
+
+def bench_pipeline(engine, fixtures):
+    """Dictate every fixture back to back through the voice pipeline"""
+    from logbook.pipeline import VoicePipeline
+    from logbook.writer import get_write_queue
+
+    pipeline = VoicePipeline(ReplaySession(fixtures), engine=engine, listen_timeout=0.1)
+    started = time.perf_counter()
+    for fixture in fixtures:
+        pipeline.request(fixture['area'], fixture['parameter'])
+    outcomes = []
+    while len(outcomes) < len(fixtures):
+        outcomes += pipeline.collect()
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    pipeline.close()
+    get_write_queue().flush()
+    spoken = sum(fixture['seconds'] for fixture in fixtures)
+    return {
+        'seconds': elapsed,
+        'spoken_seconds': spoken,
+        # 1.0 means every stage kept up with the operator speaking
+        'speech_to_wall_clock': spoken / elapsed,
+        'logged': sum(len(outcome.rows) for outcome in outcomes),
+        'stages': pipeline.stats(),
+    }
+
+
+def record_fixture(text, area, parameter, value, manifest=DEFAULT_MANIFEST):
+    """Record one utterance from the microphone and add it to the manifest"""
+    from logbook.audio import AudioSession
+
+    session = AudioSession()
+    print(f"Say: {text}")
+    audio = session.listen(timeout=10, phrase_time_limit=10)
+    session.close()
+    add_fixture(audio, text, area, parameter, value, manifest)
+
+
+def synthesize(text, voice=SYNTHESIS_VOICE):
+    """``sr.AudioData`` of ``text`` spoken by espeak-ng"""
+    import ctypes
+    import speech_recognition as sr
+    try:
+        import espeakng_loader
+    except ImportError:
+        raise RuntimeError("Synthesizing fixtures needs espeak-ng; install it with 'pip install espeakng-loader'")
+    espeak = ctypes.CDLL(espeakng_loader.get_library_path())
+    # Synchronous output hands every block of samples to the callback before espeak_Synth returns
+    rate = espeak.espeak_Initialize(2, 0, os.path.dirname(espeakng_loader.get_data_path()).encode(), 0)
+    if rate <= 0 or espeak.espeak_SetVoiceByName(voice.encode()) != 0:
+        raise RuntimeError(f"espeak-ng could not load the {voice!r} voice")
+    samples = []
+
+    @ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_short), ctypes.c_int, ctypes.c_void_p)
+    def collect(wav, count, events):
+        if wav:
+            samples.append(ctypes.string_at(wav, count * 2))
+        return 0
+
+    espeak.espeak_SetSynthCallback(collect)
+    data = text.encode()
+    espeak.espeak_Synth(data, ctypes.c_size_t(len(data) + 1), 0, 1, 0, 0, None, None)
+    espeak.espeak_Synchronize()
+    espeak.espeak_Terminate()
+    return sr.AudioData(b''.join(samples), rate, 2)
+
+
+def synthesize_fixture(text, area, parameter, value, manifest=DEFAULT_MANIFEST):
+    """Synthesize one utterance and add it to the manifest"""
+    add_fixture(synthesize(text), text, area, parameter, value, manifest)
+
+
+def add_fixture(audio, text, area, parameter, value, manifest=DEFAULT_MANIFEST):
+    """Store ``audio`` of ``text`` as a WAV file next to the manifest and list it there"""
+    os.makedirs(os.path.dirname(manifest), exist_ok=True)
+    fixtures = []
+    if os.path.exists(manifest):
+        with open(manifest, encoding='utf-8') as f:
+            fixtures = json.load(f)
+    name = re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+    file_name = f"{len(fixtures) + 1:03d}-{name}.wav"
+    with open(os.path.join(os.path.dirname(manifest), file_name), 'wb') as f:
+        f.write(audio.get_wav_data(convert_rate=FIXTURE_RATE))
+    fixtures.append({'file': file_name, 'text': text, 'area': area, 'parameter': parameter, 'value': value})
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump(fixtures, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    print(f"Saved {file_name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST)
+    parser.add_argument('--engines', nargs='+', default=list(DEFAULT_ENGINES),
+                        help="engines to measure; include google to measure the web API")
+    parser.add_argument('--record', metavar='TEXT', help="record a new fixture of TEXT being spoken")
+    parser.add_argument('--synthesize', metavar='TEXT', help="add a fixture of TEXT spoken by espeak-ng")
+    parser.add_argument('--area')
+    parser.add_argument('--parameter')
+    parser.add_argument('--value', type=float)
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help="times the stages that need no engine go over the fixtures")
+    parser.add_argument('--output', help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.record or args.synthesize:
+        if not (args.area and args.parameter and args.value is not None):
+            parser.error("--record and --synthesize need --area, --parameter and --value")
+        if args.record:
+            record_fixture(args.record, args.area, args.parameter, args.value, args.manifest)
+        else:
+            synthesize_fixture(args.synthesize, args.area, args.parameter, args.value, args.manifest)
+        return
+
+    fixtures = load_fixtures(args.manifest)
+    report = {'benchmark': 'recognition', 'fixtures': len(fixtures), 'stages': {}, 'engines': {}, 'pipeline': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        # The pipeline writes what it hears; keep it out of the real log
+        os.environ['LOGBOOK_DB_PATH'] = os.path.join(directory, 'bench.db')
+        os.environ['LOGBOOK_ARCHIVE_DIR'] = os.path.join(directory, 'archive')
+        os.environ['LOGBOOK_OUTBOX_PATH'] = os.path.join(directory, 'outbox.db')
+        if fixtures:
+            report['stages'] = bench_stages(fixtures, args.rounds)
+        else:
+            report['stages'] = {'skipped': "no fixtures; record some with --record or --synthesize"}
+        for engine in args.engines:
+            if not fixtures:
+                report['engines'][engine] = {'skipped': "no fixtures; record some with --record or --synthesize"}
+                continue
+            report['engines'][engine] = bench_engine(engine, fixtures)
+            if 'skipped' not in report['engines'][engine]:
+                report['engines'][engine]['grammar'] = bench_engine(engine, fixtures, grammar=True)
+                report['pipeline'][engine] = bench_pipeline(engine, fixtures)
+        output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
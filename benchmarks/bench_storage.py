@@ -0,0 +1,148 @@
+"""Latency and throughput of the log store on synthetic logbooks.
+
+For every size in ``--rows`` a fresh store is filled with a synthetic
+logbook and measured:
+
+* bulk load through ``append_frame``;
+* a single durable ``append``, what ``append_to_excel`` used to do per
+  reading, and a write-queue ``submit``, what an operator waits for now;
+* undoing and redoing the newest reading, which replaced removing the last
+  row of the workbook;
+* the latest readings of one parameter and a full shift of one area;
+* exporting the whole log to CSV, gzip-compressed CSV and Parquet;
+* rewriting the Excel workbook, up to ``--excel-max-rows``.
+
+Prints a JSON report; pass ``--backend`` to compare storage backends.
+
+    python benchmarks/bench_storage.py [--rows 10000 100000 1000000] [--output PATH]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from benchmarks.synthetic import synthetic_chunks  # noqa: E402
+from logbook.export import EXPORT_FORMATS, write_export  # noqa: E402
+from logbook.parameters import get_registry  # noqa: E402
+from logbook.storage import BACKENDS, DEFAULT_BACKEND, TIMESTAMP_FORMAT, export_excel, now_timestamp  # noqa: E402
+from logbook.writer import WriteBehindQueue  # noqa: E402
+
+DEFAULT_ROWS = (10000, 100000)
+DEFAULT_SAMPLES = 200
+DEFAULT_EXCEL_MAX_ROWS = 100000
+
+
+def _latency(samples):
+    """Median, p99 and max of durations in seconds, in milliseconds"""
+    samples = sorted(samples)
+    return {
+        'p50_ms': statistics.median(samples) * 1000,
+        'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+def _time(function, samples):
+    durations = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return _latency(durations)
+
+
+def bench_size(backend, rows, directory, samples=DEFAULT_SAMPLES, excel_max_rows=DEFAULT_EXCEL_MAX_ROWS, seed=0):
+    registry = get_registry()
+    tag = registry.tag(0)
+    storage = BACKENDS[backend](os.path.join(directory, f'bench-{rows}.db'))
+    result = {'rows': rows}
+    try:
+        started = time.perf_counter()
+        for chunk in synthetic_chunks(rows, seed=seed):
+            storage.append_frame(chunk, skip_existing=False)
+        elapsed = time.perf_counter() - started
+        result['bulk_load'] = {'seconds': elapsed, 'rows_per_second': rows / elapsed}
+        # The last shift of the synthetic history, before the appends below add readings stamped now
+        end = storage.query(limit=1, newest_first=True)[0].timestamp
+        start = (datetime.strptime(end, TIMESTAMP_FORMAT) - timedelta(hours=8)).strftime(TIMESTAMP_FORMAT)
+
+        reading = (tag.area, tag.name, (tag.min + tag.max) / 2, tag.unit, 'Normal')
+        result['append'] = _time(lambda: storage.append(*reading), samples)
+
+        queue = WriteBehindQueue(storage)
+        try:
+            result['queued_append'] = _time(lambda: queue.submit(*reading), samples)
+            queue.flush()
+        finally:
+            queue.stop()
+
+        seqs = iter(range(storage.last_seq(), 0, -1))
+        voided = []
+
+        def undo():
+            seq = next(seqs)
+            storage.void(seq)
+            voided.append(seq)
+        result['undo'] = _time(undo, samples)
+        result['redo'] = _time(lambda: storage.restore(voided.pop()), samples)
+
+        result['query_latest'] = _time(
+            lambda: storage.query(tag.area, tag.name, limit=10, newest_first=True), samples)
+        result['query_shift'] = _time(lambda: storage.query(tag.area, start=start, end=end), 20)
+        result['query_shift']['readings'] = len(storage.query(tag.area, start=start, end=end))
+
+        result['export'] = {}
+        for fmt in EXPORT_FORMATS:
+            with tempfile.TemporaryFile() as f:
+                started = time.perf_counter()
+                exported = write_export(storage, f, fmt)
+                elapsed = time.perf_counter() - started
+                result['export'][fmt] = {'seconds': elapsed, 'rows_per_second': exported / elapsed,
+                                         'bytes': f.tell()}
+
+        if rows <= excel_max_rows:
+            started = time.perf_counter()
+            export_excel(storage, os.path.join(directory, f'bench-{rows}.xlsx'))
+            result['excel_export'] = {'seconds': time.perf_counter() - started}
+    finally:
+        storage.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS),
+                        help="sizes of the synthetic logbooks, e.g. 10000 1000000 10000000")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="repetitions of each latency measurement")
+    parser.add_argument('--excel-max-rows', type=int, default=DEFAULT_EXCEL_MAX_ROWS,
+                        help="skip the Excel export for larger logbooks")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--directory', help="where the stores are created; a temporary directory by default")
+    parser.add_argument('--output', help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        report = {
+            'benchmark': 'storage',
+            'backend': args.backend,
+            'started': now_timestamp(),
+            'results': [bench_size(args.backend, rows, directory, args.samples, args.excel_max_rows, args.seed)
+                        for rows in args.rows],
+        }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
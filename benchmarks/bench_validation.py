@@ -0,0 +1,76 @@
+"""Throughput of range checks and import validation on synthetic readings.
+
+Measures ``check_value_range`` one reading at a time, as the app checks a
+dictated value, against the registry's vectorized ``check`` over the same
+readings, and the importer's ``validate`` over a synthetic chunk. Prints a
+JSON report.
+
+    python benchmarks/bench_validation.py [--rows N] [--seconds N] [--output PATH]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from benchmarks.synthetic import synthetic_frame  # noqa: E402
+from logbook.importer import validate  # noqa: E402
+from logbook.parameters import check_value_range, get_registry  # noqa: E402
+
+DEFAULT_ROWS = 100000
+
+
+def _throughput(function, items, seconds):
+    """Items processed per second by repeated ``function()`` calls that each handle ``items``"""
+    done = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        function()
+        done += items
+        elapsed = time.perf_counter() - started
+    return done / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help="synthetic readings per run")
+    parser.add_argument('--seconds', type=float, default=1.0, help="time spent on each throughput run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    registry = get_registry()
+    frame = synthetic_frame(args.rows, registry, seed=args.seed)
+    tag_ids = [registry.tag_id(area, parameter) for area, parameter in zip(frame['Area'], frame['Parameter'])]
+    values = frame['Value'].tolist()
+    minimum, maximum = registry.minimum.tolist(), registry.maximum.tolist()
+
+    def scalar():
+        for tag_id, value in zip(tag_ids, values):
+            check_value_range(value, minimum[tag_id], maximum[tag_id])
+
+    # The importer sees text, as read from a CSV file
+    raw = frame.astype(str)
+    report = {
+        'benchmark': 'validation',
+        'rows': args.rows,
+        'tags': len(registry),
+        'check_value_range': {'checks_per_second': _throughput(scalar, args.rows, args.seconds)},
+        'registry_check': {'checks_per_second': _throughput(lambda: registry.check(tag_ids, values),
+                                                            args.rows, args.seconds)},
+        'import_validate': {'rows_per_second': _throughput(lambda: validate(raw, registry),
+                                                           args.rows, args.seconds)},
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
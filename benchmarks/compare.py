@@ -0,0 +1,80 @@
+"""Compare two benchmark reports and flag regressions.
+
+Every number both reports have at the same place is compared: rates
+(``*_per_second``) regress when they drop, durations (``*_ms``,
+``seconds``) when they grow, both by more than ``--threshold``. Exits with
+status 1 when anything regressed, so a CI job can run a benchmark, compare
+it against a stored baseline and fail.
+
+    python benchmarks/compare.py baseline.json current.json [--threshold 0.2]
+"""
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.2
+
+
+def _flatten(report, prefix=''):
+    """``{dotted.path: number}`` of the numbers in a report; result lists are keyed by their size"""
+    if isinstance(report, dict):
+        items = report.items()
+    elif isinstance(report, list):
+        items = ((item.get('rows', i) if isinstance(item, dict) else i, item) for i, item in enumerate(report))
+    else:
+        if isinstance(report, (int, float)) and not isinstance(report, bool):
+            yield prefix, report
+        return
+    for key, value in items:
+        yield from _flatten(value, f'{prefix}.{key}' if prefix else str(key))
+
+
+def _direction(path):
+    """1 when higher is better, -1 when lower is better, 0 when the number is not a measurement"""
+    name = path.rsplit('.', 1)[-1]
+    if name.endswith('_per_second') or name == 'speech_to_wall_clock':
+        return 1
+    if name.endswith('_ms') or name == 'seconds':
+        return -1
+    return 0
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """``(path, baseline, current, change)`` for every measurement, and the regressed ones"""
+    before = dict(_flatten(baseline))
+    rows, regressions = [], []
+    for path, value in _flatten(current):
+        direction = _direction(path)
+        if not direction or path not in before or not before[path]:
+            continue
+        change = (value - before[path]) / before[path]
+        rows.append((path, before[path], value, change))
+        if -direction * change > threshold:
+            regressions.append(rows[-1])
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative change that counts as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.threshold)
+    regressed = {row[0] for row in regressions}
+    for path, before, after, change in rows:
+        flag = '  REGRESSION' if path in regressed else ''
+        print(f"{path:60} {before:14.4g} {after:14.4g} {change:+8.1%}{flag}")
+    if regressions:
+        print(f"\n{len(regressions)} of {len(rows)} measurements regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
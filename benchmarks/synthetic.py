@@ -0,0 +1,86 @@
+"""Synthetic refinery logbooks for the benchmarks.
+
+Readings cycle through every tag of the parameter registry at a fixed
+interval, with values spread around the middle of each tag's range and a
+small share outside it. The same seed always gives the same logbook.
+
+    python benchmarks/synthetic.py --rows 1000000 --output synthetic.csv
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from logbook.parameters import STATUSES, get_registry  # noqa: E402
+from logbook.storage import COLUMNS, TIMESTAMP_FORMAT  # noqa: E402
+
+DEFAULT_START = '2024-01-01 00:00:00'
+DEFAULT_INTERVAL = 60
+DEFAULT_OUT_OF_RANGE = 0.02
+
+
+def synthetic_frame(rows, registry=None, seed=0, start=DEFAULT_START, interval=DEFAULT_INTERVAL,
+                    out_of_range=DEFAULT_OUT_OF_RANGE):
+    """DataFrame of ``rows`` readings in ``COLUMNS``, oldest first.
+
+    Every ``interval`` seconds one reading of each tag is taken, so a
+    timestamp is shared by as many readings as the registry has tags.
+    """
+    import numpy as np
+    import pandas as pd
+
+    registry = registry or get_registry()
+    rng = np.random.default_rng(seed)
+    tag_ids = np.arange(rows) % len(registry)
+    low, high = registry.minimum[tag_ids], registry.maximum[tag_ids]
+    span = np.maximum(high - low, 1e-9)
+    values = low + span * rng.uniform(0.05, 0.95, rows)
+    outside = rng.random(rows) < out_of_range
+    values[outside] = np.where(rng.random(outside.sum()) < 0.5, low[outside] - 0.1 * span[outside],
+                               high[outside] + 0.1 * span[outside])
+    values = values.round(2)
+    stamps = pd.Timestamp(start) + pd.to_timedelta(np.arange(rows) // len(registry) * interval, unit='s')
+    areas = np.array(registry.areas, dtype=object)
+    return pd.DataFrame({
+        'Area': areas[registry.area_ids[tag_ids]],
+        'Parameter': np.array(registry.names, dtype=object)[tag_ids],
+        'Value': values,
+        'Unit': np.array(registry.units, dtype=object)[tag_ids],
+        'Timestamp': stamps.strftime(TIMESTAMP_FORMAT),
+        'Status': np.array(STATUSES, dtype=object)[registry.check(tag_ids, values)],
+    }, columns=COLUMNS)
+
+
+def synthetic_chunks(rows, chunk_size=1000000, seed=0, **options):
+    """Yield ``synthetic_frame`` in chunks that continue each other's timestamps"""
+    import pandas as pd
+
+    registry = options.pop('registry', None) or get_registry()
+    interval = options.get('interval', DEFAULT_INTERVAL)
+    start = pd.Timestamp(options.pop('start', DEFAULT_START))
+    # Chunks hold whole sweeps over the tags so no tag gets the same timestamp twice
+    chunk_size = max(len(registry), chunk_size - chunk_size % len(registry))
+    for offset in range(0, rows, chunk_size):
+        chunk_start = start + pd.Timedelta(seconds=offset // len(registry) * interval)
+        yield synthetic_frame(min(chunk_size, rows - offset), registry, seed + offset,
+                              chunk_start.strftime(TIMESTAMP_FORMAT), **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default=DEFAULT_START)
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL, help="seconds between sweeps over the tags")
+    parser.add_argument('--output', required=True, help="CSV file to write")
+    args = parser.parse_args(argv)
+
+    header = True
+    for chunk in synthetic_chunks(args.rows, seed=args.seed, start=args.start, interval=args.interval):
+        chunk.to_csv(args.output, mode='w' if header else 'a', header=header, index=False)
+        header = False
+
+
+if __name__ == '__main__':
+    main()
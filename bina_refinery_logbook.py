@@ -1,471 +1,50 @@
+import time
+_run_started = time.perf_counter()
+
 import warnings
 warnings.filterwarnings('ignore', category=RuntimeWarning)
 warnings.filterwarnings('ignore', category=UserWarning)
 
 import streamlit as st
-import pandas as pd
-import speech_recognition as sr
-from datetime import datetime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import os
 
-# Enhanced CSS styling
-st.markdown("""
-<style>
-/* Import Google Fonts */
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-
-/* Root variables for consistent theming */
-:root {
-    --primary-color: #60a5fa; /* Light blue */
-    --secondary-color: #facc15; /* Yellow */
-    --success-color: #34d399; /* Green */
-    --danger-color: #f87171; /* Red */
-    --warning-color: #facc15; /* Yellow */
-    --info-color: #60a5fa; /* Light blue */
-    --background-primary: #1f2937; /* Dark grey */
-    --background-secondary: #111827; /* Even darker grey */
-    --background-accent: #374151; /* Medium grey */
-    --text-primary: #f3f4f6; /* Light grey */
-    --text-secondary: #d1d5db; /* Lighter grey */
-    --border-color: #4b5563; /* Grey border */
-    --shadow-sm: 0 1px 2px 0 rgb(0 0 0 / 0.2);
-    --shadow-md: 0 4px 6px -1px rgb(0 0 0 / 0.2), 0 2px 4px -2px rgb(0 0 0 / 0.2);
-    --shadow-lg: 0 10px 15px -3px rgb(0 0 0 / 0.3), 0 4px 6px -4px rgb(0 0 0 / 0.3);
-    --border-radius: 0.75rem;
-}
-
-/* General styling */
-.stApp {
-    font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-    background: linear-gradient(135deg, var(--background-secondary) 0%, var(--background-primary) 100%); /* Dark gradient background */
-    min-height: 100vh;
-    color: var(--text-primary); /* Default text color */
-}
-
-.main .block-container {
-    padding: 1.5rem;
-    max-width: 1200px;
-}
-
-/* Header styling */
-.main-header {
-    background: linear-gradient(135deg, var(--background-accent) 0%, var(--background-primary) 100%); /* Dark grey gradient */
-    color: var(--text-primary);
-    padding: 2rem;
-    border-radius: var(--border-radius);
-    margin-bottom: 2rem;
-    box-shadow: var(--shadow-lg);
-    text-align: center;
-    position: relative;
-    overflow: hidden;
-    border: 1px solid var(--border-color);
-}
-
-.main-header::before {
-    content: '';
-    position: absolute;
-    top: 0;
-    left: 0;
-    right: 0;
-    bottom: 0;
-    background: url('data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><circle cx="50" cy="50" r="2" fill="#4b5563" opacity="0.1"/></svg>') repeat;
-    background-size: 20px 20px;
-}
-
-.main-header h1 {
-    font-size: 2.5rem;
-    font-weight: 700;
-    margin-bottom: 0.5rem;
-    z-index: 1;
-    position: relative;
-    color: var(--text-primary); /* Header text color */
-}
-
-.main-header p {
-    font-size: 1.1rem;
-    opacity: 0.9;
-    z-index: 1;
-    position: relative;
-    color: var(--text-secondary); /* Header text color */
-}
-
-/* Progress container styling */
-.progress-container {
-    background: var(--background-primary);
-    padding: 1.5rem;
-    border-radius: var(--border-radius);
-    margin-bottom: 2rem;
-    box-shadow: var(--shadow-md);
-    border: 1px solid var(--border-color);
-}
-
-.step-indicator {
-    display: flex;
-    justify-content: space-between;
-    align-items: center;
-    margin-bottom: 1rem;
-}
-
-.step-item {
-    display: flex;
-    align-items: center;
-    gap: 0.5rem;
-    font-weight: 500;
-    color: var(--text-secondary);
-}
-
-.step-item.active {
-    color: var(--primary-color);
-}
-
-.step-item.completed .step-number {
-    background: var(--success-color);
-    color: white;
-    border-color: var(--success-color);
-}
-
-.step-number {
-    width: 2rem;
-    height: 2rem;
-    border-radius: 50%;
-    background: var(--background-accent);
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    font-size: 0.875rem;
-    font-weight: 600;
-    border: 2px solid var(--border-color);
-    color: var(--text-primary);
-}
-
-.step-item.active .step-number {
-    background: var(--primary-color);
-    color: white;
-    border-color: var(--primary-color);
-}
-
-
-/* Card styling */
-.card {
-    background: var(--background-primary);
-    border-radius: var(--border-radius);
-    padding: 1.5rem;
-    box-shadow: var(--shadow-md);
-    border: 1px solid var(--border-color);
-    margin-bottom: 1.5rem;
-    transition: all 0.3s ease;
-}
-
-.card:hover {
-    transform: translateY(-2px);
-    box-shadow: var(--shadow-lg);
-}
-
-.area-card {
-    cursor: pointer;
-    border: 2px solid transparent;
-    transition: all 0.3s ease;
-    background: var(--background-secondary);
-    color: var(--text-secondary);
-}
-
-.area-card:hover {
-    border-color: var(--primary-color);
-    background: var(--background-accent);
-    color: var(--text-primary);
-}
-
-.area-card.selected {
-    border-color: var(--primary-color);
-    background: var(--background-accent);
-    color: var(--text-primary);
-}
-
-.area-icon {
-    width: 3rem;
-    height: 3rem;
-    border-radius: 50%;
-    background: linear-gradient(135deg, var(--primary-color), var(--info-color));
-    color: white;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    font-size: 1.5rem;
-    margin-bottom: 1rem;
-}
-
-.parameter-card {
-    background: var(--background-secondary);
-    border-radius: var(--border-radius);
-    padding: 1.5rem;
-    border: 1px solid var(--border-color);
-    margin-bottom: 1rem;
-    transition: all 0.3s ease;
-    position: relative;
-    color: var(--text-primary);
-}
-
-.parameter-card:hover {
-    transform: translateY(-1px);
-    box-shadow: var(--shadow-md);
-    background: var(--background-accent);
-}
-
-.parameter-header {
-    display: flex;
-    justify-content: space-between;
-    align-items: flex-start;
-    margin-bottom: 1rem;
-}
-
-.parameter-title {
-    font-size: 1.1rem;
-    font-weight: 600;
-    color: var(--text-primary);
-    margin: 0;
-}
-
-.range-badge {
-    background: linear-gradient(135deg, var(--secondary-color), #b45309); /* Darker yellow */
-    color: white;
-    padding: 0.25rem 0.75rem;
-    border-radius: 9999px;
-    font-size: 0.75rem;
-    font-weight: 500;
-}
-
-.voice-button {
-    width: 100%;
-    background: linear-gradient(135deg, var(--success-color), #059669); /* Green gradient for action */
-    color: white;
-    border: none;
-    border-radius: var(--border-radius);
-    padding: 0.75rem 1rem;
-    font-weight: 600;
-    cursor: pointer;
-    transition: all 0.3s ease;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    gap: 0.5rem;
-    box-shadow: var(--shadow-sm);
-}
-
-.voice-button:hover {
-    transform: translateY(-1px);
-    box-shadow: var(--shadow-md);
-    background: linear-gradient(135deg, #059669, #047857); /* Darker green */
-}
-
-.voice-button:active {
-    transform: translateY(0);
-}
-
-/* Status indicators */
-.status-normal {
-    color: var(--success-color);
-    background: #065f46; /* Dark green */
-    border: 1px solid #34d399;
-    padding: 0.25rem 0.75rem;
-    border-radius: var(--border-radius);
-    font-size: 0.875rem;
-}
-
-.status-warning {
-    color: var(--warning-color);
-    background: #78350f; /* Dark yellow/orange */
-    border: 1px solid #facc15;
-    padding: 0.25rem 0.75rem;
-    border-radius: var(--border-radius);
-    font-size: 0.875rem;
-}
-
-.status-danger {
-    color: var(--danger-color);
-    background: #991b1b; /* Dark red */
-    border: 1px solid #f87171;
-    padding: 0.25rem 0.75rem;
-    border-radius: var(--border-radius);
-    font-size: 0.875rem;
-}
-
-/* Button styling */
-.btn-primary {
-    background: linear-gradient(135deg, var(--primary-color), var(--info-color));
-    color: white;
-    border: none;
-    border-radius: var(--border-radius);
-    padding: 0.75rem 1.5rem;
-    font-weight: 600;
-    cursor: pointer;
-    transition: all 0.3s ease;
-    box-shadow: var(--shadow-sm);
-}
-
-.btn-primary:hover {
-    transform: translateY(-1px);
-    box-shadow: var(--shadow-md);
-}
-
-.btn-secondary {
-    background: var(--background-primary);
-    color: var(--text-primary);
-    border: 1px solid var(--border-color);
-    border-radius: var(--border-radius);
-    padding: 0.75rem 1.5rem;
-    font-weight: 500;
-    cursor: pointer;
-    transition: all 0.3s ease;
-    box-shadow: var(--shadow-sm);
-}
-
-.btn-secondary:hover {
-    background: var(--background-accent);
-    transform: translateY(-1px);
-    box-shadow: var(--shadow-md);
-}
-
-/* Streamlit component overrides */
-.stButton > button {
-    width: 100%;
-    background: linear-gradient(135deg, var(--primary-color), var(--info-color)) !important; /* Blue gradient */
-    color: white !important;
-    border: none !important;
-    border-radius: var(--border-radius) !important;
-    padding: 0.75rem 1.5rem !important;
-    font-weight: 600 !important;
-    transition: all 0.3s ease !important;
-    box-shadow: var(--shadow-sm) !important;
+# speech_recognition and PyAudio are imported on first voice use, not here
+from logbook import metrics, timing
+from logbook.alarms import get_alarm_engine
+from logbook.archive import get_rotator
+from logbook.cache import get_log_cache
+from logbook.clips import get_clip_store
+from logbook.export import EXPORT_FORMATS, date_bounds, export_to_tempfile
+from logbook.ingest import start_ingest
+from logbook.mirror import get_excel_mirror
+from logbook.outbox import get_outbox, get_recording_retrier
+from logbook.parameters import get_registry, registry_error
+from logbook.profiling import RunProfiler, available_profilers
+from logbook.query import LogQuery
+from logbook.replicas import get_notifier
+from logbook.sessions import get_session_resources, get_wakeups, rerun_session
+from logbook.shifts import shift_at
+from logbook.speech import ENGINES, OFFLINE_ENGINES, default_engine, preload
+from logbook.storage import DEFAULT_EXCEL_PATH, get_storage, import_legacy_workbook, now_timestamp
+from logbook.theme import load_css
+from logbook.undo import UndoHistory, describe
+from logbook.writer import DEFERRED, PENDING, get_write_queue
+
+# Sites with many areas or tags get a dropdown and paged parameter cards
+MAX_AREA_RADIO = 8
+PARAMETERS_PER_PAGE = 24
+
+# Voice entries listed under the parameter cards, newest first
+MAX_VOICE_OUTCOMES = 10
+STAGE_MESSAGES = {
+    'calibrating': "🎤 Adjusting for ambient noise... Please wait.",
+    'listening': "🎤 Listening... Please speak now.",
+    'waiting': "⏳ Waiting for earlier readings to be recognized...",
 }
 
-.stButton > button:hover {
-    transform: translateY(-1px) !important;
-    box-shadow: var(--shadow-md) !important;
-}
-
-.stRadio > div {
-    gap: 1rem;
-}
-
-.stAlert {
-    border-radius: var(--border-radius) !important;
-    border: none !important;
-    box-shadow: var(--shadow-sm) !important;
-    color: var(--text-primary) !important;
-}
-
-.stAlert.info {
-    background: #1e3a8a !important; /* Darker blue */
-    color: #bfdbfe !important; /* Light blue text */
-}
-
-.stAlert.success {
-    background: #065f46 !important; /* Dark green */
-    color: #a7f3d0 !important; /* Light green text */
-}
-
-.stAlert.error {
-    background: #991b1b !important; /* Dark red */
-    color: #fecaida !important; /* Light red text */
-}
-
-/* Data display */
-.metric-card {
-    background: var(--background-secondary);
-    border-radius: var(--border-radius);
-    padding: 1.5rem;
-    text-align: center;
-    box-shadow: var(--shadow-md);
-    border: 1px solid var(--border-color);
-    color: var(--text-primary);
-}
-
-.metric-value {
-    font-size: 2rem;
-    font-weight: 700;
-    color: var(--primary-color);
-    margin-bottom: 0.5rem;
-}
-
-.metric-label {
-    color: var(--text-secondary);
-    font-size: 0.875rem;
-    font-weight: 500;
-}
-
-/* Responsive design */
-@media (max-width: 768px) {
-    .main-header h1 {
-        font-size: 2rem;
-    }
-    
-    .step-indicator {
-        flex-direction: column;
-        gap: 1rem;
-    }
-    
-    .main .block-container {
-        padding: 1rem;
-    }
-    
-    .card,
-    .progress-container {
-        padding: 1rem;
-    }
-    
-    .parameter-header {
-        flex-direction: column;
-        gap: 0.5rem;
-    }
-    
-    .parameter-title {
-        font-size: 1rem;
-    }
-    
-    .range-badge {
-        font-size: 0.7rem;
-    }
-    
-    .voice-button {
-        font-size: 0.9rem;
-        padding: 0.6rem 0.8rem;
-    }
-    
-    .btn-primary,
-    .btn-secondary {
-        font-size: 0.9rem;
-        padding: 0.6rem 1rem;
-    }
-}
-
-/* Loading spinner */
-.loading-spinner {
-    display: inline-block;
-    width: 1rem;
-    height: 1rem;
-    border: 2px solid #f3f3f3;
-    border-top: 2px solid var(--primary-color);
-    border-radius: 50%;
-    animation: spin 1s linear infinite;
-}
-
-@keyframes spin {
-    0% { transform: rotate(0deg); }
-    100% { transform: rotate(360deg); }
-}
-
-/* Sidebar styling */
-.css-1d391kg {
-    background: linear-gradient(135deg, var(--background-primary) 0%, var(--background-accent) 100%);
-    color: var(--text-primary);
-}
-
-/* Hide Streamlit branding */
-#MainMenu {visibility: hidden;}
-footer {visibility: hidden;}
-header {visibility: hidden;}
-</style>
-""", unsafe_allow_html=True)
+# Enhanced CSS styling
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Initialize session state
 if 'readings' not in st.session_state:
@@ -478,83 +57,154 @@ if 'error' not in st.session_state:
     st.session_state.error = None
 if 'current_step' not in st.session_state:
     st.session_state.current_step = 1
-
-# Define fixed areas and their parameters with ranges
-AREA_PARAMETERS = {
-    "Area 1 - Crude Processing": {
-        "Top Temperature": {"min": 100, "max": 150, "unit": "°C"},
-        "Bottom Temperature": {"min": 200, "max": 250, "unit": "°C"},
-        "Feed Rate": {"min": 1000, "max": 2000, "unit": "BPD"},
-        "Pressure": {"min": 1, "max": 3, "unit": "bar"}
-    },
-    "Area 2 - Vacuum Processing": {
-        "Vacuum Pressure": {"min": 0.1, "max": 0.5, "unit": "bar"},
-        "Feed Temperature": {"min": 150, "max": 200, "unit": "°C"},
-        "Bottom Temperature": {"min": 250, "max": 300, "unit": "°C"},
-        "Steam Rate": {"min": 500, "max": 1000, "unit": "kg/hr"}
-    },
-    "Area 3 - Power Generation": {
-        "Steam Pressure": {"min": 40, "max": 60, "unit": "bar"},
-        "Steam Temperature": {"min": 400, "max": 450, "unit": "°C"},
-        "Power Generation": {"min": 50, "max": 100, "unit": "MW"},
-        "Boiler Efficiency": {"min": 80, "max": 95, "unit": "%"}
-    },
-    "Area 4 - Water Treatment": {
-        "pH Level": {"min": 6.5, "max": 8.5, "unit": "pH"},
-        "COD": {"min": 0, "max": 100, "unit": "mg/L"},
-        "Oil Content": {"min": 0, "max": 10, "unit": "mg/L"},
-        "Flow Rate": {"min": 100, "max": 500, "unit": "m³/hr"}
-    }
-}
-
-def initialize_excel():
-    """Initialize the Excel file if it doesn't exist"""
-    if not os.path.exists('bina_refinery_log.xlsx'):
-        df = pd.DataFrame(columns=['Area', 'Parameter', 'Value', 'Unit', 'Timestamp', 'Status'])
-        df.to_excel('bina_refinery_log.xlsx', index=False)
-
-def append_to_excel(area, parameter, value, unit, status):
-    """Append a new reading to the Excel file only if value is within range"""
-    if status == "Normal":
-        df = pd.read_excel('bina_refinery_log.xlsx')
-        new_row = {
-            'Area': area,
-            'Parameter': parameter,
-            'Value': value,
-            'Unit': unit,
-            'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'Status': status
-        }
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-        df.to_excel('bina_refinery_log.xlsx', index=False)
-        return True
-    return False
-
-def get_voice_input():
-    """Capture voice input using speech_recognition with enhanced error handling"""
-    recognizer = sr.Recognizer()
-    
-    # Adjust for ambient noise
-    try:
-        with sr.Microphone() as source:
-            st.info("🎤 Adjusting for ambient noise... Please wait.")
-            recognizer.adjust_for_ambient_noise(source, duration=2)
-            st.info("🎤 Listening... Please speak now.")
-            
-            # Set timeout and phrase time limit
-            audio = recognizer.listen(source, timeout=5, phrase_time_limit=5)
-            
-            try:
-                text = recognizer.recognize_google(audio)
-                return text
-            except sr.UnknownValueError:
-                st.error("❌ Could not understand audio. Please speak clearly and try again.")
-                return None
-            except sr.RequestError as e:
-                st.error(f"❌ Could not request results from speech recognition service; {e}")
-                return None
-    except Exception as e:
-        st.error(f"❌ Error accessing microphone: {str(e)}")
+if 'pending_writes' not in st.session_state:
+    st.session_state.pending_writes = []
+if 'speech_engine' not in st.session_state:
+    st.session_state.speech_engine = default_engine()
+if 'speech_fallback' not in st.session_state:
+    st.session_state.speech_fallback = None
+if 'speech_grammar' not in st.session_state:
+    st.session_state.speech_grammar = True
+if 'operator' not in st.session_state:
+    st.session_state.operator = ''
+if 'undo_histories' not in st.session_state:
+    st.session_state.undo_histories = {}
+if 'undo_message' not in st.session_state:
+    st.session_state.undo_message = None
+if 'voice_outcomes' not in st.session_state:
+    st.session_state.voice_outcomes = []
+if 'profile_report' not in st.session_state:
+    st.session_state.profile_report = None
+if 'follow_log' not in st.session_state:
+    st.session_state.follow_log = True
+
+# Profile this run when the session asked for it in the sidebar. A run cut short by
+# st.rerun() leaves its profiler behind; it is dropped without a report.
+if st.session_state.get('run_profiler') is not None and st.session_state.run_profiler.running:
+    st.session_state.run_profiler.stop()
+st.session_state.run_profiler = None
+if st.session_state.get('profile_session'):
+    st.session_state.run_profiler = RunProfiler(st.session_state.get('profiler_engine', 'cprofile'))
+    st.session_state.run_profiler.start()
+
+
+@st.cache_resource
+def initialize_storage():
+    """Open the logbook store and its background writers once per process"""
+    storage = get_storage()
+    if storage.count() == 0 and os.path.exists(DEFAULT_EXCEL_PATH):
+        import_legacy_workbook(storage, DEFAULT_EXCEL_PATH, only_if_empty=True)
+    # Start the mirror first: exit handlers run in reverse, so the queue's final
+    # flush happens before the mirror's final export
+    get_excel_mirror()
+    queue = get_write_queue()
+    queue.add_flush_listener(get_alarm_engine().on_flush)
+    # After the alarm engine, so freshly evaluated readings of a closed period can move
+    queue.add_flush_listener(get_rotator().on_flush)
+    # Readings logged by any session, replica, import or device change the workbook
+    get_notifier().subscribe(lambda notification: refresh_workbook(), 'readings', 'corrections')
+    get_rotator().request()
+    get_recording_retrier()
+    metrics.start_exporter()
+    start_ingest()
+    return storage
+
+def refresh_workbook():
+    """Ask the background exporter to bring the Excel workbook up to date"""
+    mirror = get_excel_mirror()
+    if mirror is not None:
+        mirror.request()
+
+def append_reading(area, parameter, value, unit, status):
+    """Queue a new reading for the log together with its range status"""
+    timestamp = now_timestamp()
+    ticket = get_write_queue().submit(area, parameter, value, unit, status, timestamp)
+    st.session_state.pending_writes.append(ticket)
+    get_undo_history().record([ticket], [(area, parameter, value, unit, timestamp, status)])
+    return True
+
+def show_write_status():
+    """Report readings of this session that are still waiting to be written"""
+    queue = get_write_queue()
+    statuses = {t: queue.status(t) for t in st.session_state.pending_writes}
+    pending = [t for t, status in statuses.items() if status == PENDING]
+    deferred = [t for t, status in statuses.items() if status == DEFERRED]
+    saved = len(statuses) - len(pending) - len(deferred)
+    for history in st.session_state.undo_histories.values():
+        history.resolve(queue)
+    queue.forget([t for t in st.session_state.pending_writes if t not in pending])
+    st.session_state.pending_writes = pending
+    if deferred:
+        st.warning(f"📮 {len(deferred)} reading(s) kept on this machine; they will be saved, in order, "
+                   "once the log store can be written again")
+    if queue.last_error is not None:
+        st.error(f"❌ Could not save readings yet, retrying: {queue.last_error}")
+    elif pending:
+        st.info(f"⏳ {len(pending)} reading(s) waiting to be saved")
+    elif saved:
+        st.caption(f"💾 {saved} reading(s) saved")
+
+def get_audio_session():
+    """Return this session's microphone, kept open and calibrated across readings.
+
+    It is closed once the session ends, and reopens if the browser reconnects to the session.
+    """
+    if 'audio_session' not in st.session_state:
+        from logbook.audio import AudioSession
+        st.session_state.audio_session = AudioSession()
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        # Registered on every use: a reconnected session's microphone must be closed again when it ends
+        get_session_resources().register(ctx.session_id, 'audio_session', st.session_state.audio_session)
+    return st.session_state.audio_session
+
+def get_voice_pipeline():
+    """Return this session's voice pipeline, following the engines picked in the sidebar.
+
+    Its threads stop once the session ends; a reconnected session gets a new one.
+    """
+    ctx = get_script_run_ctx()
+    audio_session = get_audio_session()
+    pipeline = st.session_state.get('voice_pipeline')
+    if pipeline is None or pipeline.closed:
+        from logbook.pipeline import VoicePipeline
+        pipeline = VoicePipeline(audio_session, outbox=get_outbox(), clips=get_clip_store())
+        if ctx is not None:
+            # Show each outcome and stage as it happens rather than polling for them
+            session_id = ctx.session_id
+            pipeline.add_listener(lambda: rerun_session(session_id))
+            get_session_resources().register(session_id, 'voice_pipeline', pipeline)
+        st.session_state.voice_pipeline = pipeline
+    pipeline.engine = st.session_state.speech_engine
+    pipeline.fallback = st.session_state.speech_fallback
+    pipeline.grammar = st.session_state.speech_grammar
+    return pipeline
+
+def request_voice_input(area, parameter=None):
+    """Queue one utterance for the voice pipeline; the result shows up on a later run"""
+    if not get_voice_pipeline().request(area, parameter):
+        st.warning("⏳ The microphone already has readings queued; wait for them to be heard first.")
+
+def collect_voice_outcomes():
+    """Take the pipeline's finished utterances into this session's writes, undo history and feed"""
+    pipeline = st.session_state.get('voice_pipeline')
+    if pipeline is None:
+        return
+    for outcome in pipeline.collect():
+        if outcome.tickets:
+            st.session_state.pending_writes.extend(outcome.tickets)
+            get_undo_history().record(outcome.tickets, outcome.rows)
+        # The round has stopped; switch it off rather than reopening a broken microphone
+        if outcome.error_kind == 'microphone':
+            st.session_state.round_mode = False
+        st.session_state.voice_outcomes.insert(0, outcome)
+    del st.session_state.voice_outcomes[MAX_VOICE_OUTCOMES:]
+
+def show_voice_outcome(outcome):
+    """Report what one utterance was heard as and which readings it logged"""
+    target = outcome.parameter or outcome.area
+    if outcome.error_kind == 'microphone':
+        st.error(f"❌ Error accessing microphone: {outcome.error}")
         st.info("💡 Troubleshooting tips:")
         st.markdown("""
         1. Make sure your microphone is properly connected
@@ -562,43 +212,128 @@ def get_voice_input():
         3. Try refreshing the page
         4. Make sure you've granted microphone permissions to the browser
         """)
-        return None
-
-def extract_numeric_value(text):
-    """Extract numeric value from text"""
-    import re
-    numbers = re.findall(r"[-+]?\d*\.\d+|\d+", text)
-    if numbers:
-        return float(numbers[0])
-    return None
-
-def check_value_range(value, min_val, max_val):
-    """Check if value is within range and return status"""
-    if value < min_val:
-        return "Below Range"
-    elif value > max_val:
-        return "Above Range"
-    return "Normal"
-
-def remove_last_entry_from_excel():
-    """Removes the last entry from the Excel file"""
-    try:
-        if os.path.exists('bina_refinery_log.xlsx'):
-            df = pd.read_excel('bina_refinery_log.xlsx')
-            if not df.empty:
-                df = df[:-1] # Drop the last row
-                df.to_excel('bina_refinery_log.xlsx', index=False)
-                return True
-            else:
-                return False # File is empty
+        return
+    if outcome.error_kind == 'unknown':
+        st.error(f"❌ {target}: Could not understand audio. Please speak clearly and try again.")
+        return
+    if outcome.error_kind == 'request':
+        st.error(f"❌ Could not request results from speech recognition service; {outcome.error}")
+        return
+    if outcome.error_kind == 'deferred':
+        st.warning(f"📮 {target}: no speech recognizer is reachable ({outcome.error}). "
+                   "The recording is kept and will be logged once one is back.")
+        return
+    if outcome.error:
+        st.error(f"❌ {target}: {outcome.error}")
+        return
+    result = outcome.result
+    confidence = f", confidence {result.confidence:.0%}" if result.confidence is not None else ""
+    st.write(f"🎯 Voice Input: {result.text}")
+    st.caption(f"{result.engine}: {result.latency_ms:.0f} ms{confidence}; "
+               f"logged {outcome.timings['total']:.0f} ms after you stopped speaking")
+    for note in outcome.notes:
+        st.warning(f"⚠️ {note}")
+    for area, param, value, unit, _, status in outcome.rows:
+        if status == "Normal":
+            st.success(f"✅ Successfully logged: {param} = {value} {unit}")
         else:
-            return False # File does not exist
+            tag = get_registry().tag(get_registry().tag_id(area, param))
+            st.error(f"⚠️ ALERT: {param} value {value} {unit} is {status}! Must be between {tag.min:g} and {tag.max:g} {unit}")
+            st.caption(f"📝 Logged {param} with status {status}")
+    for param in outcome.missing:
+        st.warning(f"❓ Heard {param} but no value for it")
+    if not (outcome.rows or outcome.missing):
+        if outcome.parameter:
+            st.error("❌ Could not extract a numeric value from the voice input")
+            st.info("💡 Try speaking the number clearly, for example: 'one hundred twenty three point five'")
+        else:
+            st.error("❌ Could not match any parameter names in the voice input")
+            st.info("💡 Say each parameter name followed by its value, for example: 'top temperature 120, feed rate 1500'")
+
+def get_undo_history():
+    """Undo history of the operator on duty in this session"""
+    operator = st.session_state.operator.strip() or None
+    histories = st.session_state.undo_histories
+    if operator not in histories:
+        ctx = get_script_run_ctx()
+        histories[operator] = UndoHistory(operator, ctx.session_id if ctx else None)
+    return histories[operator]
+
+def undo_last_entry():
+    """Button callback: void this operator's most recent reading"""
+    try:
+        entry = get_undo_history().undo(get_storage(), get_write_queue())
     except Exception as e:
-        st.error(f"An error occurred while removing the last entry: {e}")
-        return False
+        st.session_state.undo_message = ("error", f"An error occurred while undoing the last entry: {e}")
+        return
+    if entry:
+        refresh_workbook()
+        st.session_state.undo_message = ("success", f"↩️ Undid {describe(entry)}")
+    else:
+        st.session_state.undo_message = ("warning", "Nothing was undone; the entry is still being saved or was already removed.")
 
-# Initialize the Excel file
-initialize_excel()
+def redo_last_entry():
+    """Button callback: restore the most recently undone reading"""
+    try:
+        entry = get_undo_history().redo(get_storage())
+    except Exception as e:
+        st.session_state.undo_message = ("error", f"An error occurred while redoing the entry: {e}")
+        return
+    if entry:
+        refresh_workbook()
+        st.session_state.undo_message = ("success", f"↪️ Restored {describe(entry)}")
+    else:
+        st.session_state.undo_message = ("warning", "Nothing was restored; the entry is no longer void.")
+
+# Initialize the log store
+initialize_storage()
+collect_voice_outcomes()
+# Everything published up to here is on this run's page
+seen_notification = get_notifier().cursor
+
+# Speech engine selection
+with st.sidebar:
+    st.text_input("Operator", key="operator", help="Undo and redo only ever touch this operator's own entries")
+    st.toggle("Show new readings as they are logged", key="follow_log",
+              help="Readings logged by other operators, on any replica, appear without clicking anything")
+    st.selectbox("Speech engine", options=list(ENGINES), key="speech_engine",
+                 help="vosk and whisper run locally and keep working without a network")
+    st.selectbox("Fallback when the engine is unavailable", options=[None, *OFFLINE_ENGINES],
+                 format_func=lambda engine: engine or "None", key="speech_fallback")
+    st.checkbox("Only listen for parameter names, numbers and units", key="speech_grammar",
+                help="vosk recognizes nothing else and whisper is told the parameter names; "
+                     "faster and less likely to mishear a reading")
+    if st.button("🎚️ Recalibrate Microphone", key="recalibrate"):
+        try:
+            with st.spinner("🎤 Adjusting for ambient noise..."):
+                get_audio_session().calibrate()
+        except Exception as e:
+            st.error(f"❌ Error accessing microphone: {str(e)}")
+    if st.session_state.speech_engine in OFFLINE_ENGINES:
+        import speech_recognition as sr
+        try:
+            with st.spinner("Loading speech model..."):
+                preload(st.session_state.speech_engine)
+        except sr.RequestError as e:
+            st.error(f"❌ {e}")
+
+# Parameters and limits, reloaded when their file changes
+registry = get_registry()
+if registry_error() is not None:
+    st.sidebar.warning(f"⚠️ Parameter file not reloaded, still using the previous limits: {registry_error()}")
+if get_rotator().last_error is not None:
+    st.sidebar.warning(f"⚠️ Closed periods not archived yet: {get_rotator().last_error}")
+if get_outbox() is not None:
+    waiting = get_outbox().state()
+    if waiting.readings or waiting.recordings:
+        st.sidebar.info(f"📮 Waiting to sync: {waiting.readings} reading(s), {waiting.recordings} recording(s)")
+    if waiting.unrecognized:
+        st.sidebar.warning(f"❓ {waiting.unrecognized} kept recording(s) could not be understood")
+flags = get_storage().clip_flags(limit=50)
+if flags:
+    with st.sidebar.expander(f"🔁 {len(flags)} voice reading(s) heard differently on recheck"):
+        st.dataframe([{'Time': f.timestamp, 'Parameter': f.parameter, 'Logged': f.logged, 'Heard': f.heard}
+                      for f in flags], hide_index=True)
 
 # Streamlit UI
 st.title("Bina Refinery Operations Logbook")
@@ -609,10 +344,23 @@ total_steps = 2
 current_step = st.session_state.current_step
 st.progress(current_step / total_steps)
 
+# An area removed from the parameter file can no longer be logged
+if current_step == 2 and st.session_state.get('selected_area') not in registry.areas:
+    current_step = st.session_state.current_step = 1
+
+# A round only runs while its area's parameters are on screen
+pipeline = st.session_state.get('voice_pipeline')
+if pipeline is not None and pipeline.round_area is not None and (
+        current_step != 2 or pipeline.round_area != st.session_state.get('selected_area')):
+    pipeline.stop_round()
+
 # Step 1: Area Selection
 if current_step == 1:
     st.subheader("Step 1: Select Area")
-    area = st.radio("Choose Area", options=list(AREA_PARAMETERS.keys()))
+    if len(registry.areas) <= MAX_AREA_RADIO:
+        area = st.radio("Choose Area", options=registry.areas)
+    else:
+        area = st.selectbox("Choose Area", options=registry.areas)
     
     if st.button("Next"):
         st.session_state.selected_area = area
@@ -622,38 +370,50 @@ if current_step == 1:
 # Step 2: Parameter Input
 elif current_step == 2:
     st.subheader(f"Step 2: Enter Parameters for {st.session_state.selected_area}")
+
+    # Dictate every parameter of the area in one utterance, or keep listening for a whole round
+    if st.button("🎙️ Dictate Whole Area", key="dictate_area"):
+        request_voice_input(st.session_state.selected_area)
+    if st.toggle("🚶 Round mode: keep listening and log each reading as it is spoken", key="round_mode"):
+        if get_voice_pipeline().round_area is None:
+            get_voice_pipeline().start_round(st.session_state.selected_area)
+    elif pipeline is not None and pipeline.round_area is not None:
+        pipeline.stop_round()
+    pipeline = st.session_state.get('voice_pipeline')
+    if pipeline is not None and pipeline.busy and pipeline.state in STAGE_MESSAGES:
+        st.info(STAGE_MESSAGES[pipeline.state])
+    for outcome in st.session_state.voice_outcomes[:3]:
+        with st.container(border=True):
+            show_voice_outcome(outcome)
     
+    # Large areas are searched and paged instead of rendering every card
+    tags = registry.tags(st.session_state.selected_area)
+    if len(tags) > PARAMETERS_PER_PAGE:
+        search = st.text_input("🔎 Find parameter", key="parameter_search").strip().lower()
+        if search:
+            tags = [tag for tag in tags if search in tag.name.lower()]
+        pages = max(1, -(-len(tags) // PARAMETERS_PER_PAGE))
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key="parameter_page")
+        tags = tags[(page - 1) * PARAMETERS_PER_PAGE:page * PARAMETERS_PER_PAGE]
+
     # Create columns for parameters
     cols = st.columns(2)
     
-    for i, (param, range_info) in enumerate(AREA_PARAMETERS[st.session_state.selected_area].items()):
+    for i, tag in enumerate(tags):
+        param = tag.name
         with cols[i % 2]:
             st.markdown(f"""
             <div class="parameter-card">
                 <h3>{param}</h3>
                 <div class="range-display">
-                    Valid Range: {range_info['min']} - {range_info['max']} {range_info['unit']}
+                    Valid Range: {tag.min:g} - {tag.max:g} {tag.unit}
                 </div>
             </div>
             """, unsafe_allow_html=True)
             
             # Voice input button
             if st.button(f"🎤 Voice Input for {param}", key=f"voice_{param}"):
-                with st.spinner("🎤 Listening..."):
-                    voice_input = get_voice_input()
-                    if voice_input:
-                        st.write(f"🎯 Voice Input: {voice_input}")
-                        value = extract_numeric_value(voice_input)
-                        if value is not None:
-                            status = check_value_range(value, range_info['min'], range_info['max'])
-                            if status == "Normal":
-                                if append_to_excel(st.session_state.selected_area, param, value, range_info['unit'], status):
-                                    st.success(f"✅ Successfully logged: {param} = {value} {range_info['unit']}")
-                            else:
-                                st.error(f"⚠️ ALERT: {param} value {value} {range_info['unit']} is {status}! Must be between {range_info['min']} and {range_info['max']} {range_info['unit']}")
-                        else:
-                            st.error("❌ Could not extract a numeric value from the voice input")
-                            st.info("💡 Try speaking the number clearly, for example: 'one hundred twenty three point five'")
+                request_voice_input(st.session_state.selected_area, param)
     
     # Back button with custom styling
     st.markdown("""
@@ -668,35 +428,124 @@ elif current_step == 2:
         st.session_state.current_step = 1
         st.rerun()
 
-# Display current log with enhanced styling
-# ... removed subheader and log display block ...
+show_write_status()
+
+# Log history, answered from the store's indexes rather than a full load, and cached until the log changes
+with st.expander("📜 Log History"):
+    history_area = st.selectbox("Area", options=["All areas", *registry.areas], key="history_area")
+    area_filter = None if history_area == "All areas" else history_area
+    parameter_options = registry.parameter_names(area_filter)
+    history_parameter = st.selectbox("Parameter", options=["All parameters", *parameter_options], key="history_parameter")
+    parameter_filter = None if history_parameter == "All parameters" else history_parameter
+    history_window = st.radio("Show", options=["Latest readings", "Current shift", "Date range"],
+                              horizontal=True, key="history_window")
+
+    log_query = LogQuery(get_storage(), cache=get_log_cache())
+    if history_window == "Latest readings":
+        history_limit = st.number_input("Number of readings", min_value=1, max_value=1000, value=20, key="history_limit")
+        history = log_query.last(area_filter, parameter_filter, n=int(history_limit))
+    elif history_window == "Current shift":
+        shift = shift_at()
+        st.caption(f"Shift {shift.name}: {shift.start:%Y-%m-%d %H:%M} – {shift.end:%H:%M}")
+        history = log_query.shift(area=area_filter, parameter=parameter_filter)
+    else:
+        history_dates = st.date_input("Dates", value=[], key="history_dates")
+        start, end = date_bounds(history_dates[0], history_dates[-1]) if history_dates else (None, None)
+        history = log_query.window(start, end, area=area_filter, parameter=parameter_filter, limit=10000)
 
-# Export button with enhanced styling
-if st.button("📥 Export Readings as CSV"):
-    try:
-        df_export = pd.read_excel('bina_refinery_log.xlsx')
-        if not df_export.empty:
-            csv = df_export.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="⬇️ Download CSV",
-                data=csv,
-                file_name="readings.csv",
-                mime="text/csv",
-                key="download_csv"
-            )
-        else:
-            st.warning("No readings to export.")
-    except FileNotFoundError:
-        st.warning("No readings to export yet (Excel file not found).")
-    except Exception as e:
-        st.error(f"An error occurred during CSV export: {e}")
-
-# Button to remove last entry
-if st.button("🗑️ Remove Last Entry"):
-    if remove_last_entry_from_excel():
-        st.success("Successfully removed the last log entry.")
-        # Optional: Rerun to reflect change if log was visible
-        # st.rerun()
+    if history:
+        st.dataframe(LogQuery.to_frame(history), use_container_width=True)
     else:
-        st.warning("No entries to remove or file not found.") 
-        st.warning("No entries to remove or file not found.") 
\ No newline at end of file
+        st.info("No readings match.")
+
+# Export readings, streamed from the log store in chunks
+with st.expander("📥 Export Readings"):
+    export_format = st.selectbox("Format", options=list(EXPORT_FORMATS), key="export_format")
+    export_areas = st.multiselect("Areas (all if empty)", options=registry.areas, key="export_areas")
+    export_parameters = st.multiselect(
+        "Parameters (all if empty)",
+        options=registry.parameter_names(),
+        key="export_parameters"
+    )
+    export_dates = st.date_input("Date range (all if empty)", value=[], key="export_dates")
+
+    if st.button("📥 Export Readings"):
+        try:
+            get_write_queue().flush(timeout=10)
+            start, end = date_bounds(export_dates[0], export_dates[-1]) if export_dates else (None, None)
+            export_file, rows = export_to_tempfile(
+                get_storage(), export_format,
+                start=start, end=end, areas=export_areas, parameters=export_parameters
+            )
+            with export_file:
+                if rows:
+                    mime, extension = EXPORT_FORMATS[export_format]
+                    # download_button keeps its own copy of the payload, so this is the only one
+                    st.download_button(
+                        label=f"⬇️ Download {rows} readings",
+                        data=export_file.read(),
+                        file_name=f"readings{extension}",
+                        mime=mime,
+                        key="download_export"
+                    )
+                else:
+                    st.warning("No readings to export.")
+        except Exception as e:
+            st.error(f"An error occurred during export: {e}")
+
+# Undo and redo this session's own entries; nothing is deleted from the log
+history = get_undo_history()
+if st.session_state.undo_message:
+    kind, message = st.session_state.undo_message
+    getattr(st, kind)(message)
+    st.session_state.undo_message = None
+undo_col, redo_col = st.columns(2)
+with undo_col:
+    entry = history.next_undo()
+    st.button("↩️ Undo Last Entry", key="undo", on_click=undo_last_entry, disabled=entry is None)
+    st.caption(f"Will undo: {describe(entry)}" if entry else "No entries of yours to undo.")
+with redo_col:
+    entry = history.next_redo()
+    st.button("↪️ Redo", key="redo", on_click=redo_last_entry, disabled=entry is None)
+    if entry:
+        st.caption(f"Will restore: {describe(entry)}")
+
+# Cold start vs warm rerun timings for this server process
+timing.record_run(time.perf_counter() - _run_started)
+with st.sidebar.expander("⏱️ Timings"):
+    timings = timing.summary()
+    st.caption(f"Cold start: {timings['cold_start_ms']:.0f} ms")
+    if timings['warm_reruns']:
+        st.caption(f"Last rerun: {timings['warm_last_ms']:.0f} ms (median {timings['warm_median_ms']:.0f} ms over {timings['warm_reruns']} reruns)")
+    if st.session_state.get('voice_pipeline') is not None:
+        for stage, stats in st.session_state.voice_pipeline.stats().items():
+            st.caption(f"Voice {stage}: median {stats['median_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms ({stats['count']} utterances)")
+
+with st.sidebar.expander("📊 Latency (p50 / p99)"):
+    latencies = metrics.summary()
+    if not latencies:
+        st.caption("Nothing measured yet.")
+    for (name, labels), stats in latencies.items():
+        label = name.removeprefix('logbook_').removesuffix('_seconds')
+        if labels:
+            label += f" ({', '.join(str(value) for _, value in labels)})"
+        st.caption(f"{label}: {stats['p50_ms']:.1f} / {stats['p99_ms']:.1f} ms over {stats['count']}")
+
+with st.sidebar.expander("🔬 Profiling"):
+    st.toggle("Profile this session's runs", key="profile_session")
+    st.selectbox("Profiler", options=available_profilers(), key="profiler_engine")
+    if st.session_state.run_profiler is not None:
+        st.session_state.profile_report = st.session_state.run_profiler.stop()
+    if st.session_state.profile_report:
+        report, file_name, data = st.session_state.profile_report
+        st.download_button("⬇️ Download last run's profile", data=data, file_name=file_name, key="download_profile")
+        st.code(report, language=None)
+
+# Readings from elsewhere rerun this session when they arrive, so the run can end here
+if st.session_state.follow_log:
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        get_wakeups().wait(ctx.session_id)
+    # Readings that arrived during this run are not on its page yet
+    if get_notifier().cursor > seen_notification:
+        st.rerun()
@@ -0,0 +1,11 @@
+"""Core of the Bina Refinery logbook, shared by the Streamlit app and tools.
+
+Importing the package is cheap: pandas, openpyxl and speech_recognition are
+only imported by the functions that need them.
+"""
+
+from logbook.parameters import AREA_PARAMETERS, check_value_range, get_registry
+from logbook.storage import COLUMNS, LogStorage, SQLiteLogStorage, get_storage
+
+__all__ = ['AREA_PARAMETERS', 'COLUMNS', 'LogStorage', 'SQLiteLogStorage', 'check_value_range', 'get_registry',
+           'get_storage']
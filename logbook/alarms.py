@@ -0,0 +1,226 @@
+"""Alarm rules evaluated over batches of new readings.
+
+Every reading is stored with its range status; this engine adds alarms on
+top of that. Rules work on whole pandas columns rather than row by row, so
+a bulk import of a year of history is evaluated as quickly as a single live
+entry:
+
+* ``RangeRule``: the value is outside the parameter's limits.
+* ``RateOfChangeRule``: the value moved by more than a fraction of the
+  normal range since the previous reading of the same parameter.
+* ``RepeatedExcursionRule``: the parameter left its range several times
+  within a window, e.g. three times in one shift.
+
+The store remembers the last reading evaluated, so each reading is checked
+once even when several processes share the log; readings logged earlier
+but still inside a rule's lookback are loaded as context.
+
+    $ python -m logbook.alarms --evaluate
+"""
+import argparse
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+from logbook.parameters import get_registry
+from logbook.storage import TIMESTAMP_FORMAT, get_storage
+
+Alarm = namedtuple('Alarm', ['id', 'seq', 'rule', 'area', 'parameter', 'value', 'timestamp', 'message'])
+
+DEFAULT_BATCH_SIZE = 50000
+
+_KEY = ['Area', 'Parameter']
+
+
+def _format(series, formatter='{:g}'.format):
+    # astype keeps an empty selection concatenable with strings
+    return series.map(formatter).astype(str)
+
+
+class RangeRule:
+    """Value below the parameter's minimum or above its maximum"""
+
+    name = 'range'
+    lookback = timedelta(0)
+
+    def evaluate(self, frame):
+        below = frame['Value'] < frame['Min']
+        above = frame['Value'] > frame['Max']
+        fired = below | above
+        hit = frame[fired]
+        message = (_format(hit['Value']) + ' ' + hit['LimitUnit'] + ' is '
+                   + below[fired].map({True: 'below', False: 'above'})
+                   + ' the range ' + _format(hit['Min']) + ' - ' + _format(hit['Max']))
+        return fired, message
+
+
+class RateOfChangeRule:
+    """Change since the previous reading larger than ``max_change`` of the range per ``per``.
+
+    Readings closer together than ``per`` are held to the full ``per``
+    allowance, and readings more than ``window`` apart are not compared.
+    """
+
+    name = 'rate_of_change'
+
+    def __init__(self, max_change=0.5, per=timedelta(hours=1), window=timedelta(hours=8)):
+        self.max_change = max_change
+        self.per = per
+        self.lookback = window
+
+    def evaluate(self, frame):
+        grouped = frame.groupby(_KEY, sort=False)
+        change = frame['Value'] - grouped['Value'].shift()
+        elapsed = (frame['Timestamp'] - grouped['Timestamp'].shift()).dt.total_seconds()
+        per = self.per.total_seconds()
+        allowed = (frame['Max'] - frame['Min']) * self.max_change * elapsed.clip(lower=per) / per
+        fired = (change.abs() > allowed) & (elapsed <= self.lookback.total_seconds())
+        hit = frame[fired]
+        message = ('changed by ' + _format(change[fired]) + ' ' + hit['LimitUnit'] + ' in '
+                   + _format(elapsed[fired] / 60, '{:.0f}'.format) + ' min')
+        return fired, message
+
+
+class RepeatedExcursionRule:
+    """``count`` out-of-range readings of one parameter within ``window``.
+
+    Fires once when the count is reached, not again for every further
+    excursion while the parameter stays out of range.
+    """
+
+    name = 'repeated_excursion'
+
+    def __init__(self, count=3, window=timedelta(hours=8)):
+        self.count = count
+        self.window = window
+        # The excursion before a new one must itself be judged against a full window
+        self.lookback = 2 * window
+
+    def evaluate(self, frame):
+        outside = (frame['Value'] < frame['Min']) | (frame['Value'] > frame['Max'])
+        excursions = frame[outside]
+        span = excursions['Timestamp'] - excursions.groupby(_KEY, sort=False)['Timestamp'].shift(self.count - 1)
+        repeated = span < self.window
+        # Only the excursion that first reaches the count raises the alarm
+        previous = repeated.groupby([excursions['Area'], excursions['Parameter']], sort=False).shift(fill_value=False)
+        first = repeated & ~previous.astype(bool)
+        fired = first.reindex(frame.index, fill_value=False)
+        message = f'{self.count} excursions within ' + _format(span[first], _duration)
+        return fired, message
+
+
+def _duration(delta):
+    minutes = int(delta.total_seconds() // 60)
+    return f'{minutes // 60} h {minutes % 60} min' if minutes >= 60 else f'{minutes} min'
+
+
+DEFAULT_RULES = (RangeRule(), RateOfChangeRule(), RepeatedExcursionRule())
+
+
+class AlarmEngine:
+    """Evaluates alarm rules over readings not evaluated yet and stores the alarms"""
+
+    def __init__(self, storage, rules=DEFAULT_RULES, registry=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.storage = storage
+        self.rules = tuple(rules)
+        # None follows the parameter file as it is reloaded
+        self.registry = registry
+        self.batch_size = batch_size
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def lookback(self):
+        return max((rule.lookback for rule in self.rules), default=timedelta(0))
+
+    def evaluate(self, frame, after=0):
+        """Return the alarms raised by readings in ``frame`` with a sequence number above ``after``.
+
+        ``frame`` has a ``seq`` column and ``COLUMNS``; older readings in it
+        only serve as context for the rules.
+        """
+        import pandas as pd
+        frame = frame.rename(columns={'Timestamp': 'Stamp'})
+        frame['Timestamp'] = pd.to_datetime(frame['Stamp'], format=TIMESTAMP_FORMAT)
+        registry = self.registry or get_registry()
+        frame = frame.merge(registry.limits_frame(), on=_KEY, how='left')
+        frame = frame.sort_values(_KEY + ['Timestamp', 'seq'], ignore_index=True)
+        new = frame['seq'] > after
+        alarms = []
+        for rule in self.rules:
+            fired, message = rule.evaluate(frame)
+            fired &= new
+            hit = frame[fired]
+            alarms.append(pd.DataFrame({
+                'seq': hit['seq'],
+                'rule': rule.name,
+                'area': hit['Area'],
+                'parameter': hit['Parameter'],
+                'value': hit['Value'],
+                'timestamp': hit['Stamp'],
+                'message': message.reindex(hit.index),
+            }))
+        return pd.concat(alarms, ignore_index=True).sort_values(['seq', 'rule'], ignore_index=True)
+
+    def process(self):
+        """Evaluate every reading stored since the last run; returns the number of alarms raised"""
+        import pandas as pd
+        raised = 0
+        with self._lock:
+            while True:
+                evaluated = self.storage.alarm_cursor()
+                batch = self.storage.read_frame(after=evaluated, limit=self.batch_size)
+                if batch.empty:
+                    return raised
+                stamps = pd.to_datetime(batch['Timestamp'], format=TIMESTAMP_FORMAT)
+                start = (stamps.min() - self.lookback).strftime(TIMESTAMP_FORMAT)
+                end = (stamps.max() + timedelta(seconds=1)).strftime(TIMESTAMP_FORMAT)
+                context = self.storage.read_range(start=start, end=end,
+                                                  areas=batch['Area'].unique().tolist())
+                alarms = self.evaluate(context.reset_index(), after=evaluated)
+                alarms = alarms[alarms['seq'] <= batch.index.max()]
+                rows = list(alarms.itertuples(index=False, name=None))
+                # Another process may have evaluated the same batch meanwhile
+                if self.storage.record_alarms(rows, evaluated, int(batch.index.max())):
+                    raised += len(rows)
+
+    def poll(self):
+        """Like ``process``, but keeps an error in ``last_error`` instead of raising it"""
+        try:
+            raised = self.process()
+        except Exception as e:
+            # The readings stay unevaluated and are picked up by the next poll
+            self.last_error = e
+            return 0
+        self.last_error = None
+        return raised
+
+    def on_flush(self, seqs):
+        """Write queue listener: evaluate the readings that were just committed"""
+        self.poll()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_alarm_engine():
+    """Return the process-wide alarm engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AlarmEngine(get_storage())
+        return _engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate alarm rules over the logbook")
+    parser.add_argument('--evaluate', action='store_true', help="evaluate every reading not evaluated yet")
+    args = parser.parse_args(argv)
+    if args.evaluate:
+        raised = get_alarm_engine().process()
+        print(f"Raised {raised} alarm(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""Closed partitions of the log, compacted into Parquet files.
+
+The log is partitioned by period, a calendar month unless
+``LOGBOOK_PARTITION`` says ``day``, ``week``, ``quarter`` or ``year``. Only
+the active partition stays in the SQLite table. Once a period has closed
+its readings are moved into one zstd-compressed Parquet file per period,
+sorted by timestamp, and the table shrinks back to the readings of the
+current period.
+
+Void readings are archived too, with the time they were voided in a
+``Voided`` column, so the corrections trail still points at readings that
+exist. Every read leaves them out, like the table's reads do; once
+archived, a reading can no longer be voided or restored.
+
+``manifest.json`` in the archive directory records the first and last
+timestamp of every file. Queries and exports open only the files whose
+range overlaps the one they ask for, and within a file Parquet's row group
+statistics skip the rest.
+
+Rollups and alarms stay in SQLite; they are small and the dashboard needs
+them for every period. With ``LOGBOOK_RETENTION_DAYS`` set, archived
+periods that ended longer ago than that are deleted.
+
+pyarrow is a requirement of the app: once the first period closes, every
+rotation would fail without it and the table would never shrink.
+
+    $ python -m logbook.archive --rotate
+    $ python -m logbook.archive --list
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from logbook.locking import atomic_write, file_lock
+from logbook.storage import COLUMNS, TIMESTAMP_FORMAT, Reading, get_storage
+
+PERIODS = ('day', 'week', 'month', 'quarter', 'year')
+DEFAULT_PERIOD = 'month'
+DEFAULT_ARCHIVE_DIR = 'bina_refinery_log.archive'
+
+MANIFEST = 'manifest.json'
+# When an archived reading was voided; null for readings that count
+VOIDED = 'Voided'
+ROW_GROUP_SIZE = 64 * 1024
+
+# How often, in seconds, a ``Rotator`` looks for a closed period
+ROTATE_INTERVAL = 3600
+
+# ``start`` and ``end`` bound the period; ``min_ts`` and ``max_ts`` the readings in the file.
+# ``rows`` counts the readings that count and ``voided`` the void ones kept beside them.
+Partition = namedtuple('Partition', ['key', 'file', 'start', 'end', 'min_ts', 'max_ts',
+                                     'min_seq', 'max_seq', 'rows', 'bytes', 'voided'], defaults=[0])
+
+
+def period_bounds(moment, period=DEFAULT_PERIOD):
+    """Return ``(key, start, end)`` of the period ``moment`` falls in, as log timestamps"""
+    if isinstance(moment, str):
+        moment = datetime.strptime(moment, TIMESTAMP_FORMAT)
+    day = datetime(moment.year, moment.month, moment.day)
+    if period == 'day':
+        key, start, end = day.strftime('%Y-%m-%d'), day, day + timedelta(days=1)
+    elif period == 'week':
+        start = day - timedelta(days=day.weekday())
+        year, week, _ = start.isocalendar()
+        key, end = f'{year}-W{week:02d}', start + timedelta(days=7)
+    elif period in ('month', 'quarter'):
+        months = 1 if period == 'month' else 3
+        first = (moment.month - 1) // months * months
+        start = datetime(moment.year, first + 1, 1)
+        end = datetime(moment.year + (first + months) // 12, (first + months) % 12 + 1, 1)
+        key = start.strftime('%Y-%m') if period == 'month' else f'{moment.year}-Q{first // 3 + 1}'
+    elif period == 'year':
+        key, start, end = str(moment.year), datetime(moment.year, 1, 1), datetime(moment.year + 1, 1, 1)
+    else:
+        raise ValueError(f"Unknown partition period {period!r}; choose from {PERIODS}")
+    return key, start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Archiving the log needs pyarrow; install it with 'pip install pyarrow'")
+    return pa, pq
+
+
+def _filters(start=None, end=None, areas=None, parameters=None, inclusive_end=False):
+    filters = []
+    for column, names in (('Area', areas), ('Parameter', parameters)):
+        if names:
+            filters.append((column, 'in', list(names)))
+    if start is not None:
+        filters.append(('Timestamp', '>=', start))
+    if end is not None:
+        filters.append(('Timestamp', '<=' if inclusive_end else '<', end))
+    return filters or None
+
+
+class Archive:
+    """Directory of Parquet files, one per closed period, and their manifest"""
+
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR, period=DEFAULT_PERIOD, retention_days=None):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown partition period {period!r}; choose from {PERIODS}")
+        self.directory = directory
+        self.period = period
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._partitions = ()
+        self._manifest_mtime = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                partitions = ()
+                if mtime is not None:
+                    with open(self.manifest_path, encoding='utf-8') as f:
+                        partitions = tuple(Partition(**entry) for entry in json.load(f)['partitions'])
+                self._partitions = tuple(sorted(partitions, key=lambda p: p.start))
+                self._manifest_mtime = mtime
+            return self._partitions
+
+    def _save(self, partitions):
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_write(self.manifest_path) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'period': self.period, 'partitions': [p._asdict() for p in partitions]}, f, indent=1)
+
+    def partitions(self, start=None, end=None):
+        """Partitions holding readings with ``start <= Timestamp < end``, oldest first"""
+        return [p for p in self._load()
+                if (start is None or p.max_ts >= start) and (end is None or p.min_ts < end)]
+
+    def rows(self):
+        """Number of archived readings"""
+        return sum(p.rows for p in self._load())
+
+    def _read(self, partition, filters=None, live=True):
+        _, pq = _pyarrow()
+        import pyarrow.compute as pc
+        table = pq.read_table(os.path.join(self.directory, partition.file), filters=filters)
+        # Files written before void readings were archived have no such column
+        if live and VOIDED in table.column_names:
+            table = table.filter(pc.is_null(table[VOIDED]))
+        return table
+
+    def archived(self, seq):
+        """Whether the reading ``seq`` is archived, void or not"""
+        for partition in self._load():
+            if partition.min_seq <= seq <= partition.max_seq:
+                if self._read(partition, [('seq', '=', seq)], live=False).num_rows:
+                    return True
+        return False
+
+    def read_frame(self, start=None, end=None, areas=None, parameters=None):
+        """Return archived readings selected as in ``iter_rows`` as a DataFrame indexed by sequence number"""
+        import pandas as pd
+        filters = _filters(start, end, areas, parameters)
+        frames = [self._read(p, filters).to_pandas() for p in self.partitions(start, end)]
+        if not frames:
+            empty = pd.DataFrame(columns=COLUMNS, index=pd.Index([], name='seq', dtype='int64'))
+            return empty.astype({'Value': 'float64'})
+        return pd.concat(frames, ignore_index=True).set_index('seq')[COLUMNS]
+
+    def iter_rows(self, start=None, end=None, areas=None, parameters=None, chunk_size=10000):
+        """Yield lists of at most ``chunk_size`` archived rows in ``COLUMNS`` order, oldest period first"""
+        filters = _filters(start, end, areas, parameters)
+        for partition in self.partitions(start, end):
+            table = self._read(partition, filters).select(COLUMNS)
+            for batch in table.to_batches(max_chunksize=chunk_size):
+                yield list(zip(*(column.to_pylist() for column in batch.columns)))
+
+    def query(self, area=None, parameter=None, start=None, end=None, limit=None, newest_first=False):
+        """Return archived readings as ``Reading`` tuples, like ``LogStorage.query``.
+
+        With a ``limit`` partitions are read from the requested end of the
+        range and reading stops once no further partition can hold a closer
+        reading.
+        """
+        partitions = self.partitions(start, end)
+        if newest_first:
+            partitions.sort(key=lambda p: p.max_ts, reverse=True)
+        filters = _filters(start, end, area and [area], parameter and [parameter])
+        key = lambda reading: (reading.timestamp, reading.seq)  # noqa: E731
+        found = []
+        for partition in partitions:
+            if limit is not None and len(found) >= limit:
+                bound = found[-1].timestamp
+                if (partition.max_ts < bound) if newest_first else (partition.min_ts > bound):
+                    break
+            table = self._read(partition, filters).select(['seq'] + COLUMNS)
+            found.extend(Reading(*row) for row in zip(*(column.to_pylist() for column in table.columns)))
+            found.sort(key=key, reverse=newest_first)
+            if limit is not None:
+                del found[limit:]
+        return found
+
+    def contains(self, frame):
+        """Boolean mask of the frame's rows whose (area, parameter, timestamp) is archived"""
+        import numpy as np
+        import pandas as pd
+        low, high = frame['Timestamp'].min(), frame['Timestamp'].max()
+        partitions = [p for p in self._load() if p.max_ts >= low and p.min_ts <= high]
+        if not partitions:
+            return np.zeros(len(frame), dtype=bool)
+        filters = _filters(low, high, frame['Area'].unique().tolist(), inclusive_end=True)
+        keys = ['Area', 'Parameter', 'Timestamp']
+        # Void readings still hold their place, as they do in the table
+        archived = pd.concat([self._read(p, filters, live=False).select(keys).to_pandas() for p in partitions])
+        return pd.MultiIndex.from_frame(frame[keys]).isin(pd.MultiIndex.from_frame(archived))
+
+    def write(self, key, start, end, frame):
+        """Store readings of the closed period ``key`` and return its ``Partition``.
+
+        ``frame`` has a ``seq`` column, ``COLUMNS`` and optionally ``Voided``
+        with when void readings were voided. Readings already
+        archived for the period are merged in, so the period stays one file
+        and writing the same readings twice keeps one copy.
+        """
+        import pandas as pd
+        pa, pq = _pyarrow()
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self.manifest_path):
+            self._manifest_mtime = None
+            partitions = {p.key: p for p in self._load()}
+            previous = partitions.get(key)
+            if VOIDED not in frame:
+                frame = frame.assign(**{VOIDED: None})
+            if previous is not None:
+                frame = pd.concat([self._read(previous, live=False).to_pandas(), frame], ignore_index=True)
+                frame = frame.drop_duplicates(subset='seq', keep='last')
+            frame = frame.sort_values(['Timestamp', 'seq'], ignore_index=True)
+            frame[VOIDED] = frame[VOIDED].astype(object).where(frame[VOIDED].notna(), None)
+            table = pa.Table.from_pandas(frame[['seq'] + COLUMNS + [VOIDED]], preserve_index=False)
+            # A period without void readings would otherwise get a column of type null
+            table = table.set_column(table.num_columns - 1, VOIDED, table[VOIDED].cast(pa.string()))
+            # A new name per write, so readers of the previous file are never cut off mid-read
+            name = f"readings-{key}-{int(frame['seq'].max())}.parquet"
+            path = os.path.join(self.directory, name)
+            with atomic_write(path) as tmp_path:
+                pq.write_table(table, tmp_path, compression='zstd', row_group_size=ROW_GROUP_SIZE,
+                               use_dictionary=['Area', 'Parameter', 'Unit', 'Status'])
+            voided = int(frame[VOIDED].notna().sum())
+            partitions[key] = Partition(
+                key, name, start, end, frame['Timestamp'].iloc[0], frame['Timestamp'].iloc[-1],
+                int(frame['seq'].min()), int(frame['seq'].max()), len(frame) - voided, os.path.getsize(path),
+                voided,
+            )
+            self._save(sorted(partitions.values(), key=lambda p: p.start))
+            if previous is not None and previous.file != name:
+                os.remove(os.path.join(self.directory, previous.file))
+            return partitions[key]
+
+    def expire(self, now=None):
+        """Delete partitions whose period ended more than ``retention_days`` ago; returns them"""
+        if self.retention_days is None:
+            return []
+        cutoff = ((now or datetime.now()) - timedelta(days=self.retention_days)).strftime(TIMESTAMP_FORMAT)
+        with file_lock(self.manifest_path):
+            self._manifest_mtime = None
+            partitions = self._load()
+            expired = [p for p in partitions if p.end <= cutoff]
+            if expired:
+                self._save([p for p in partitions if p.end > cutoff])
+                for partition in expired:
+                    os.remove(os.path.join(self.directory, partition.file))
+            return expired
+
+
+def get_archive():
+    """Archive configured by ``LOGBOOK_ARCHIVE_DIR``, ``LOGBOOK_PARTITION`` and ``LOGBOOK_RETENTION_DAYS``"""
+    retention = os.environ.get('LOGBOOK_RETENTION_DAYS')
+    return Archive(
+        os.environ.get('LOGBOOK_ARCHIVE_DIR', DEFAULT_ARCHIVE_DIR),
+        os.environ.get('LOGBOOK_PARTITION', DEFAULT_PERIOD),
+        int(retention) if retention else None,
+    )
+
+
+class Rotator:
+    """Runs ``archive_closed`` on a background thread, at most once per ``interval`` seconds"""
+
+    def __init__(self, storage, interval=ROTATE_INTERVAL):
+        self.storage = storage
+        self.interval = interval
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._requested_at = None
+
+    def request(self):
+        """Start a rotation unless one is running or ran recently; returns whether one started"""
+        with self._lock:
+            now = time.monotonic()
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            if self._requested_at is not None and now - self._requested_at < self.interval:
+                return False
+            self._requested_at = now
+            self._thread = threading.Thread(target=self.rotate, name='logbook-archive', daemon=True)
+            self._thread.start()
+            return True
+
+    def rotate(self):
+        """Archive closed periods now, keeping an error in ``last_error`` instead of raising it"""
+        try:
+            written = self.storage.archive_closed()
+        except Exception as e:
+            # The readings stay in the table and are moved by the next rotation
+            self.last_error = e
+            return []
+        self.last_error = None
+        return written
+
+    def on_flush(self, seqs):
+        """Write queue listener: a flush is the cheapest moment to notice a period has closed"""
+        self.request()
+
+
+_rotator = None
+_rotator_lock = threading.Lock()
+
+
+def get_rotator():
+    """Return the process-wide rotator of the process-wide store"""
+    global _rotator
+    with _rotator_lock:
+        if _rotator is None:
+            _rotator = Rotator(get_storage())
+        return _rotator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive closed periods of the logbook")
+    parser.add_argument('--rotate', action='store_true',
+                        help="move readings of closed periods into the archive and apply the retention policy")
+    parser.add_argument('--list', action='store_true', help="list the archived partitions")
+    args = parser.parse_args(argv)
+
+    storage = get_storage()
+    if args.rotate:
+        for partition in storage.archive_closed():
+            print(f"Archived {partition.key}: {partition.rows} readings in {partition.file}")
+    if args.list:
+        for p in storage.archive.partitions():
+            print(f"{p.key}\t{p.min_ts} .. {p.max_ts}\t{p.rows} readings ({p.voided} void)\t{p.bytes / 1e6:.1f} MB\t{p.file}")
+
+
+if __name__ == '__main__':
+    main()
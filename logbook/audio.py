@@ -0,0 +1,97 @@
+"""Persistent microphone sessions.
+
+Opening a microphone and calibrating for ambient noise costs a couple of
+seconds, which used to be paid on every reading. An ``AudioSession`` opens
+the stream and calibrates once, then keeps both for later readings. The
+energy threshold keeps adapting while listening through the recognizer's
+dynamic threshold, and the stream is paused between readings so it does
+not pick up stale audio.
+"""
+import threading
+import weakref
+
+import speech_recognition as sr
+
+from logbook import metrics
+
+CALIBRATION_SECONDS = 2
+
+
+def _close_source(source):
+    try:
+        source.__exit__(None, None, None)
+    except Exception:
+        pass
+
+
+class AudioSession:
+    """A calibrated recognizer and an open microphone, reused across readings"""
+
+    def __init__(self, device_index=None):
+        self.device_index = device_index
+        self.recognizer = sr.Recognizer()
+        self.recognizer.dynamic_energy_threshold = True
+        self.calibrated = False
+        self._source = None
+        self._finalizer = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._source is None:
+            with metrics.timed('logbook_audio_open_seconds'):
+                microphone = sr.Microphone(device_index=self.device_index)
+                self._source = microphone.__enter__()
+            # Release the device even if the owning session is dropped without close()
+            self._finalizer = weakref.finalize(self, _close_source, microphone)
+        return self._source
+
+    def _set_streaming(self, active):
+        stream = getattr(self._source.stream, 'pyaudio_stream', None)
+        if stream is None:
+            return
+        if active and stream.is_stopped():
+            stream.start_stream()
+        elif not active and stream.is_active():
+            stream.stop_stream()
+
+    def calibrate(self, duration=CALIBRATION_SECONDS):
+        """Measure ambient noise to set the initial energy threshold"""
+        with self._lock:
+            source = self._open()
+            self._set_streaming(True)
+            try:
+                with metrics.timed('logbook_audio_calibrate_seconds'):
+                    self.recognizer.adjust_for_ambient_noise(source, duration=duration)
+                self.calibrated = True
+            finally:
+                self._set_streaming(False)
+
+    def listen(self, timeout=5, phrase_time_limit=5):
+        """Record one utterance; the stream is reopened if it failed last time"""
+        if not self.calibrated:
+            self.calibrate()
+        with self._lock:
+            source = self._open()
+            self._set_streaming(True)
+            try:
+                with metrics.timed('logbook_audio_listen_seconds'):
+                    return self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+            except sr.WaitTimeoutError:
+                raise
+            except Exception:
+                self._close()
+                raise
+            finally:
+                if self._source is not None:
+                    self._set_streaming(False)
+
+    def _close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+        self._source = None
+        self._finalizer = None
+
+    def close(self):
+        """Release the microphone"""
+        with self._lock:
+            self._close()
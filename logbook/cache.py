@@ -0,0 +1,77 @@
+"""In-process cache of reads of the log.
+
+Streamlit reruns the whole script on every click, and sessions in the same
+process all look at the same log, so most reruns ask the store again for
+answers it gave a moment ago. The cache keeps those answers per process
+and keys them on the store's ``LogState``: it changes with every reading
+committed, voided or restored by this session or any other process, and
+the first read after that change clears the cache. Until then a rerun
+costs one ``state()`` query.
+
+Only answers the log's state fully determines may be cached, such as
+readings and rollups; alarms are recorded after the readings they are
+about and would be served stale.
+"""
+import threading
+from collections import OrderedDict
+
+from logbook.storage import get_storage
+
+# How many answers are kept, least recently used first out
+DEFAULT_SIZE = 64
+
+
+class LogCache:
+    """Answers to reads of the log, kept until the log changes"""
+
+    def __init__(self, storage, size=DEFAULT_SIZE):
+        self.storage = storage
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._state = None
+        self._answers = OrderedDict()
+
+    def get(self, key, read):
+        """Return what ``read()`` returns, calling it only if ``key`` was not read since the log changed.
+
+        Answers are shared between sessions; callers must not modify them.
+        """
+        state = self.storage.state()
+        with self._lock:
+            if state != self._state:
+                self._answers.clear()
+                self._state = state
+            elif key in self._answers:
+                self._answers.move_to_end(key)
+                self.hits += 1
+                return self._answers[key]
+            self.misses += 1
+        # State was read first, so a commit racing the read makes the answer newer than its key, never older
+        answer = read()
+        with self._lock:
+            if self._state == state:
+                self._answers[key] = answer
+                while len(self._answers) > self.size:
+                    self._answers.popitem(last=False)
+        return answer
+
+    def invalidate(self):
+        """Forget every answer, e.g. after changing the store behind its back"""
+        with self._lock:
+            self._answers.clear()
+            self._state = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_log_cache():
+    """Return the process-wide log cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LogCache(get_storage())
+        return _cache
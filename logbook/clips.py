@@ -0,0 +1,237 @@
+"""Recordings behind voice readings, and a batch recheck of doubtful ones.
+
+Every utterance that logs readings is kept, resampled to the 16 kHz mono
+the recognizers work at and FLAC-encoded, at a fraction of the size of
+the WAV it came from, in one folder per day under
+``bina_refinery_log.clips/``. The log store links a
+clip to its readings through their idempotency keys, ``"<clip
+key>:<parameter>"``, so a clip can always be traced to the rows it
+produced and back.
+
+A recheck transcribes the clips of a time range again, typically those
+recognized with a low confidence, on a pool of worker processes (local
+models are CPU-bound) or threads (the web API is network-bound). Each
+reading the second transcript gives a different value for gets a ``Flag``
+for an operator to review; readings it does not mention at all are only
+counted, since a transcript that missed a name says nothing about the
+value. Nothing in the log is changed.
+
+    $ python -m logbook.clips --recheck --date 2024-05-01 --below 0.8 --engine whisper --workers 8
+    $ python -m logbook.clips --flags --date 2024-05-01
+"""
+import argparse
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from logbook.storage import TIMESTAMP_FORMAT, get_storage
+
+DEFAULT_CLIPS_DIR = 'bina_refinery_log.clips'
+DEFAULT_BELOW = 0.8
+SAMPLE_RATE = 16000
+
+# ``readings`` are the ``(seq, parameter, value)`` of the clip's live readings
+Clip = namedtuple('Clip', ['key', 'file', 'area', 'parameter', 'timestamp', 'engine', 'transcript', 'confidence',
+                           'readings'])
+
+# A reading the recheck heard a different value for
+Flag = namedtuple('Flag', ['seq', 'key', 'parameter', 'logged', 'heard', 'timestamp'])
+
+# ``unheard`` lists the ``(seq, key, parameter)`` of readings the second transcripts did not mention
+RecheckReport = namedtuple('RecheckReport', ['clips', 'rechecked', 'flagged', 'unheard', 'failed', 'seconds'])
+
+
+class ClipStore:
+    """FLAC files of recorded utterances, registered with the log store"""
+
+    def __init__(self, directory=DEFAULT_CLIPS_DIR, storage=None, retention_days=None):
+        self.directory = directory
+        self.storage = storage or get_storage()
+        self.retention_days = retention_days
+        self.last_error = None
+
+    def path(self, clip):
+        return os.path.join(self.directory, clip.file)
+
+    def save(self, key, audio, area, parameter, timestamp, result):
+        """Keep the utterance ``audio`` that ``result`` was recognized from; False if it could not be kept"""
+        try:
+            try:
+                data, ext = audio.get_flac_data(convert_rate=SAMPLE_RATE, convert_width=2), 'flac'
+            except OSError:
+                # No FLAC encoder for this platform
+                data, ext = audio.get_wav_data(convert_rate=SAMPLE_RATE, convert_width=2), 'wav'
+            file = f"{timestamp[:10]}/{key}.{ext}"
+            os.makedirs(os.path.join(self.directory, timestamp[:10]), exist_ok=True)
+            with open(os.path.join(self.directory, file), 'wb') as f:
+                f.write(data)
+            self.storage.record_clip(key, file, area, parameter, timestamp, result.engine, result.text,
+                                     result.confidence)
+        except Exception as e:
+            # A reading never waits on its recording
+            self.last_error = e
+            return False
+        self.last_error = None
+        return True
+
+    def expire(self, now=None):
+        """Delete clips older than the retention period; returns how many"""
+        if self.retention_days is None:
+            return 0
+        cutoff = ((now or datetime.now()) - timedelta(days=self.retention_days)).strftime(TIMESTAMP_FORMAT)
+        files = self.storage.forget_clips(cutoff)
+        for file in files:
+            try:
+                os.remove(os.path.join(self.directory, file))
+            except FileNotFoundError:
+                pass
+        return len(files)
+
+
+def _transcribe(path, engine):
+    """Worker: ``(text, confidence, error)`` for one clip file"""
+    import speech_recognition as sr
+    from logbook.speech import recognize
+    try:
+        with sr.AudioFile(path) as source:
+            recognizer = sr.Recognizer()
+            audio = recognizer.record(source)
+        # A second opinion, not the transcript the first pass left in the cache
+        result = recognize(recognizer, audio, engine, cache=False)
+    except sr.UnknownValueError:
+        return '', None, None
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+    return result.text, result.confidence, None
+
+
+def compare(clip, transcript):
+    """Return ``(flags, unheard)`` for the clip's readings.
+
+    ``flags`` are ``Flag`` rows for readings ``transcript`` gives another
+    value for; ``unheard`` are the ``(seq, key, parameter)`` of readings it
+    gives no value for.
+    """
+    from logbook.pipeline import readings_from_text
+    heard = {}
+    if transcript:
+        rows, _, _ = readings_from_text(clip.area, clip.parameter, transcript, clip.timestamp)
+        heard = {row[1]: row[2] for row in rows}
+    flags, unheard = [], []
+    for seq, parameter, value in clip.readings:
+        if parameter not in heard:
+            unheard.append((seq, clip.key, parameter))
+        elif not math.isclose(heard[parameter], value, rel_tol=1e-9, abs_tol=1e-9):
+            flags.append(Flag(seq, clip.key, parameter, value, heard[parameter], clip.timestamp))
+    return flags, unheard
+
+
+def recheck(store, engine, start=None, end=None, below=DEFAULT_BELOW, workers=None, processes=None, again=False):
+    """Transcribe the clips of ``start <= timestamp < end`` again and flag disagreements.
+
+    Only clips recognized below the confidence ``below`` are taken, all of
+    them if it is None, and only those not rechecked before unless
+    ``again``. ``processes`` picks a process pool over a thread pool;
+    by default processes are used for the local engines.
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from logbook.speech import OFFLINE_ENGINES, preload
+
+    started = time.perf_counter()
+    clips = [clip for clip in store.storage.clips(start, end, below, None if again else False) if clip.readings]
+    if processes is None:
+        processes = engine in OFFLINE_ENGINES
+    if not processes:
+        # Threads share one model; load it before they race to
+        preload(engine)
+    workers = workers or os.cpu_count()
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    # A few chunks per process keep them busy without a round trip per clip
+    chunksize = max(1, len(clips) // (4 * workers)) if processes else 1
+    rechecked = flagged = failed = 0
+    unheard = []
+    with pool(max_workers=workers) as executor:
+        results = executor.map(_transcribe, [store.path(clip) for clip in clips], [engine] * len(clips),
+                               chunksize=chunksize)
+        for clip, (text, confidence, error) in zip(clips, results):
+            if error is not None:
+                failed += 1
+                continue
+            try:
+                flags, missed = compare(clip, text)
+            except Exception:
+                # e.g. its parameter left the registry; the other clips still count
+                failed += 1
+                continue
+            store.storage.record_recheck(clip.key, engine, text, confidence, flags)
+            rechecked += 1
+            flagged += len(flags)
+            unheard += missed
+    return RecheckReport(len(clips), rechecked, flagged, unheard, failed, time.perf_counter() - started)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_clip_store():
+    """Return the process-wide clip store, or None if ``LOGBOOK_CLIPS=0``.
+
+    ``LOGBOOK_CLIPS_DIR`` sets its folder and ``LOGBOOK_CLIP_RETENTION_DAYS``
+    how long clips are kept; forever by default.
+    """
+    global _store
+    if os.environ.get('LOGBOOK_CLIPS', '1') == '0':
+        return None
+    with _store_lock:
+        if _store is None:
+            retention = os.environ.get('LOGBOOK_CLIP_RETENTION_DAYS')
+            _store = ClipStore(os.environ.get('LOGBOOK_CLIPS_DIR', DEFAULT_CLIPS_DIR), get_storage(),
+                               int(retention) if retention else None)
+        return _store
+
+
+def main(argv=None):
+    from logbook.speech import default_engine
+
+    parser = argparse.ArgumentParser(description="Recheck recorded voice readings")
+    parser.add_argument('--recheck', action='store_true', help="transcribe clips again and flag disagreements")
+    parser.add_argument('--flags', action='store_true', help="list readings flagged by rechecks")
+    parser.add_argument('--expire', action='store_true', help="delete clips older than LOGBOOK_CLIP_RETENTION_DAYS")
+    parser.add_argument('--date', help="day to work on, YYYY-MM-DD; --start and --end give any range")
+    parser.add_argument('--start', help="earliest timestamp, inclusive")
+    parser.add_argument('--end', help="latest timestamp, exclusive")
+    parser.add_argument('--below', type=float, default=DEFAULT_BELOW,
+                        help="only recheck clips recognized with a lower confidence; negative for all")
+    parser.add_argument('--engine', default=None, help="engine for the second opinion; LOGBOOK_SPEECH_ENGINE by default")
+    parser.add_argument('--workers', type=int, default=None, help="pool size; one per CPU by default")
+    parser.add_argument('--threads', action='store_true', help="use threads instead of processes")
+    parser.add_argument('--again', action='store_true', help="include clips rechecked before")
+    args = parser.parse_args(argv)
+
+    start, end = args.start, args.end
+    if args.date:
+        day = datetime.strptime(args.date, '%Y-%m-%d')
+        start, end = day.strftime(TIMESTAMP_FORMAT), (day + timedelta(days=1)).strftime(TIMESTAMP_FORMAT)
+    store = get_clip_store() or ClipStore()
+    if args.recheck:
+        engine = args.engine or default_engine()
+        report = recheck(store, engine, start, end, None if args.below < 0 else args.below, args.workers,
+                         False if args.threads else None, args.again)
+        print(f"Rechecked {report.rechecked} of {report.clips} clip(s) with {engine} in {report.seconds:.1f} s: "
+              f"{report.flagged} reading(s) flagged, {len(report.unheard)} not heard again, "
+              f"{report.failed} clip(s) failed")
+        for seq, key, parameter in report.unheard:
+            print(f"not heard\t#{seq}\t{parameter} (clip {key})")
+    if args.flags:
+        for flag in store.storage.clip_flags(start, end):
+            print(f"{flag.timestamp}\t#{flag.seq}\t{flag.parameter}: logged {flag.logged:g}, heard {flag.heard:g}")
+    if args.expire:
+        print(f"Deleted {store.expire()} clip(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Streaming export of the log to CSV, gzip-compressed CSV or Parquet.
+
+Readings are pulled from the store in fixed-size chunks and encoded one
+chunk at a time, so memory use depends on the chunk size rather than on
+the length of the log. Output goes to a spooled temporary file that moves
+to disk once it outgrows ``SPOOL_LIMIT``.
+"""
+import csv
+import gzip
+import io
+import tempfile
+from datetime import datetime, timedelta
+
+from logbook.storage import COLUMNS, TIMESTAMP_FORMAT
+
+CHUNK_SIZE = 10000
+SPOOL_LIMIT = 8 * 1024 * 1024
+
+# format -> (MIME type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'csv.gz': ('application/gzip', '.csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+
+def date_bounds(start_date=None, end_date=None):
+    """Turn an inclusive range of dates into ``(start, end)`` log timestamps"""
+    start = start_date.strftime(TIMESTAMP_FORMAT) if start_date else None
+    end = None
+    if end_date:
+        next_day = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+        end = next_day.strftime(TIMESTAMP_FORMAT)
+    return start, end
+
+
+def _write_csv(chunks, fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(COLUMNS)
+    rows = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        rows += len(chunk)
+    text.flush()
+    text.detach()
+    return rows
+
+
+def _write_csv_gz(chunks, fileobj):
+    with gzip.GzipFile(fileobj=fileobj, mode='wb') as gz:
+        return _write_csv(chunks, gz)
+
+
+def _write_parquet(chunks, fileobj):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow; install it with 'pip install pyarrow'")
+
+    schema = pa.schema([
+        ('Area', pa.string()), ('Parameter', pa.string()), ('Value', pa.float64()),
+        ('Unit', pa.string()), ('Timestamp', pa.string()), ('Status', pa.string()),
+    ])
+    rows = 0
+    with pq.ParquetWriter(fileobj, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            rows += len(chunk)
+    return rows
+
+
+_WRITERS = {
+    'csv': _write_csv,
+    'csv.gz': _write_csv_gz,
+    'parquet': _write_parquet,
+}
+
+
+def write_export(storage, fileobj, fmt='csv', chunk_size=CHUNK_SIZE, **filters):
+    """Stream the filtered log into a binary file object and return the row count.
+
+    ``filters`` are passed to ``storage.iter_rows``.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format {fmt!r}; choose from {sorted(_WRITERS)}")
+    return _WRITERS[fmt](storage.iter_rows(chunk_size=chunk_size, **filters), fileobj)
+
+
+def export_to_tempfile(storage, fmt='csv', chunk_size=CHUNK_SIZE, **filters):
+    """Export into a spooled temporary file, rewound for reading.
+
+    Returns ``(file, rows)``; the caller closes the file.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT)
+    try:
+        rows = write_export(storage, spool, fmt, chunk_size=chunk_size, **filters)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, rows
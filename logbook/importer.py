@@ -0,0 +1,239 @@
+"""Bulk import of historical readings from CSV and Excel files.
+
+Files are read in chunks; each chunk is validated against the parameter
+registry with whole-column operations and stored with one
+``append_frame`` call, so memory stays flat and throughput is bounded by
+SQLite rather than Python. Readings already in the log (same area,
+parameter and timestamp) are skipped, which makes re-running an import of
+an overlapping DCS dump safe.
+
+Two layouts are understood:
+
+* long: one reading per row with ``Area``, ``Parameter``, ``Value``,
+  ``Timestamp`` and optionally ``Unit`` and ``Status`` columns, as the
+  logbook exports them. ``Equipment`` and ``Tag`` are accepted for the area
+  and parameter.
+* wide: a ``Timestamp`` column and one column per parameter, as DCS
+  historians dump them. The area comes from an ``Area`` column or
+  ``--area``.
+
+Rows that cannot be imported are written with a ``Reason`` column to
+``<file>.rejects.csv``:
+
+    $ python -m logbook.importer logs/2019.csv dcs/*.csv --area "Area 3 - Power Generation"
+"""
+import argparse
+import os
+import time
+from collections import namedtuple
+
+from logbook.parameters import STATUSES, get_registry
+from logbook.storage import COLUMNS, TIMESTAMP_FORMAT, get_storage
+
+DEFAULT_CHUNK_SIZE = 100000
+
+_ALIASES = {
+    'area': 'Area', 'equipment': 'Area',
+    'parameter': 'Parameter', 'tag': 'Parameter',
+    'value': 'Value',
+    'unit': 'Unit', 'units': 'Unit',
+    'timestamp': 'Timestamp', 'time': 'Timestamp', 'datetime': 'Timestamp', 'date': 'Timestamp',
+    'status': 'Status',
+    'key': 'Key',
+}
+
+
+class ImportReport(namedtuple('ImportReport', ['path', 'read', 'imported', 'duplicates', 'rejected',
+                                               'seconds', 'rejects_path'])):
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        """Rows read per second"""
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        text = (f"{self.path}: {self.read} read, {self.imported} imported, {self.duplicates} duplicates, "
+                f"{self.rejected} rejected in {self.seconds:.1f} s ({self.rate:,.0f} rows/s)")
+        if self.rejected:
+            text += f"; see {self.rejects_path}"
+        return text
+
+
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield DataFrames of at most ``chunk_size`` rows with every column read as text"""
+    import pandas as pd
+    if path.lower().endswith(('.xlsx', '.xls')):
+        # openpyxl has no streaming reader pandas can use; the workbook is split after loading
+        df = pd.read_excel(path, dtype=str)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+    else:
+        yield from pd.read_csv(path, dtype=str, chunksize=chunk_size, skipinitialspace=True)
+
+
+def normalize(chunk, area=None):
+    """Map a raw chunk onto ``COLUMNS``, turning the wide layout into one row per reading.
+
+    A ``Key`` column of idempotency keys, as the ingestion endpoint takes,
+    is kept after the others. In the wide layout a key stands for its row,
+    and each reading of the row gets the key ``"<key>:<parameter>"``.
+    """
+    chunk = chunk.rename(columns=lambda column: _ALIASES.get(str(column).strip().lower(), str(column).strip()))
+    if chunk.columns.duplicated().any():
+        # Two aliases of one column, e.g. records that say "area" and others "equipment"; take the first given
+        import pandas as pd
+        chunk = pd.DataFrame({name: chunk.loc[:, chunk.columns == name].bfill(axis=1).iloc[:, 0]
+                              for name in dict.fromkeys(chunk.columns)})
+    if area is not None and 'Area' not in chunk:
+        chunk = chunk.assign(Area=area)
+    if 'Parameter' not in chunk and 'Value' not in chunk:
+        keys = [column for column in ('Area', 'Timestamp', 'Unit', 'Status', 'Key') if column in chunk]
+        chunk = chunk.melt(id_vars=keys, var_name='Parameter', value_name='Value').dropna(subset=['Value'])
+        if 'Key' in chunk:
+            chunk['Key'] = (chunk['Key'].astype(str) + ':' + chunk['Parameter'].astype(str)).where(chunk['Key'].notna())
+    # Columns the file lacks come back as all-NaN floats; keep every column textual
+    columns = COLUMNS + ['Key'] if 'Key' in chunk else COLUMNS
+    return chunk.reindex(columns=columns).astype(object).reset_index(drop=True)
+
+
+def _distinct(column):
+    """``(codes, uniques)`` of a text column; missing values get the code -1"""
+    import pandas as pd
+    codes, uniques = pd.factorize(column)
+    return codes, pd.Series(uniques, dtype=object)
+
+
+def _take(uniques, codes):
+    """Values of the rows from their codes, None for code -1"""
+    import numpy as np
+    return np.append(uniques.to_numpy(dtype=object), None)[codes]
+
+
+def _tag_ids(chunk, registry):
+    """Registry tag id of every row, -1 if unknown, and a mask of rows missing area or parameter"""
+    import numpy as np
+    areas, area_names = _distinct(chunk['Area'])
+    parameters, parameter_names = _distinct(chunk['Parameter'])
+    width = len(parameter_names) + 1
+    pairs, inverse = np.unique((areas.astype(np.int64) + 1) * width + parameters + 1, return_inverse=True)
+    ids = []
+    for area, parameter in zip(pairs // width - 1, pairs % width - 1):
+        tag_id = None
+        if area >= 0 and parameter >= 0:
+            tag_id = registry.tag_id(area_names[area], parameter_names[parameter])
+        ids.append(-1 if tag_id is None else tag_id)
+    return np.array(ids, dtype=np.intp)[inverse], (areas < 0) | (parameters < 0)
+
+
+def validate(chunk, registry, timestamp_format=None, reject_out_of_range=False):
+    """Split a normalized chunk into ``(accepted, rejected)``.
+
+    Values and timestamps are parsed, units are filled in from the registry
+    and every accepted row gets its range status. Rejected rows keep their
+    original text and carry a ``Reason``.
+
+    Areas, tags, units and timestamps repeat throughout a file, so they are
+    looked up, stripped and parsed once per distinct value and taken back to
+    the rows by their codes; no step works on the text of every row.
+    """
+    import numpy as np
+    import pandas as pd
+    tag_ids, missing = _tag_ids(chunk, registry)
+    known = tag_ids >= 0
+    tags = np.where(known, tag_ids, 0)
+    values = pd.to_numeric(chunk['Value'], errors='coerce').to_numpy(dtype=np.float64)
+
+    codes, texts = _distinct(chunk['Timestamp'])
+    # Timestamps already in the log's format are kept as they are instead of being reformatted
+    canonical = pd.to_datetime(texts, format=TIMESTAMP_FORMAT, errors='coerce').notna()
+    if timestamp_format is not None or not canonical.all():
+        parsed = pd.to_datetime(texts.where(~canonical), format=timestamp_format, errors='coerce')
+        texts = texts.where(canonical, parsed.dt.strftime(TIMESTAMP_FORMAT))
+    timestamps = _take(texts, codes)
+
+    codes, units = _distinct(chunk['Unit'])
+    unit = _take(units.str.strip(), codes)
+    limit_units = np.array(registry.units, dtype=object)[tags]
+    status = registry.check(tags, values)
+    conditions = [
+        missing,
+        ~known,
+        np.isnan(values),
+        pd.isna(timestamps),
+        pd.notna(unit) & (unit != '') & (unit != limit_units),
+    ]
+    reasons = [
+        "missing area or parameter",
+        "unknown area or parameter",
+        "value is not a number",
+        "timestamp not understood",
+        "unit does not match the parameter's unit",
+    ]
+    if reject_out_of_range:
+        conditions.append(status != 0)
+        reasons.append("value out of range")
+    reason = np.select(conditions, reasons, default='')
+    rejected = reason != ''
+
+    kept = ~rejected
+    accepted = pd.DataFrame({
+        'Area': chunk['Area'].to_numpy()[kept],
+        'Parameter': chunk['Parameter'].to_numpy()[kept],
+        'Value': values[kept],
+        'Unit': limit_units[kept],
+        'Timestamp': timestamps[kept],
+        'Status': np.array(STATUSES, dtype=object)[status[kept]],
+    }, index=chunk.index[kept])
+    rejects = chunk[rejected].assign(Reason=reason[rejected])
+    return accepted, rejects
+
+
+def import_file(path, storage=None, registry=None, area=None, timestamp_format=None,
+                chunk_size=DEFAULT_CHUNK_SIZE, reject_out_of_range=False, rejects_path=None):
+    """Import one file into the log and return an ``ImportReport``"""
+    storage = storage or get_storage()
+    registry = registry or get_registry()
+    rejects_path = rejects_path or f"{path}.rejects.csv"
+    started = time.perf_counter()
+    read = imported = duplicates = rejected = 0
+    if os.path.exists(rejects_path):
+        os.remove(rejects_path)
+    for raw in read_chunks(path, chunk_size):
+        chunk = normalize(raw, area)
+        accepted, rejects = validate(chunk, registry, timestamp_format, reject_out_of_range)
+        unique = accepted.drop_duplicates(subset=['Area', 'Parameter', 'Timestamp'])
+        stored = storage.append_frame(unique)
+        read += len(chunk)
+        imported += stored
+        duplicates += len(accepted) - stored
+        if len(rejects):
+            rejects.to_csv(rejects_path, mode='a', header=not rejected, index=False)
+            rejected += len(rejects)
+    return ImportReport(path, read, imported, duplicates, rejected, time.perf_counter() - started, rejects_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import historical readings from CSV or Excel files")
+    parser.add_argument('paths', nargs='+', metavar='FILE')
+    parser.add_argument('--area', help="area of every reading, for files without an Area column")
+    parser.add_argument('--timestamp-format', help="strftime format of the timestamps, e.g. '%%d/%%m/%%Y %%H:%%M'")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--reject-out-of-range', action='store_true',
+                        help="reject readings outside their limits instead of storing them with their status")
+    parser.add_argument('--skip-alarms', action='store_true', help="do not evaluate alarm rules after importing")
+    args = parser.parse_args(argv)
+
+    storage = get_storage()
+    for path in args.paths:
+        print(import_file(path, storage, area=args.area, timestamp_format=args.timestamp_format,
+                          chunk_size=args.chunk_size, reject_out_of_range=args.reject_out_of_range))
+    if not args.skip_alarms:
+        from logbook.alarms import get_alarm_engine
+        started = time.perf_counter()
+        raised = get_alarm_engine().process()
+        print(f"Raised {raised} alarm(s) in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
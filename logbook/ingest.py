@@ -0,0 +1,266 @@
+"""HTTP endpoint for readings pushed by handhelds and scripts.
+
+Field devices post readings here instead of going through the Streamlit
+script. Payloads are validated against the parameter registry with the
+importer's whole-column checks and handed to the process-wide write queue,
+so a batch of thousands of readings costs one validation pass and a few
+batched commits. Sessions of the app see the new readings through the log
+store like any others.
+
+``POST /readings`` takes one reading as a JSON object, a JSON array of
+them (or ``{"readings": [...]}``), or NDJSON with one object per line:
+
+    {"area": "Area 1 - Crude Processing", "parameter": "Pressure", "value": 2.5}
+
+``timestamp`` (``YYYY-MM-DD HH:MM:SS``, defaulting to the time of receipt)
+and ``unit`` are optional, and the importer's column aliases such as
+``equipment`` and ``tag`` are accepted. A device that keeps its own outbox
+gives every reading a ``key``; a reading posted again with a key the log
+already holds is not stored twice, so batches can be retried freely.
+Bodies may be gzip-compressed (``Content-Encoding: gzip``). An object
+without ``parameter`` and ``value`` is read as one area's round, with one
+value per parameter name:
+
+    {"area": "Area 1 - Crude Processing", "Pressure": 2.5, "Top Temperature": 120, "key": "r-17"}
+
+The key of a round stands for all of it; each of its readings is stored
+under ``"<key>:<parameter>"``, as voice readings are, so a retried round
+is not stored twice either.
+
+The response counts the readings accepted and lists the rejected ones with
+a ``Reason``; with ``?wait=1`` it is sent only once the readings are
+committed and includes their sequence numbers.
+
+``GET /parameters`` returns the registry and ``GET /health`` the state of
+the write queue.
+
+The endpoint runs inside the app when ``LOGBOOK_INGEST_PORT`` is set, or on
+its own:
+
+    $ python -m logbook.ingest --port 8502 --addr 0.0.0.0
+
+Set ``LOGBOOK_INGEST_TOKEN`` to require ``Authorization: Bearer <token>``.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from logbook import metrics
+from logbook.importer import normalize, validate
+from logbook.parameters import get_registry
+from logbook.storage import now_timestamp
+from logbook.writer import get_write_queue
+
+DEFAULT_PORT = 8502
+DEFAULT_ADDR = '127.0.0.1'
+MAX_BODY = 64 * 1024 * 1024
+WAIT_TIMEOUT = 30
+
+# ``rejected`` holds the rejected readings as dicts with a ``Reason``; ``seqs`` is None unless waited for
+IngestResult = namedtuple('IngestResult', ['accepted', 'rejected', 'seqs'])
+
+
+class PayloadError(ValueError):
+    """The request body is not a reading, a list of readings or NDJSON"""
+
+
+def parse_payload(body, content_type='', content_encoding=''):
+    """Decode a request body into a list of reading dicts"""
+    if content_encoding == 'gzip':
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            body = decompressor.decompress(body, MAX_BODY)
+        except zlib.error:
+            raise PayloadError("Body is not valid gzip")
+        if decompressor.unconsumed_tail:
+            raise PayloadError(f"Body larger than {MAX_BODY} bytes once decompressed; split the batch")
+    try:
+        text = body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise PayloadError("Body is not UTF-8")
+    try:
+        if 'ndjson' in content_type or 'jsonl' in content_type:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            records = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise PayloadError(f"Body is not valid JSON: {e}")
+    if isinstance(records, dict):
+        records = records['readings'] if isinstance(records.get('readings'), list) else [records]
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise PayloadError("Expected a reading object, a list of them or NDJSON")
+    return records
+
+
+def ingest(records, registry=None, queue=None, reject_out_of_range=False, wait=False):
+    """Validate reading dicts and queue the valid ones for writing.
+
+    Returns an ``IngestResult``. With ``wait`` the call blocks until the
+    readings are committed, or ``WAIT_TIMEOUT`` passes, and reports their
+    sequence numbers.
+    """
+    import pandas as pd
+    registry = registry or get_registry()
+    queue = queue or get_write_queue()
+    if not records:
+        return IngestResult(0, [], [] if wait else None)
+    chunk = normalize(pd.DataFrame.from_records(records))
+    keys = chunk.pop('Key') if 'Key' in chunk else None
+    chunk['Timestamp'] = chunk['Timestamp'].fillna(now_timestamp())
+    accepted, rejects = validate(chunk, registry, reject_out_of_range=reject_out_of_range)
+    rows = list(accepted.itertuples(index=False, name=None))
+    if keys is not None:
+        keys = keys.where(keys.notna(), None).to_numpy()[accepted.index].tolist()
+    tickets = queue.submit_many(rows, track=wait, keys=keys) if rows else []
+    seqs = None
+    if wait:
+        queue.flush(WAIT_TIMEOUT)
+        seqs = [queue.seq(ticket) for ticket in tickets]
+        queue.forget(tickets)
+    rejected = rejects.astype(object).where(rejects.notna(), None).to_dict('records')
+    metrics.increment('logbook_ingest_readings_total', len(rows), outcome='accepted')
+    metrics.increment('logbook_ingest_readings_total', len(rejected), outcome='rejected')
+    return IngestResult(len(rows), rejected, seqs)
+
+
+def _handler(token=None, reject_out_of_range=False):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import parse_qs, urlsplit
+
+    class IngestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorized(self):
+            if token and self.headers.get('Authorization') != f'Bearer {token}':
+                self._send(401, {'error': "Missing or wrong bearer token"})
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            path = urlsplit(self.path).path
+            if path == '/parameters':
+                self._send(200, get_registry().as_dict())
+            elif path == '/health':
+                queue = get_write_queue()
+                error = queue.last_error
+                self._send(200, {'pending': queue.pending_count(),
+                                 'last_error': None if error is None else str(error)})
+            else:
+                self._send(404, {'error': f"No such path {path!r}"})
+
+        def do_POST(self):
+            started = time.perf_counter()
+            url = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY:
+                # The body is not read, so the connection cannot be reused
+                self.close_connection = True
+                self._send(413, {'error': f"Body larger than {MAX_BODY} bytes; split the batch"})
+                return
+            body = self.rfile.read(length)
+            if not self._authorized():
+                return
+            if url.path != '/readings':
+                self._send(404, {'error': f"No such path {url.path!r}"})
+                return
+            wait = parse_qs(url.query).get('wait', ['0'])[0] not in ('0', 'false', '')
+            try:
+                records = parse_payload(body, self.headers.get('Content-Type', ''),
+                                        self.headers.get('Content-Encoding', ''))
+                result = ingest(records, reject_out_of_range=reject_out_of_range, wait=wait)
+            except PayloadError as e:
+                self._send(400, {'error': str(e)})
+                return
+            except RuntimeError as e:
+                # The write queue is shutting down
+                self._send(503, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send(500, {'error': f"{type(e).__name__}: {e}"})
+                return
+            payload = {'accepted': result.accepted, 'rejected': result.rejected}
+            if wait:
+                payload['seqs'] = result.seqs
+            if result.accepted or not result.rejected:
+                code = 201 if wait else 202
+            else:
+                code = 422
+            self._send(code, payload)
+            metrics.observe('logbook_ingest_request_seconds', time.perf_counter() - started)
+
+        def log_message(self, format, *args):
+            pass
+
+    return IngestHandler
+
+
+def start_server(port=DEFAULT_PORT, addr=DEFAULT_ADDR, token=None, reject_out_of_range=False):
+    """Serve the ingestion endpoint from a background thread and return the server"""
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((addr, port), _handler(token, reject_out_of_range))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='logbook-ingest', daemon=True).start()
+    return server
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_ingest():
+    """Start the endpoint if ``LOGBOOK_INGEST_PORT`` is set, once per process; returns the server or None"""
+    global _server
+    with _server_lock:
+        port = os.environ.get('LOGBOOK_INGEST_PORT')
+        if _server is None and port:
+            _server = start_server(int(port), os.environ.get('LOGBOOK_INGEST_ADDR', DEFAULT_ADDR),
+                                   os.environ.get('LOGBOOK_INGEST_TOKEN'))
+        return _server
+
+
+def main(argv=None):
+    from logbook.alarms import get_alarm_engine
+    from logbook.archive import get_rotator
+    from logbook.mirror import get_excel_mirror
+
+    parser = argparse.ArgumentParser(description="Accept readings over HTTP without the Streamlit app")
+    parser.add_argument('--port', type=int, default=int(os.environ.get('LOGBOOK_INGEST_PORT', DEFAULT_PORT)))
+    parser.add_argument('--addr', default=os.environ.get('LOGBOOK_INGEST_ADDR', DEFAULT_ADDR))
+    parser.add_argument('--reject-out-of-range', action='store_true',
+                        help="reject readings outside their limits instead of storing them with their status")
+    args = parser.parse_args(argv)
+
+    # The same background work the app sets up for its own writes
+    mirror = get_excel_mirror()
+    queue = get_write_queue()
+    queue.add_flush_listener(get_alarm_engine().on_flush)
+    queue.add_flush_listener(get_rotator().on_flush)
+    if mirror is not None:
+        queue.add_flush_listener(lambda seqs: mirror.request())
+    get_rotator().request()
+    metrics.start_exporter()
+    server = start_server(args.port, args.addr, os.environ.get('LOGBOOK_INGEST_TOKEN'), args.reject_out_of_range)
+    print(f"Accepting readings on http://{args.addr}:{args.port}/readings")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Advisory file locks and atomic file replacement.
+
+These keep concurrent app processes from interleaving writes to shared
+files, and make sure readers never see a half-written file.
+"""
+import contextlib
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(Exception):
+    """Raised when a file lock could not be acquired in time"""
+
+
+def _try_lock(handle):
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=None, poll_interval=0.05):
+    """Hold an exclusive advisory lock on ``path + '.lock'``.
+
+    Blocks until the lock is free, or raises ``LockTimeout`` once ``timeout``
+    seconds have passed. A ``timeout`` of 0 makes a single attempt.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    handle = open(path + '.lock', 'a+')
+    try:
+        while not _try_lock(handle):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LockTimeout(f"Could not lock {path}")
+            time.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            _unlock(handle)
+    finally:
+        handle.close()
+
+
+@contextlib.contextmanager
+def atomic_write(path, suffix=None):
+    """Yield a temporary path that replaces ``path`` once the block succeeds.
+
+    The temporary file lives next to the target so the final rename stays on
+    one filesystem and is atomic. On error the target is left untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if suffix is None:
+        suffix = os.path.splitext(path)[1]
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        yield tmp_path
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,244 @@
+"""In-process latency histograms and counters, exported in Prometheus format.
+
+Every stage of logging a reading records how long it took into a
+histogram: opening the microphone, calibrating, listening, recognition,
+parsing, the write queue's commits, the Excel export and the voice
+pipeline's end-to-end entry latency. Recording is a bisect and two
+additions under a lock, cheap enough for the hot path.
+
+The metrics can be read three ways:
+
+* ``summary()`` returns count, p50 and p99 per series for the app's sidebar;
+* with ``LOGBOOK_METRICS_PORT`` set, ``start_exporter()`` serves
+  ``/metrics`` on that port (bound to ``LOGBOOK_METRICS_ADDR``, default
+  localhost) for a Prometheus scrape;
+* with ``LOGBOOK_METRICS_FILE`` set, it rewrites that file every
+  ``TEXTFILE_INTERVAL`` seconds for node_exporter's textfile collector.
+
+Quantiles are estimated from the buckets, as Prometheus'
+``histogram_quantile`` does.
+"""
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+# Upper bounds in seconds, from sub-millisecond parsing to slow network recognition
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+TEXTFILE_INTERVAL = 15
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{value}"' for label, value in labels) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram of one series"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                # Values above the last bound are reported as that bound
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Named histograms and counters, each split into series by labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        """Set the help text shown for ``name`` in the exposition"""
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timed(self, name, **labels):
+        """Record how long the block took, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timer(self, name, **labels):
+        """Decorator form of ``timed``"""
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timed(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def summary(self):
+        """``{(name, labels): {'count', 'p50_ms', 'p99_ms'}}`` for every histogram series"""
+        with self._lock:
+            return {
+                key: {'count': h.count, 'p50_ms': h.quantile(0.5) * 1000, 'p99_ms': h.quantile(0.99) * 1000}
+                for key, h in sorted(self._histograms.items()) if h.count
+            }
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            for kind, series in (('histogram', histograms), ('counter', counters)):
+                names = []
+                for (name, _), _ in series:
+                    if name not in names:
+                        names.append(name)
+                for name in names:
+                    if name in self._help:
+                        lines.append(f'# HELP {name} {self._help[name]}')
+                    lines.append(f'# TYPE {name} {kind}')
+                    for (series_name, labels), value in series:
+                        if series_name != name:
+                            continue
+                        if kind == 'counter':
+                            lines.append(f'{_series(name, labels)} {value}')
+                            continue
+                        cumulative = 0
+                        bounds = [f'{bound:g}' for bound in value.buckets] + ['+Inf']
+                        for bound, count in zip(bounds, value.counts):
+                            cumulative += count
+                            lines.append(f"{_series(name + '_bucket', labels + (('le', bound),))} {cumulative}")
+                        lines.append(f"{_series(name + '_sum', labels)} {value.sum}")
+                        lines.append(f"{_series(name + '_count', labels)} {value.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Atomically replace ``path`` with the current exposition"""
+        from logbook.locking import atomic_write
+        with atomic_write(path, suffix='.tmp') as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+
+
+REGISTRY = MetricsRegistry()
+observe = REGISTRY.observe
+increment = REGISTRY.increment
+timed = REGISTRY.timed
+timer = REGISTRY.timer
+summary = REGISTRY.summary
+render = REGISTRY.render
+
+for _name, _text in (
+    ('logbook_audio_open_seconds', "Opening the microphone stream"),
+    ('logbook_audio_calibrate_seconds', "Measuring ambient noise"),
+    ('logbook_audio_listen_seconds', "Recording one utterance, including the wait for speech"),
+    ('logbook_speech_recognize_seconds', "Transcribing one utterance"),
+    ('logbook_speech_errors_total', "Utterances the engine could not transcribe"),
+    ('logbook_speech_cache_total', "Utterances looked up in the transcript cache, by hit or miss"),
+    ('logbook_parse_seconds', "Parsing a transcript into readings"),
+    ('logbook_voice_stage_seconds', "Time an utterance spent in each stage of the voice pipeline"),
+    ('logbook_entry_seconds', "From the end of an utterance until its readings are queued for writing"),
+    ('logbook_write_seconds', "Committing one batch of readings to the log store"),
+    ('logbook_write_rows_total', "Readings committed by the write queue"),
+    ('logbook_ingest_request_seconds', "Handling one POST to the ingestion endpoint"),
+    ('logbook_ingest_readings_total', "Readings received by the ingestion endpoint"),
+    ('logbook_excel_export_seconds', "Rewriting the Excel workbook"),
+    ('logbook_script_run_seconds', "One run of the Streamlit script"),
+):
+    REGISTRY.describe(_name, _text)
+
+
+def _handler(registry):
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def start_http_server(port, addr='127.0.0.1', registry=REGISTRY):
+    """Serve ``/metrics`` from a background thread and return the server"""
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((addr, port), _handler(registry))
+    threading.Thread(target=server.serve_forever, name='logbook-metrics', daemon=True).start()
+    return server
+
+
+def _write_textfile_forever(path, interval, registry):
+    while True:
+        try:
+            registry.write_textfile(path)
+        except OSError:
+            pass
+        time.sleep(interval)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter():
+    """Start the exporters configured in the environment, once per process"""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+        port = os.environ.get('LOGBOOK_METRICS_PORT')
+        if port:
+            start_http_server(int(port), os.environ.get('LOGBOOK_METRICS_ADDR', '127.0.0.1'))
+        path = os.environ.get('LOGBOOK_METRICS_FILE')
+        if path:
+            threading.Thread(target=_write_textfile_forever, args=(path, TEXTFILE_INTERVAL, REGISTRY),
+                             name='logbook-metrics-file', daemon=True).start()
@@ -0,0 +1,104 @@
+"""Keeps the Excel workbook in step with the log store.
+
+Writing an .xlsx with openpyxl takes seconds on a long log, so it never
+happens on a session's script thread. Sessions only ask for a refresh; a
+single background thread per process does the export, and refresh requests
+that arrive while it is busy are folded into the next export. When several
+replicas share the log store, only the one holding the store's
+``excel-mirror`` lease exports; the others check back once it may have
+lapsed.
+"""
+import atexit
+import os
+import threading
+import time
+
+from logbook import metrics
+from logbook.replicas import LEASE_SECONDS, replica_id
+from logbook.storage import DEFAULT_EXCEL_PATH, export_excel, get_storage
+
+DEFAULT_DELAY = 5.0
+
+
+class ExcelMirror:
+    """Background exporter that rewrites the workbook after the log changes"""
+
+    def __init__(self, storage, path=DEFAULT_EXCEL_PATH, delay=DEFAULT_DELAY):
+        self.storage = storage
+        self.path = path
+        self.delay = delay
+        self.last_error = None
+        self._exported_version = None
+        self._requested = False
+        # Set while another replica holds the lease
+        self._retry = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='excel-mirror', daemon=True)
+        self._thread.start()
+
+    def request(self):
+        """Ask for the workbook to be refreshed; returns immediately"""
+        self._requested = True
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self._retry)
+            # Let a burst of writes settle so they share one export
+            self._wakeup.clear()
+            if not self._stopping:
+                time.sleep(self.delay)
+                try:
+                    self.sync()
+                except Exception as e:
+                    # A busy store must not end the thread; the next request tries again
+                    self.last_error = e
+
+    def sync(self):
+        """Export now if the log changed since the last export and no other replica is exporting it"""
+        if not self.storage.acquire_lease('excel-mirror', replica_id(), LEASE_SECONDS):
+            self._retry = LEASE_SECONDS
+            return False
+        self._retry = None
+        version = self.storage.state().version
+        if version == self._exported_version and os.path.exists(self.path):
+            return False
+        try:
+            with metrics.timed('logbook_excel_export_seconds'):
+                export_excel(self.storage, self.path)
+        except Exception as e:
+            # Excel may have the workbook open on Windows, or a value may not be writable; retry on the next request
+            self.last_error = e
+            return False
+        self._exported_version = version
+        self.last_error = None
+        return True
+
+    def stop(self, final_sync=True):
+        """Stop the background thread, optionally exporting once more"""
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=self.delay + 30)
+        if final_sync and self._requested:
+            self.sync()
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_excel_mirror():
+    """Return the process-wide mirror, or None if ``LOGBOOK_EXCEL_MIRROR=0``"""
+    global _mirror
+    if os.environ.get('LOGBOOK_EXCEL_MIRROR', '1') == '0':
+        return None
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = ExcelMirror(
+                get_storage(),
+                path=os.environ.get('LOGBOOK_EXCEL_PATH', DEFAULT_EXCEL_PATH),
+                delay=float(os.environ.get('LOGBOOK_EXCEL_DELAY', DEFAULT_DELAY)),
+            )
+            atexit.register(_mirror.stop)
+        return _mirror
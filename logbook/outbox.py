@@ -0,0 +1,262 @@
+"""Durable local outbox for readings and recordings that cannot be handled yet.
+
+A reading is only safe once it is committed to the log store, and a
+recording only turns into readings once a recognizer has transcribed it.
+When the store cannot be written, e.g. a network share dropped out, the
+write queue moves its batch here instead of holding it in memory; when no
+speech engine is reachable, the voice pipeline keeps the recording here
+instead of dropping it. The outbox is a small SQLite file of its own, so
+it stays writable when the log store is not.
+
+Everything in the outbox carries an idempotency key. Readings are replayed
+by the write queue in the order they were queued, in batches, with their
+keys, so a batch that is retried after a commit whose outcome was lost is
+never stored twice. Recordings are retried by a ``RecordingRetrier``;
+once transcribed, their readings join the outbox's readings in the same
+transaction that removes the recording.
+"""
+import io
+import os
+import sqlite3
+import threading
+import uuid
+from collections import namedtuple
+
+DEFAULT_OUTBOX_PATH = 'bina_refinery_log.outbox.db'
+RETRY_INTERVAL = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    area TEXT NOT NULL,
+    parameter TEXT NOT NULL,
+    value REAL NOT NULL,
+    unit TEXT,
+    ts TEXT NOT NULL,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    area TEXT NOT NULL,
+    parameter TEXT,
+    ts TEXT NOT NULL,
+    engine TEXT,
+    fallback TEXT,
+    audio BLOB NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    unrecognized INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+"""
+
+# ``rows`` are in ``COLUMNS`` order and ``keys`` parallel to them
+ReadingBatch = namedtuple('ReadingBatch', ['ids', 'rows', 'keys'])
+
+# ``audio`` is an ``sr.AudioData``; ``engine`` and ``fallback`` are the ones the operator had picked
+Recording = namedtuple('Recording', ['id', 'key', 'area', 'parameter', 'timestamp', 'engine', 'fallback', 'audio',
+                                     'attempts'])
+
+OutboxState = namedtuple('OutboxState', ['readings', 'recordings', 'unrecognized'])
+
+
+def new_key():
+    """A fresh idempotency key"""
+    return uuid.uuid4().hex
+
+
+class Outbox:
+    """Readings and recordings waiting to be stored, in a SQLite file"""
+
+    def __init__(self, path=DEFAULT_OUTBOX_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def put_readings(self, rows, keys=None):
+        """Keep readings given in ``COLUMNS`` order; returns their keys, made up where missing"""
+        keys = [key or new_key() for key in (keys or [None] * len(rows))]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO readings (key, area, parameter, value, unit, ts, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(key, *row) for key, row in zip(keys, rows)],
+            )
+        return keys
+
+    def take_readings(self, limit):
+        """The oldest readings, at most ``limit``, as a ``ReadingBatch``; they stay until ``drop_readings``"""
+        rows = self._connect().execute(
+            "SELECT id, key, area, parameter, value, unit, ts, status FROM readings ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        return ReadingBatch([row[0] for row in rows], [row[2:] for row in rows], [row[1] for row in rows])
+
+    def drop_readings(self, ids):
+        """Forget readings that are now committed to the log store"""
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM readings WHERE id = ?", [(i,) for i in ids])
+
+    def put_recording(self, area, parameter, timestamp, audio, engine=None, fallback=None, key=None):
+        """Keep an utterance for recognition later and return its key"""
+        key = key or new_key()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO recordings (key, area, parameter, ts, engine, fallback, audio) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, area, parameter, timestamp, engine, fallback, audio.get_wav_data()),
+            )
+        return key
+
+    def recordings(self, limit=None):
+        """Recordings still to be recognized, oldest first"""
+        import speech_recognition as sr
+        rows = self._connect().execute(
+            "SELECT id, key, area, parameter, ts, engine, fallback, audio, attempts FROM recordings "
+            "WHERE unrecognized = 0 ORDER BY id LIMIT ?", (-1 if limit is None else limit,)
+        ).fetchall()
+        recordings = []
+        for row in rows:
+            with sr.AudioFile(io.BytesIO(row[7])) as source:
+                audio = sr.Recognizer().record(source)
+            recordings.append(Recording(*row[:7], audio, row[8]))
+        return recordings
+
+    def resolve_recording(self, recording_id, rows, keys):
+        """Replace a transcribed recording with the readings it was heard as"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO readings (key, area, parameter, value, unit, ts, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(key, *row) for key, row in zip(keys, rows)],
+            )
+            conn.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+
+    def note_failure(self, recording_id, error, unrecognized=False):
+        """Count a failed attempt; an ``unrecognized`` recording is kept but not retried"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE recordings SET attempts = attempts + 1, last_error = ?, unrecognized = ? WHERE id = ?",
+                (str(error), int(unrecognized), recording_id),
+            )
+
+    def state(self):
+        """Return an ``OutboxState`` with what is waiting"""
+        conn = self._connect()
+        readings = conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        recordings, unrecognized = conn.execute(
+            "SELECT COUNT(*) - COALESCE(SUM(unrecognized), 0), COALESCE(SUM(unrecognized), 0) FROM recordings"
+        ).fetchone()
+        return OutboxState(readings, recordings, unrecognized)
+
+
+class RecordingRetrier:
+    """Background thread that transcribes kept recordings once a recognizer is reachable"""
+
+    def __init__(self, outbox, queue, interval=RETRY_INTERVAL, clips=None):
+        self.outbox = outbox
+        self.queue = queue
+        self.clips = clips
+        self.interval = interval
+        self.last_error = None
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='recording-retrier', daemon=True)
+        self._thread.start()
+
+    def request(self):
+        """Retry now instead of at the next interval"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.retry()
+            except Exception as e:
+                self.last_error = e
+
+    def retry(self):
+        """Transcribe the kept recordings in order; returns how many turned into readings"""
+        import speech_recognition as sr
+        from logbook.pipeline import phrases, readings_from_text
+        from logbook.speech import recognize
+
+        recognizer = sr.Recognizer()
+        resolved = 0
+        for recording in self.outbox.recordings():
+            try:
+                words = phrases(recording.area, recording.parameter)
+            except ValueError as e:
+                # Its area left the registry; retrying cannot help and would hold up the recordings after it
+                self.outbox.note_failure(recording.id, e, unrecognized=True)
+                continue
+            try:
+                result = recognize(recognizer, recording.audio, recording.engine, recording.fallback, words)
+            except sr.RequestError as e:
+                # Still unreachable; later recordings wait their turn
+                self.outbox.note_failure(recording.id, e)
+                self.last_error = e
+                break
+            except sr.UnknownValueError as e:
+                self.outbox.note_failure(recording.id, str(e) or "Could not understand audio", unrecognized=True)
+                continue
+            try:
+                rows, _, _ = readings_from_text(recording.area, recording.parameter, result.text, recording.timestamp)
+            except Exception as e:
+                # e.g. its parameter left the registry; keep it for the operator without holding up the rest
+                self.outbox.note_failure(recording.id, e, unrecognized=True)
+                continue
+            if rows and self.clips is not None:
+                self.clips.save(recording.key, recording.audio, recording.area, recording.parameter,
+                                recording.timestamp, result)
+            self.outbox.resolve_recording(recording.id, rows, [f"{recording.key}:{row[1]}" for row in rows])
+            resolved += 1
+        else:
+            self.last_error = None
+        if resolved:
+            self.queue.replay()
+        return resolved
+
+
+_outbox = None
+_retrier = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """Return the process-wide outbox, or None if ``LOGBOOK_OUTBOX=0``"""
+    global _outbox
+    if os.environ.get('LOGBOOK_OUTBOX', '1') == '0':
+        return None
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox(os.environ.get('LOGBOOK_OUTBOX_PATH', DEFAULT_OUTBOX_PATH))
+        return _outbox
+
+
+def get_recording_retrier():
+    """Return the process-wide recording retrier, or None without an outbox"""
+    global _retrier
+    outbox = get_outbox()
+    if outbox is None:
+        return None
+    from logbook.clips import get_clip_store
+    from logbook.writer import get_write_queue
+    queue = get_write_queue()
+    clips = get_clip_store()
+    with _outbox_lock:
+        if _retrier is None:
+            _retrier = RecordingRetrier(outbox, queue, float(os.environ.get('LOGBOOK_OUTBOX_RETRY', RETRY_INTERVAL)),
+                                        clips)
+        return _retrier
@@ -0,0 +1,212 @@
+"""Areas of the refinery and the parameters logged for each, with their limits.
+
+The registry is read from the file named by ``LOGBOOK_PARAMETERS`` (default
+the bundled ``assets/parameters.json``); ``.yaml``/``.yml`` files work too
+when PyYAML is installed. Both map each area to its parameters:
+
+    {"Area 1 - Crude Processing": {"Pressure": {"min": 1, "max": 3, "unit": "bar"}}}
+
+The file is compiled into a ``ParameterRegistry`` where every parameter of
+an area is a tag with an integer id and the limits live in arrays indexed
+by it, so a batch of readings is checked with a single comparison.
+
+``get_registry()`` notices when the file changes and recompiles it, so
+limits can be edited for a new campaign without restarting the server. A
+broken edit keeps the previous registry in use and is reported by
+``registry_error()``.
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from collections.abc import Mapping
+
+DEFAULT_PARAMETERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'parameters.json')
+
+# How often, in seconds, the file's modification time is checked
+RELOAD_INTERVAL = 1.0
+
+STATUSES = ("Normal", "Below Range", "Above Range")
+
+Tag = namedtuple('Tag', ['id', 'area', 'name', 'min', 'max', 'unit'])
+
+
+def check_value_range(value, min_val, max_val):
+    """Check if value is within range and return status"""
+    if value < min_val:
+        return "Below Range"
+    elif value > max_val:
+        return "Above Range"
+    return "Normal"
+
+
+class ParameterRegistry:
+    """Compiled, read-only set of tags.
+
+    Tags of one area have consecutive ids, in the order of the file.
+    ``minimum``, ``maximum`` and ``area_ids`` are numpy arrays indexed by tag id.
+    """
+
+    def __init__(self, area_parameters, version=None):
+        import numpy as np
+
+        names, area_ids, minimum, maximum, units = [], [], [], [], []
+        self._ids = {}
+        self._area_tags = {}
+        for area_id, (area, parameters) in enumerate(area_parameters.items()):
+            if not isinstance(parameters, Mapping) or not parameters:
+                raise ValueError(f"Area {area!r} must map parameter names to their limits")
+            start = len(names)
+            for name, limits in parameters.items():
+                try:
+                    low, high, unit = float(limits['min']), float(limits['max']), str(limits['unit'])
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError(f"{area} / {name}: needs numeric 'min' and 'max' and a 'unit'")
+                if low > high:
+                    raise ValueError(f"{area} / {name}: min {low:g} is above max {high:g}")
+                self._ids[area, name] = len(names)
+                names.append(name)
+                area_ids.append(area_id)
+                minimum.append(low)
+                maximum.append(high)
+                units.append(unit)
+            self._area_tags[area] = range(start, len(names))
+        self.version = version
+        self.areas = tuple(area_parameters)
+        self.names = tuple(names)
+        self.units = tuple(units)
+        self.area_ids = np.array(area_ids, dtype=np.int32)
+        self.minimum = np.array(minimum, dtype=np.float64)
+        self.maximum = np.array(maximum, dtype=np.float64)
+        self._all_names = tuple(sorted(set(names)))
+        self._dict = None
+        self._frame = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def tag_id(self, area, parameter):
+        """Id of a parameter of an area, or None if the registry has no such tag"""
+        return self._ids.get((area, parameter))
+
+    def tag(self, tag_id):
+        return Tag(tag_id, self.areas[self.area_ids[tag_id]], self.names[tag_id],
+                   float(self.minimum[tag_id]), float(self.maximum[tag_id]), self.units[tag_id])
+
+    def tags(self, area):
+        """The tags of one area, in the order of the file"""
+        return [self.tag(tag_id) for tag_id in self._area_tags[area]]
+
+    def parameter_names(self, area=None):
+        """Parameter names of one area, or the sorted distinct names of every area"""
+        if area is None:
+            return self._all_names
+        return self.names[self._area_tags[area].start:self._area_tags[area].stop]
+
+    def check(self, tag_ids, values):
+        """Return an array of indexes into ``STATUSES`` for readings of the given tags"""
+        import numpy as np
+        tag_ids = np.asarray(tag_ids, dtype=np.intp)
+        values = np.asarray(values, dtype=np.float64)
+        return (values < self.minimum[tag_ids]) * 1 + (values > self.maximum[tag_ids]) * 2
+
+    def status(self, tag_id, value):
+        """Range status of one reading, as ``check_value_range`` reports it"""
+        return check_value_range(value, self.minimum[tag_id], self.maximum[tag_id])
+
+    def limits_frame(self):
+        """Limits as a DataFrame with ``Area``, ``Parameter``, ``Min``, ``Max`` and ``LimitUnit``"""
+        if self._frame is None:
+            import pandas as pd
+            self._frame = pd.DataFrame({
+                'Area': [self.areas[area_id] for area_id in self.area_ids],
+                'Parameter': self.names,
+                'Min': self.minimum,
+                'Max': self.maximum,
+                'LimitUnit': self.units,
+            })
+        return self._frame
+
+    def as_dict(self):
+        """The registry in the nested ``{area: {parameter: {"min", "max", "unit"}}}`` form"""
+        if self._dict is None:
+            self._dict = {
+                area: {tag.name: {'min': tag.min, 'max': tag.max, 'unit': tag.unit} for tag in self.tags(area)}
+                for area in self.areas
+            }
+        return self._dict
+
+
+def load_registry(path):
+    """Read and compile a registry file; raises ValueError if it is invalid"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(f"Reading {path} needs PyYAML; install it with 'pip install pyyaml'")
+            try:
+                data = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path}: {e}")
+        else:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: {e}")
+    if not isinstance(data, Mapping) or not data:
+        raise ValueError(f"{path} must map area names to their parameters")
+    return ParameterRegistry(data, version=(path, os.stat(path).st_mtime_ns))
+
+
+def registry_path():
+    return os.environ.get('LOGBOOK_PARAMETERS', DEFAULT_PARAMETERS_PATH)
+
+
+_registry = None
+_registry_error = None
+_checked_at = 0.0
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the current registry, recompiling it if its file changed"""
+    global _registry, _registry_error, _checked_at
+    if _registry is not None and time.monotonic() - _checked_at < RELOAD_INTERVAL:
+        return _registry
+    with _registry_lock:
+        path = registry_path()
+        try:
+            changed = _registry is None or _registry.version != (path, os.stat(path).st_mtime_ns)
+            if changed:
+                _registry = load_registry(path)
+            _registry_error = None
+        except (OSError, ValueError) as e:
+            if _registry is None:
+                raise
+            # Keep serving the last good registry until the file is fixed
+            _registry_error = e
+        _checked_at = time.monotonic()
+        return _registry
+
+
+def registry_error():
+    """Why the last reload failed, or None if the file in use is current"""
+    return _registry_error
+
+
+class _AreaParameters(Mapping):
+    """Read-only view of the current registry in the nested dict form"""
+
+    def __getitem__(self, area):
+        return get_registry().as_dict()[area]
+
+    def __iter__(self):
+        return iter(get_registry().areas)
+
+    def __len__(self):
+        return len(get_registry().areas)
+
+
+AREA_PARAMETERS = _AreaParameters()
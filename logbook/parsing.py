@@ -0,0 +1,313 @@
+"""Turning transcripts into readings.
+
+Transcripts are split into tokens once; numbers are then read either from
+digit tokens ("123.5", "-4", "1,500", "2,5", "1e5") or from spoken number
+words ("one hundred twenty three point five", "minus four"). Number words
+that do not make up one number, such as "nineteen eighty four", give no
+value rather than their sum. A unit spoken after the
+number and, when the caller passes the candidate names, a parameter name
+are picked up from the same tokens. Plain numeric transcripts, which is
+what most engines return, skip tokenizing altogether.
+"""
+import functools
+import re
+from collections import namedtuple
+
+DictatedReading = namedtuple('DictatedReading', ['parameter', 'value', 'text'])
+
+# ``upper`` is only set for spoken ranges such as "120 to 130"
+ParsedReading = namedtuple('ParsedReading', ['value', 'parameter', 'unit', 'confidence', 'upper'])
+
+_PLAIN_NUMBER = re.compile(r"\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)\s*\.?\s*$")
+# Commas group thousands only in groups of three ("1,500"); otherwise they are a decimal comma ("2,5").
+# A sign set apart from its number ("- 5") is a token of its own.
+_TOKEN = re.compile(r"(?<![\w.])[-+]?(?:\d{1,3}(?:,\d{3})+(?![\d,])(?:\.\d+)?|\d+(?:[.,]\d+)?|\.\d+)(?:e[-+]?\d+)?"
+                    r"|(?<!\S)[-+](?=\s+[\d.a-z])|[a-z]+|[%°/³]")
+_THOUSANDS = re.compile(r"[-+]?\d{1,3}(?:,\d{3})+(?:\.\d+)?$")
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+_SMALL = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14,
+    'fifteen': 15, 'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19,
+}
+_TENS = {
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50, 'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90,
+}
+_SCALES = {'hundred': 100, 'thousand': 1000, 'million': 1000000}
+_SIGNS = {'minus': -1, 'negative': -1, 'plus': 1, 'positive': 1}
+_SIGN_SYMBOLS = {'-': -1, '+': 1}
+_POINT = {'point', 'dot', 'decimal'}
+_RANGE = {'to', 'through'}
+_NUMBER_WORDS = set(_SMALL) | set(_TENS) | set(_SCALES)
+
+# Spoken or written unit -> unit as written in the parameter registry
+_UNIT_ALIASES = {
+    ('°', 'c'): '°C', ('degrees', 'celsius'): '°C', ('degree', 'celsius'): '°C', ('degrees', 'c'): '°C',
+    ('degrees',): '°C', ('celsius',): '°C', ('c',): '°C',
+    ('bar',): 'bar', ('bars',): 'bar',
+    ('bpd',): 'BPD', ('barrels', 'per', 'day'): 'BPD', ('barrels', 'a', 'day'): 'BPD', ('barrels',): 'BPD',
+    ('kg', '/', 'hr'): 'kg/hr', ('kg', '/', 'h'): 'kg/hr', ('kilograms', 'per', 'hour'): 'kg/hr',
+    ('kilos', 'per', 'hour'): 'kg/hr', ('kilograms', 'an', 'hour'): 'kg/hr',
+    ('mw',): 'MW', ('megawatts',): 'MW', ('megawatt',): 'MW',
+    ('%',): '%', ('percent',): '%', ('per', 'cent'): '%',
+    ('ph',): 'pH',
+    ('mg', '/', 'l'): 'mg/L', ('milligrams', 'per', 'liter'): 'mg/L', ('milligrams', 'per', 'litre'): 'mg/L',
+    ('milligram', 'per', 'liter'): 'mg/L', ('milligrams',): 'mg/L',
+    ('m', '³', '/', 'hr'): 'm³/hr', ('m', '³', '/', 'h'): 'm³/hr', ('cubic', 'meters', 'per', 'hour'): 'm³/hr',
+    ('cubic', 'metres', 'per', 'hour'): 'm³/hr', ('cubic', 'meter', 'per', 'hour'): 'm³/hr',
+}
+_MAX_UNIT_TOKENS = max(len(alias) for alias in _UNIT_ALIASES)
+
+
+def _is_digits(token):
+    return token[0].isdigit() or (len(token) > 1 and token[0] in '+-.' and (token[1].isdigit() or token[1] == '.'))
+
+
+def _digits_value(token):
+    """Value of a digit token, reading a comma as a decimal comma unless it groups thousands"""
+    if _THOUSANDS.match(token):
+        return float(token.replace(',', ''))
+    return float(token.replace(',', '.'))
+
+
+def _words_value(words):
+    """Value of a run of number words such as ['one', 'hundred', 'twenty', 'three'].
+
+    Returns None for runs that are not one number, such as "nineteen
+    eighty four" or "twenty five six": adding them up would log a value
+    nobody said.
+    """
+    # "one two three" is read digit by digit
+    if len(words) > 1 and all(_SMALL.get(word, 10) < 10 for word in words):
+        return float(''.join(str(_SMALL[word]) for word in words))
+    total, current = 0, 0
+    # What the words since the last scale said below a hundred: None, 'tens' or 'units'
+    said = None
+    for word in words:
+        if word in _SMALL:
+            # "twenty three", but not "twenty thirteen" or "three four"
+            if said == 'units' or (said == 'tens' and _SMALL[word] >= 10):
+                return None
+            current += _SMALL[word]
+            said = 'units'
+        elif word in _TENS:
+            if said is not None:
+                return None
+            current += _TENS[word]
+            said = 'tens'
+        elif word == 'hundred':
+            if current >= 100:
+                return None
+            current = (current or 1) * 100
+            said = None
+        else:
+            total += (current or 1) * _SCALES[word]
+            current = 0
+            said = None
+    return float(total + current)
+
+
+def _decimal_digits(words):
+    """Digits spoken after "point": "five six" is .56 and "twenty five" is .25; None if unreadable"""
+    if all(_SMALL.get(word, 10) < 10 for word in words):
+        return ''.join(str(_SMALL[word]) for word in words)
+    value = _words_value(words)
+    return None if value is None else str(int(value))
+
+
+def _read_number(tokens, i):
+    """Read the number starting at ``tokens[i]``; returns ``(value, next_index, spoken)`` or None.
+
+    ``value`` is None for number words that do not make one number.
+    """
+    sign = 1
+    if (tokens[i] in _SIGNS or tokens[i] in _SIGN_SYMBOLS) and i + 1 < len(tokens):
+        sign = _SIGNS.get(tokens[i]) or _SIGN_SYMBOLS[tokens[i]]
+        i += 1
+    token = tokens[i]
+
+    if _is_digits(token):
+        value = _digits_value(token)
+        i += 1
+        spoken = False
+    elif token in _NUMBER_WORDS or (token == 'a' and i + 1 < len(tokens) and tokens[i + 1] in _SCALES):
+        words = []
+        while i < len(tokens):
+            word = tokens[i]
+            if word in _NUMBER_WORDS:
+                words.append(word)
+            elif word == 'and' and words and i + 1 < len(tokens) and tokens[i + 1] in _NUMBER_WORDS:
+                pass
+            elif word == 'a' and i + 1 < len(tokens) and tokens[i + 1] in _SCALES:
+                pass
+            else:
+                break
+            i += 1
+        value = _words_value(words)
+        if value is None:
+            return None, i, True
+        spoken = True
+    elif token in _POINT and i + 1 < len(tokens) and (tokens[i + 1] in _SMALL or tokens[i + 1] in _TENS):
+        # "point five"; the decimals are read below
+        value = 0.0
+        spoken = True
+    else:
+        return None
+
+    # A scale after digits, as in "1.5 thousand"
+    if i < len(tokens) and tokens[i] in _SCALES and not spoken:
+        value *= _SCALES[tokens[i]]
+        i += 1
+    if i + 1 < len(tokens) and tokens[i] in _POINT:
+        decimals = []
+        j = i + 1
+        while j < len(tokens) and (tokens[j] in _SMALL or tokens[j] in _TENS):
+            decimals.append(tokens[j])
+            j += 1
+        if decimals:
+            digits = _decimal_digits(decimals)
+            if digits is None:
+                return None, j, True
+            value = float(f"{int(value)}.{digits}")
+            spoken = True
+            i = j
+    elif i + 2 < len(tokens) and tokens[i:i + 3] == ['and', 'a', 'half']:
+        value += 0.5
+        i += 3
+    return sign * value, i, spoken
+
+
+def _read_unit(tokens, i):
+    for length in range(min(_MAX_UNIT_TOKENS, len(tokens) - i), 0, -1):
+        unit = _UNIT_ALIASES.get(tuple(tokens[i:i + length]))
+        if unit is not None:
+            return unit, i + length
+    return None, i
+
+
+@functools.lru_cache(maxsize=256)
+def _parameter_pattern(names):
+    """Compiled name pattern plus a lookup from normalized match to name"""
+    return _name_pattern(names), {_name_key(name): name for name in names}
+
+
+@functools.lru_cache(maxsize=256)
+def vocabulary(parameters):
+    """Every word the parser reads in a transcript about ``parameters``, a tuple of names.
+
+    That is the words of the names plus number words, signs, the decimal
+    point, range words and spoken units, sorted. A recognizer limited to
+    them cannot hear anything the parser would not understand.
+    """
+    words = _NUMBER_WORDS | set(_SIGNS) | _POINT | _RANGE | {'a', 'and', 'between'}
+    words.update(token for alias in _UNIT_ALIASES for token in alias if token.isalpha())
+    for name in parameters:
+        words.update(_NON_WORD.sub(' ', name.lower()).split())
+    return tuple(sorted(words))
+
+
+def tokenize(text):
+    """Split a transcript into lower-case number, word and unit-symbol tokens"""
+    return _TOKEN.findall(text.lower())
+
+
+def parse_reading(text, parameters=None):
+    """Parse a transcript into a ``ParsedReading``.
+
+    ``parameters`` is an optional sequence of parameter names to look for.
+    ``value`` is None when no number was found. ``confidence`` runs from 0 to
+    1 and drops for spoken numbers, for extra numbers that make the reading
+    ambiguous, and for ranges.
+    """
+    parameter = None
+    if parameters:
+        pattern, names = _parameter_pattern(tuple(parameters))
+        match = pattern.search(text)
+        if match:
+            parameter = names[_name_key(match.group(1))]
+            text = text[:match.start()] + ' ' + text[match.end():]
+
+    plain = _PLAIN_NUMBER.match(text)
+    if plain:
+        return ParsedReading(float(plain.group(1)), parameter, None, 1.0, None)
+
+    tokens = tokenize(text)
+    numbers = []
+    i = 0
+    while i < len(tokens):
+        number = _read_number(tokens, i)
+        if number is None:
+            i += 1
+            continue
+        value, i, spoken = number
+        if value is None:
+            # Better no value than a sum of words nobody meant as one number
+            return ParsedReading(None, parameter, None, 0.0, None)
+        unit, i = _read_unit(tokens, i)
+        numbers.append((value, unit, spoken, i))
+
+    if not numbers:
+        return ParsedReading(None, parameter, None, 0.0, None)
+
+    value, unit, spoken, end = numbers[0]
+    confidence = 0.9 if spoken else 1.0
+    upper = None
+    if len(numbers) > 1:
+        following = numbers[1]
+        # "120 to 130" or "between 120 and 130"
+        if end < len(tokens) and (tokens[end] in _RANGE or (tokens[end] == 'and' and 'between' in tokens)):
+            upper = following[0]
+            unit = unit or following[1]
+            confidence *= 0.6
+        else:
+            confidence *= 0.5
+    if unit is None:
+        for _, other_unit, _, _ in numbers[1:]:
+            unit = unit or other_unit
+    return ParsedReading(value, parameter, unit, round(confidence, 3), upper)
+
+
+def extract_numeric_value(text):
+    """Extract numeric value from text, written in digits or spoken as words"""
+    return parse_reading(text).value
+
+
+def _name_key(name):
+    return _NON_WORD.sub('', name.lower())
+
+
+def _name_pattern(names):
+    # Longest names first so "Bottom Temperature" wins over "Temperature"
+    alternatives = []
+    for name in sorted(names, key=len, reverse=True):
+        words = _NON_WORD.sub(' ', name.lower()).split()
+        alternatives.append(r'[^0-9a-z]*'.join(re.escape(word) for word in words))
+    return re.compile(r'\b(' + '|'.join(alternatives) + r')\b', re.IGNORECASE)
+
+
+def parse_dictation(text, parameters):
+    """Split one utterance covering several parameters into readings.
+
+    ``parameters`` are the parameter names of the current area. The text is
+    cut at every spoken parameter name and the value for that parameter is
+    looked for up to the next name, so "top temperature 120, feed rate 1500"
+    gives two readings. Returns ``(readings, missing)`` where ``missing`` lists
+    the names that were spoken without a usable value. A parameter spoken
+    twice keeps its last value.
+    """
+    pattern, names = _parameter_pattern(tuple(parameters))
+    matches = list(pattern.finditer(text))
+
+    readings = {}
+    for i, match in enumerate(matches):
+        name = names[_name_key(match.group(1))]
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        segment = text[match.end():end].strip(' ,;.')
+        value = extract_numeric_value(segment)
+        if value is not None:
+            readings[name] = DictatedReading(name, value, segment)
+        else:
+            readings.setdefault(name, None)
+    missing = [name for name, reading in readings.items() if reading is None]
+    return [reading for reading in readings.values() if reading is not None], missing
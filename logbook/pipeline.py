@@ -0,0 +1,395 @@
+"""Voice entry as a pipeline of capture, recognition and commit stages.
+
+Each stage runs on its own threads and hands work to the next through a
+bounded queue, so the microphone can record the next reading while the
+previous one is still being recognized and written:
+
+    capture (1 thread) -> recognize (``workers`` threads) -> commit (1 thread)
+
+When recognition falls behind, the queue in front of it fills up and
+capture waits instead of piling up audio; ``state`` then reads
+``'waiting'``. Outcomes are collected until the Streamlit script drains
+them on its next run; the pipeline never touches session state itself.
+
+A request records one utterance for one parameter, or for every parameter
+of an area when none is given. A round keeps recording utterances for an
+area until it is stopped, so an operator walking the plant can dictate
+readings back to back.
+
+Every outcome carries how long it spent in each stage, and ``stats()``
+summarizes the recent ones. Listeners hear of every outcome and change of
+``state`` as it happens, so the app can refresh a session only then.
+"""
+import itertools
+import queue
+import statistics
+import threading
+import time
+from collections import deque, namedtuple
+
+from logbook import metrics
+from logbook.outbox import new_key
+from logbook.parameters import get_registry
+from logbook.parsing import parse_dictation, parse_reading
+from logbook.speech import recognize
+from logbook.storage import now_timestamp
+from logbook.writer import get_write_queue
+
+STAGES = ('capture', 'wait', 'recognize', 'commit', 'total')
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 4
+MAX_SAMPLES = 500
+
+# A round stops by itself when nobody has collected its outcomes for this long, e.g. the tab was closed
+ROUND_IDLE_SECONDS = 60
+
+# ``timestamp`` is when the utterance was recorded, which is also the time the reading is logged at;
+# ``captured`` is the ``perf_counter`` time recording ended
+Utterance = namedtuple('Utterance', ['id', 'area', 'parameter', 'audio', 'timestamp', 'captured', 'timings'])
+
+# ``error_kind`` is 'microphone', 'timeout', 'unknown', 'request', 'deferred' or 'error' when ``error`` is set;
+# 'deferred' means no recognizer was reachable and the recording was kept in the outbox.
+# ``timings`` maps stages to milliseconds; 'total' runs from the end of the utterance to the write queue
+Outcome = namedtuple('Outcome', ['id', 'area', 'parameter', 'result', 'rows', 'tickets', 'missing', 'notes',
+                                 'error', 'error_kind', 'timings'])
+
+
+def _check_registered(registry, area, parameter=None):
+    # Recordings and clips outlive registry reloads that may drop their area or parameter
+    if area not in registry.areas:
+        raise ValueError(f"{area} is no longer in the parameter registry")
+    if parameter is not None and registry.tag_id(area, parameter) is None:
+        raise ValueError(f"{area} / {parameter} is no longer in the parameter registry")
+
+
+def readings_from_text(area, parameter, text, timestamp=None):
+    """Parse a transcript into validated readings.
+
+    With a ``parameter`` the transcript is one value for it; otherwise it
+    may name any parameters of the area. Returns ``(rows, missing, notes)``:
+    rows in ``COLUMNS`` order, parameters heard without a value, and
+    warnings for the operator. Raises ``ValueError`` if the registry has no
+    such area or parameter.
+    """
+    registry = get_registry()
+    _check_registered(registry, area, parameter)
+    timestamp = timestamp or now_timestamp()
+    rows, missing, notes = [], [], []
+    if parameter is not None:
+        tag = registry.tag(registry.tag_id(area, parameter))
+        with metrics.timed('logbook_parse_seconds', kind='reading'):
+            parsed = parse_reading(text, [parameter])
+        if parsed.upper is not None:
+            notes.append(f"Heard a range ({parsed.value} to {parsed.upper}); logging {parsed.value}. "
+                         "Say a single value to log a different one.")
+        if parsed.unit and parsed.unit != tag.unit:
+            notes.append(f"Heard the unit {parsed.unit}, but {parameter} is logged in {tag.unit}")
+        if parsed.value is not None:
+            rows.append((area, parameter, parsed.value, tag.unit, timestamp, registry.status(tag.id, parsed.value)))
+    else:
+        tags = {tag.name: tag for tag in registry.tags(area)}
+        with metrics.timed('logbook_parse_seconds', kind='dictation'):
+            readings, missing = parse_dictation(text, tags)
+        for reading in readings:
+            tag = tags[reading.parameter]
+            rows.append((area, reading.parameter, reading.value, tag.unit, timestamp,
+                         registry.status(tag.id, reading.value)))
+    return rows, missing, notes
+
+
+def phrases(area, parameter=None):
+    """Parameter names an utterance for ``parameter``, or for any parameter of ``area``, may contain"""
+    if parameter is not None:
+        return (parameter,)
+    registry = get_registry()
+    _check_registered(registry, area)
+    return tuple(tag.name for tag in registry.tags(area))
+
+
+def commit_text(area, parameter, text, timestamp=None, key=None):
+    """Parse a transcript with ``readings_from_text`` and queue its readings for writing.
+
+    Returns ``(rows, tickets, missing, notes)`` with the write tickets of
+    the rows queued. With a ``key`` the readings are stored under the
+    idempotency keys ``"<key>:<parameter>"``, which is how a clip is linked
+    to them.
+    """
+    rows, missing, notes = readings_from_text(area, parameter, text, timestamp)
+    keys = [f"{key}:{row[1]}" for row in rows] if key else None
+    tickets = get_write_queue().submit_many(rows, keys=keys) if rows else []
+    return rows, tickets, missing, notes
+
+
+class VoicePipeline:
+    """Capture, recognition and commit stages for one microphone"""
+
+    def __init__(self, audio_session, engine=None, fallback=None, workers=DEFAULT_WORKERS,
+                 max_pending=DEFAULT_MAX_PENDING, listen_timeout=5, outbox=None, clips=None, grammar=True):
+        self.audio_session = audio_session
+        # Keeps recordings no recognizer could take, to be logged once one is reachable
+        self.outbox = outbox
+        # Keeps the recording of every utterance that logged readings
+        self.clips = clips
+        # Read by the recognizer threads for every utterance, so they can be changed at any time
+        self.engine = engine
+        self.fallback = fallback
+        # Constrain recognition to the parameter names, numbers and units an utterance can contain
+        self.grammar = grammar
+        self.listen_timeout = listen_timeout
+        self.state = 'idle'
+        self.last_error = None
+        self._listeners = []
+        self._ids = itertools.count(1)
+        self._requests = queue.Queue(maxsize=max_pending)
+        self._recognize = queue.Queue(maxsize=max_pending)
+        self._commit = queue.Queue(maxsize=max_pending)
+        self._outcomes = queue.Queue()
+        self._round = None
+        self._collected_at = time.monotonic()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._samples = {stage: deque(maxlen=MAX_SAMPLES) for stage in STAGES}
+        self._samples_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = [threading.Thread(target=self._capture_loop, name='voice-capture', daemon=True)]
+        self._threads += [threading.Thread(target=self._recognize_loop, name=f'voice-recognize-{i}', daemon=True)
+                          for i in range(workers)]
+        self._threads.append(threading.Thread(target=self._commit_loop, name='voice-commit', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def add_listener(self, callback):
+        """Call ``callback()`` when an outcome is ready or ``state`` changes; it runs on the pipeline's threads"""
+        self._listeners.append(callback)
+
+    def request(self, area, parameter=None):
+        """Record one utterance for ``parameter`` of ``area``, or for the whole area.
+
+        Returns False without queueing anything if too many requests are
+        already waiting for the microphone.
+        """
+        self._started()
+        try:
+            self._requests.put_nowait((area, parameter))
+        except queue.Full:
+            self._done()
+            return False
+        return True
+
+    def start_round(self, area):
+        """Keep recording utterances for ``area`` until ``stop_round``"""
+        self._collected_at = time.monotonic()
+        self._round = area
+
+    def stop_round(self):
+        self._round = None
+
+    @property
+    def round_area(self):
+        """Area of the round in progress, or None"""
+        return self._round
+
+    @property
+    def busy(self):
+        """Whether any utterance is being recorded or processed"""
+        return not self.closed and (self._round is not None or self._in_flight > 0)
+
+    def collect(self):
+        """Return the outcomes finished since the last call, oldest first"""
+        self._collected_at = time.monotonic()
+        outcomes = []
+        while True:
+            try:
+                outcomes.append(self._outcomes.get_nowait())
+            except queue.Empty:
+                return outcomes
+
+    def stats(self):
+        """Per-stage latency in milliseconds of recent outcomes: count, median, p95 and max"""
+        summary = {}
+        with self._samples_lock:
+            samples_by_stage = {stage: sorted(samples) for stage, samples in self._samples.items()}
+        for stage, samples in samples_by_stage.items():
+            if samples:
+                summary[stage] = {
+                    'count': len(samples),
+                    'median_ms': statistics.median(samples),
+                    'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                    'max_ms': samples[-1],
+                }
+        return summary
+
+    @property
+    def closed(self):
+        """Whether the pipeline was closed; a closed one takes no more requests"""
+        return self._stopped.is_set()
+
+    def close(self):
+        """Stop every stage; utterances still in flight are dropped"""
+        self._round = None
+        self._stopped.set()
+
+    def _changed(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                # A broken listener must not stop the stage that called it
+                self.last_error = e
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self._changed()
+
+    def _started(self):
+        with self._in_flight_lock:
+            self._in_flight += 1
+
+    def _done(self):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def _finished(self, outcome):
+        with self._samples_lock:
+            for stage, ms in outcome.timings.items():
+                self._samples[stage].append(ms)
+        for stage, ms in outcome.timings.items():
+            if stage == 'total':
+                metrics.observe('logbook_entry_seconds', ms / 1000)
+            else:
+                metrics.observe('logbook_voice_stage_seconds', ms / 1000, stage=stage)
+        self._outcomes.put(outcome)
+        self._done()
+        self._changed()
+
+    def _fail(self, utterance_id, area, parameter, error, kind, timings):
+        self._finished(Outcome(utterance_id, area, parameter, None, [], [], [], [], error, kind, timings))
+
+    def _put(self, stage_queue, item):
+        # Blocks while the next stage is behind; this is the pipeline's backpressure
+        while not self._stopped.is_set():
+            try:
+                stage_queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, stage_queue):
+        while not self._stopped.is_set():
+            try:
+                return stage_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return None
+
+    def _next_target(self):
+        try:
+            return self._requests.get(timeout=0.2), False
+        except queue.Empty:
+            pass
+        area = self._round
+        if area is not None and time.monotonic() - self._collected_at > ROUND_IDLE_SECONDS:
+            self._round = area = None
+        if area is None:
+            return None, False
+        self._started()
+        return (area, None), True
+
+    def _capture_loop(self):
+        import speech_recognition as sr
+        while not self._stopped.is_set():
+            target, in_round = self._next_target()
+            if target is None:
+                # Not between the silences of a round: every change of state reruns the page, whose collect()
+                # would keep an abandoned round alive
+                self._set_state('idle')
+                continue
+            area, parameter = target
+            utterance_id = next(self._ids)
+            self._set_state('listening' if self.audio_session.calibrated else 'calibrating')
+            started = time.perf_counter()
+            try:
+                audio = self.audio_session.listen(timeout=self.listen_timeout,
+                                                  phrase_time_limit=5 if parameter else 20)
+            except sr.WaitTimeoutError:
+                if in_round:
+                    # Silence between readings of a round is expected
+                    self._done()
+                else:
+                    self._fail(utterance_id, area, parameter, "Nothing was heard", 'timeout', {})
+                continue
+            except Exception as e:
+                # A round cannot go on without a microphone
+                self._round = None
+                self._fail(utterance_id, area, parameter, str(e), 'microphone', {})
+                continue
+            captured = time.perf_counter()
+            utterance = Utterance(utterance_id, area, parameter, audio, now_timestamp(), captured,
+                                  {'capture': (captured - started) * 1000})
+            self._set_state('waiting')
+            if not self._put(self._recognize, utterance):
+                return
+
+    def _recognize_loop(self):
+        import speech_recognition as sr
+        while True:
+            utterance = self._get(self._recognize)
+            if utterance is None:
+                return
+            timings = utterance.timings
+            started = time.perf_counter()
+            timings['wait'] = (started - utterance.captured) * 1000
+            try:
+                result = recognize(self.audio_session.recognizer, utterance.audio, engine=self.engine,
+                                   fallback=self.fallback,
+                                   phrases=phrases(utterance.area, utterance.parameter) if self.grammar else None)
+            except sr.UnknownValueError:
+                self._fail(utterance.id, utterance.area, utterance.parameter,
+                           "Could not understand audio", 'unknown', timings)
+                continue
+            except sr.RequestError as e:
+                if self.outbox is not None and self._defer(utterance):
+                    self._fail(utterance.id, utterance.area, utterance.parameter, str(e), 'deferred', timings)
+                else:
+                    self._fail(utterance.id, utterance.area, utterance.parameter, str(e), 'request', timings)
+                continue
+            except Exception as e:
+                self._fail(utterance.id, utterance.area, utterance.parameter, str(e), 'error', timings)
+                continue
+            timings['recognize'] = (time.perf_counter() - started) * 1000
+            if not self._put(self._commit, (utterance, result)):
+                return
+
+    def _defer(self, utterance):
+        try:
+            self.outbox.put_recording(utterance.area, utterance.parameter, utterance.timestamp, utterance.audio,
+                                      self.engine, self.fallback)
+        except Exception:
+            return False
+        return True
+
+    def _commit_loop(self):
+        while True:
+            item = self._get(self._commit)
+            if item is None:
+                return
+            utterance, result = item
+            timings = utterance.timings
+            started = time.perf_counter()
+            key = new_key() if self.clips is not None else None
+            try:
+                rows, tickets, missing, notes = commit_text(utterance.area, utterance.parameter, result.text,
+                                                            utterance.timestamp, key)
+            except Exception as e:
+                self._fail(utterance.id, utterance.area, utterance.parameter, str(e), 'error', timings)
+                continue
+            if rows and key:
+                self.clips.save(key, utterance.audio, utterance.area, utterance.parameter, utterance.timestamp,
+                                result)
+            finished = time.perf_counter()
+            timings['commit'] = (finished - started) * 1000
+            timings['total'] = (finished - utterance.captured) * 1000
+            self._finished(Outcome(utterance.id, utterance.area, utterance.parameter, result, rows, tickets,
+                                   missing, notes, None, None, timings))
@@ -0,0 +1,61 @@
+"""Opt-in profiling of single Streamlit script runs.
+
+A session that switches profiling on gets each of its script runs profiled
+with cProfile, or with pyinstrument when it is installed and chosen. The
+report of the latest run is kept for the sidebar together with a file to
+download: a ``.prof`` for snakeviz or ``pstats``, or pyinstrument's HTML.
+
+Only the script thread is profiled; the voice pipeline and write queue
+threads show up in ``logbook.metrics`` instead.
+"""
+import io
+import marshal
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def available_profilers():
+    """Profilers usable in this environment"""
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:
+        return PROFILERS[:1]
+    return PROFILERS
+
+
+class RunProfiler:
+    """Profiles the calling thread between ``start`` and ``stop``"""
+
+    def __init__(self, engine='cprofile'):
+        if engine not in PROFILERS:
+            raise ValueError(f"Unknown profiler {engine!r}; choose from {PROFILERS}")
+        self.engine = engine
+        self._profiler = None
+
+    @property
+    def running(self):
+        return self._profiler is not None
+
+    def start(self):
+        if self.engine == 'pyinstrument':
+            from pyinstrument import Profiler
+            self._profiler = Profiler()
+            self._profiler.start()
+        else:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self, limit=25):
+        """Stop profiling and return ``(report text, file name, file bytes)``"""
+        profiler, self._profiler = self._profiler, None
+        if self.engine == 'pyinstrument':
+            profiler.stop()
+            return (profiler.output_text(unicode=True, color=False), 'run.html',
+                    profiler.output_html().encode('utf-8'))
+        import pstats
+        profiler.disable()
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(limit)
+        profiler.create_stats()
+        return text.getvalue(), 'run.prof', marshal.dumps(profiler.stats)
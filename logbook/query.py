@@ -0,0 +1,64 @@
+"""Time-series queries over the log.
+
+The store keeps indexes on (area, parameter, timestamp), (area, timestamp)
+and timestamp, so the lookups here read only the matching index range
+instead of scanning the history:
+
+    from logbook.query import LogQuery
+
+    q = LogQuery()
+    q.last("Area 1 - Crude Processing", "Pressure", n=5)   # five newest, newest first
+    q.shift("Area 2 - Vacuum Processing")                  # the current shift, oldest first
+"""
+from logbook.shifts import shift_at
+from logbook.storage import COLUMNS, TIMESTAMP_FORMAT, get_storage
+
+
+def _timestamp(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+class LogQuery:
+    """Indexed lookups by area, parameter and time window"""
+
+    def __init__(self, storage=None, cache=None):
+        self.storage = storage or get_storage()
+        # A ``LogCache`` of the same store answers repeated lookups until the log changes
+        self.cache = cache
+
+    def _read(self, key, read):
+        return read() if self.cache is None else self.cache.get(key, read)
+
+    def last(self, area=None, parameter=None, n=10):
+        """The ``n`` most recent readings, newest first, optionally of one area or parameter"""
+        return self._read(('last', area, parameter, n),
+                          lambda: self.storage.query(area=area, parameter=parameter, limit=n, newest_first=True))
+
+    def latest(self, area, parameter):
+        """The most recent reading of one parameter, or None"""
+        readings = self.last(area, parameter, n=1)
+        return readings[0] if readings else None
+
+    def window(self, start=None, end=None, area=None, parameter=None, limit=None):
+        """Readings with ``start <= timestamp < end``, oldest first.
+
+        ``start`` and ``end`` may be datetimes or timestamps in the log's
+        format; either may be omitted.
+        """
+        start, end = _timestamp(start), _timestamp(end)
+        return self._read(('window', area, parameter, start, end, limit),
+                          lambda: self.storage.query(area=area, parameter=parameter, start=start, end=end, limit=limit))
+
+    def shift(self, area=None, parameter=None, when=None):
+        """Readings taken during the shift that contains ``when`` (default: now)"""
+        current = shift_at(when)
+        return self.window(current.start, current.end, area=area, parameter=parameter)
+
+    @staticmethod
+    def to_frame(readings):
+        """Turn a list of ``Reading`` tuples into a DataFrame indexed by sequence number"""
+        import pandas as pd
+        df = pd.DataFrame(readings, columns=['seq'] + COLUMNS)
+        return df.set_index('seq').astype({'Value': 'float64'})
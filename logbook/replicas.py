@@ -0,0 +1,195 @@
+"""Several app processes sharing one log store.
+
+One Streamlit process serves every session from its own memory, so a
+single process is the ceiling on how many operators the app can take. To
+go further, run several replicas of the app behind a load balancer and
+point them at the same log store. The store is the only state they share:
+readings, voids, alarms, rollups and clips all live in it, and none of
+the replicas touches the Excel workbook except through the store.
+
+The store doubles as the replicas' notification channel. Every commit
+that adds, voids or restores readings publishes a ``Notification`` on the
+``readings`` or ``corrections`` channel in the same transaction, as does
+recording the alarms they raised on ``alarms``, and anything else can be
+published with ``Notifier.publish``. A ``Notifier``
+per process watches the store and hands new notifications to its
+subscribers; sessions that follow the log are rerun as soon as any
+replica, ingestion endpoint or import logs a reading. Watching costs
+one ``PRAGMA data_version`` per poll, which SQLite answers from the WAL's
+shared memory, so the notifications table is only read after some other
+connection committed. That shared memory is also why replicas must run on
+the host that holds the database file.
+
+Chores that must not run in every replica at once, such as rewriting the
+workbook, are guarded by a lease in the store: the replica holding it does
+the chore and renews the lease; if it dies, another one takes over once
+the lease has run out.
+
+The load balancer must keep each browser on one replica (sticky sessions),
+since a session's state lives in its replica's memory. To start replicas
+on consecutive ports:
+
+    $ python -m logbook.replicas --replicas 4 --port 8501
+
+Replicas started by hand need their own ``LOGBOOK_REPLICA`` name.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_REPLICAS = 2
+DEFAULT_PORT = 8501
+POLL_INTERVAL = 0.25
+
+# How long, in seconds, a replica keeps a chore after it last did it
+LEASE_SECONDS = 60
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bina_refinery_logbook.py')
+
+# ``payload`` is the dict published; ``timestamp`` is when it was
+Notification = namedtuple('Notification', ['id', 'channel', 'payload', 'timestamp'])
+
+
+def replica_id():
+    """Name of this replica: ``LOGBOOK_REPLICA``, or the host and process id"""
+    return os.environ.get('LOGBOOK_REPLICA') or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Notifier:
+    """Background thread that delivers the store's notifications within this process"""
+
+    def __init__(self, storage, interval=POLL_INTERVAL):
+        self.storage = storage
+        self.interval = interval
+        self.last_error = None
+        self._subscribers = []
+        self._cursor = storage.last_notification()
+        self._changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='logbook-notifier', daemon=True)
+        self._thread.start()
+
+    @property
+    def cursor(self):
+        """Number of the newest notification delivered"""
+        return self._cursor
+
+    def subscribe(self, callback, *channels):
+        """Call ``callback(notification)`` for notifications on ``channels``, or on all of them.
+
+        Callbacks run on the notifier's thread and must return quickly.
+        """
+        self._subscribers.append((frozenset(channels), callback))
+
+    def publish(self, channel, **payload):
+        """Publish a notification to every replica, this one included"""
+        self.storage.publish(channel, payload)
+
+    def wait(self, after, timeout=None):
+        """Block until a notification newer than ``after`` is delivered or ``timeout`` passes.
+
+        Returns the number of the newest notification delivered.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._cursor > after, timeout)
+            return self._cursor
+
+    def poll(self):
+        """Deliver the notifications published since the last poll; returns how many"""
+        notifications = self.storage.notifications(self._cursor)
+        for notification in notifications:
+            for channels, callback in list(self._subscribers):
+                if channels and notification.channel not in channels:
+                    continue
+                try:
+                    callback(notification)
+                except Exception as e:
+                    # One broken subscriber must not starve the others
+                    self.last_error = e
+        if notifications:
+            with self._changed:
+                self._cursor = notifications[-1].id
+                self._changed.notify_all()
+        return len(notifications)
+
+    def _run(self):
+        version = None
+        while True:
+            try:
+                current = self.storage.data_version()
+                if current != version:
+                    version = current
+                    self.poll()
+            except Exception as e:
+                self.last_error = e
+            time.sleep(self.interval)
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    """Return the process-wide notifier.
+
+    ``LOGBOOK_NOTIFY_INTERVAL`` sets how often, in seconds, it looks for
+    changes.
+    """
+    global _notifier
+    from logbook.storage import get_storage
+    storage = get_storage()
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = Notifier(storage, float(os.environ.get('LOGBOOK_NOTIFY_INTERVAL', POLL_INTERVAL)))
+        return _notifier
+
+
+def replica_environment(index, base=None):
+    """Environment of the ``index``-th replica started by ``main``"""
+    env = dict(os.environ if base is None else base)
+    env['LOGBOOK_REPLICA'] = f"replica-{index}"
+    # Ports other than Streamlit's are taken once per host
+    if env.get('LOGBOOK_METRICS_PORT'):
+        env['LOGBOOK_METRICS_PORT'] = str(int(env['LOGBOOK_METRICS_PORT']) + index)
+    if index and 'LOGBOOK_INGEST_PORT' in env:
+        # One endpoint is enough; what it stores reaches every replica through the store
+        del env['LOGBOOK_INGEST_PORT']
+    return env
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several replicas of the app on one log store")
+    parser.add_argument('--replicas', type=int, default=DEFAULT_REPLICAS)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port of the first replica")
+    parser.add_argument('--addr', default='127.0.0.1')
+    parser.add_argument('--app', default=APP, help="Streamlit script to run")
+    args = parser.parse_args(argv)
+
+    from logbook.storage import get_storage
+    # Create or migrate the store once, before the replicas race to
+    get_storage()
+    processes = []
+    for index in range(args.replicas):
+        port = args.port + index
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', args.app, '--server.port', str(port),
+             '--server.address', args.addr, '--server.headless', 'true'],
+            env=replica_environment(index),
+        ))
+        print(f"replica-{index} on http://{args.addr}:{port}")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
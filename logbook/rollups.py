@@ -0,0 +1,143 @@
+"""Per-parameter rollups by hour, shift and day.
+
+The store keeps one row per (period, bucket, area, parameter) with count,
+sum, min, max and the latest value. Rows are folded in inside the same
+transaction that appends the readings, so the dashboard reads a handful of
+rollup rows instead of scanning history. Voiding or restoring a reading
+recomputes only the buckets it fell into.
+
+Shift buckets follow the shift hours in effect when a reading is stored;
+after changing ``LOGBOOK_SHIFT_STARTS`` run
+``python -m logbook.rollups --rebuild``.
+"""
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from logbook.shifts import shift_at
+from logbook.storage import TIMESTAMP_FORMAT, get_storage
+
+PERIODS = ('hour', 'shift', 'day')
+
+
+class Rollup(namedtuple('Rollup', ['period', 'bucket', 'area', 'parameter', 'count', 'total',
+                                   'minimum', 'maximum', 'last_value', 'last_timestamp'])):
+    __slots__ = ()
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+def buckets(timestamp):
+    """Return ``(period, bucket_start, bucket_end)`` for each period a timestamp falls in"""
+    hour = timestamp[:13] + ':00:00'
+    day = timestamp[:10] + ' 00:00:00'
+    when = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    shift = shift_at(when)
+    hour_end = datetime.strptime(hour, TIMESTAMP_FORMAT) + timedelta(hours=1)
+    day_end = datetime.strptime(day, TIMESTAMP_FORMAT) + timedelta(days=1)
+    return [
+        ('hour', hour, hour_end.strftime(TIMESTAMP_FORMAT)),
+        ('shift', shift.start.strftime(TIMESTAMP_FORMAT), shift.end.strftime(TIMESTAMP_FORMAT)),
+        ('day', day, day_end.strftime(TIMESTAMP_FORMAT)),
+    ]
+
+
+def aggregate(rows):
+    """Fold rows in ``COLUMNS`` order into per-bucket partial rollups.
+
+    Returns a dict keyed by ``(period, bucket, area, parameter)`` with values
+    ``[count, total, minimum, maximum, last_value, last_timestamp]``.
+    """
+    partials = {}
+    shift_cache = {}
+    for area, parameter, value, _, timestamp, _ in rows:
+        value = float(value)
+        # Readings in the same hour share a shift; avoid re-deriving it per row
+        hour = timestamp[:13]
+        shift_bucket = shift_cache.get(hour)
+        if shift_bucket is None:
+            shift_bucket = shift_cache[hour] = buckets(timestamp)[1][1]
+        for period, bucket in (('hour', hour + ':00:00'), ('shift', shift_bucket), ('day', timestamp[:10] + ' 00:00:00')):
+            key = (period, bucket, area, parameter)
+            partial = partials.get(key)
+            if partial is None:
+                partials[key] = [1, value, value, value, value, timestamp]
+                continue
+            partial[0] += 1
+            partial[1] += value
+            if value < partial[2]:
+                partial[2] = value
+            if value > partial[3]:
+                partial[3] = value
+            if timestamp >= partial[5]:
+                partial[4] = value
+                partial[5] = timestamp
+    return partials
+
+
+def aggregate_frame(frame):
+    """Vectorized ``aggregate`` for a DataFrame with ``COLUMNS``.
+
+    Returns rows ready for the rollup upsert:
+    ``(period, bucket, area, parameter, count, total, minimum, maximum, last_value, last_timestamp)``.
+    """
+    import numpy as np
+    import pandas as pd
+
+    # A stable sort keeps the later of two readings with the same timestamp last
+    if not frame['Timestamp'].is_monotonic_increasing:
+        frame = frame.sort_values('Timestamp', kind='stable')
+    # Readings share timestamps, so the hour is cut from each distinct one rather than from every row
+    codes, timestamps = pd.factorize(frame['Timestamp'])
+    hour = np.array([timestamp[:13] for timestamp in timestamps], dtype=object)[codes]
+    grouped = frame.groupby([hour, 'Area', 'Parameter'], sort=False)
+    hours = grouped['Value'].agg(['count', 'sum', 'min', 'max', 'last'])
+    hours['last_ts'] = grouped['Timestamp'].last()
+    hours = hours.reset_index(names=['hour', 'area', 'parameter'])
+
+    # Shifts and days are whole hours, so they are folded from the far fewer hour rows
+    shift_of_hour = {hour: shift_at(datetime.strptime(hour, '%Y-%m-%d %H')).start.strftime(TIMESTAMP_FORMAT)
+                     for hour in hours['hour'].unique()}
+    periods = {
+        'hour': hours['hour'] + ':00:00',
+        'shift': hours['hour'].map(shift_of_hour),
+        'day': hours['hour'].str.slice(0, 10) + ' 00:00:00',
+    }
+    hours = hours.sort_values('last_ts', kind='stable')
+    rows = []
+    for period, bucket in periods.items():
+        if period == 'hour':
+            folded = hours.assign(bucket=bucket)
+        else:
+            folded = hours.assign(bucket=bucket).groupby(['bucket', 'area', 'parameter'], sort=False).agg(
+                count=('count', 'sum'), sum=('sum', 'sum'), min=('min', 'min'), max=('max', 'max'),
+                last=('last', 'last'), last_ts=('last_ts', 'last'),
+            ).reset_index()
+        rows.extend(zip(
+            [period] * len(folded), folded['bucket'], folded['area'], folded['parameter'],
+            folded['count'].astype(int).tolist(), folded['sum'], folded['min'], folded['max'],
+            folded['last'], folded['last_ts'],
+        ))
+    return rows
+
+
+def latest(period='day', storage=None):
+    """Rollups of the most recent bucket of ``period`` for every parameter"""
+    storage = storage or get_storage()
+    return storage.latest_rollups(period)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the logbook's rollups")
+    parser.add_argument('--rebuild', action='store_true', help="recompute every rollup from the readings")
+    args = parser.parse_args(argv)
+    if args.rebuild:
+        storage = get_storage()
+        storage.rebuild_rollups()
+        print(f"Rebuilt rollups for {storage.count()} readings")
+
+
+if __name__ == '__main__':
+    main()
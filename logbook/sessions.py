@@ -0,0 +1,165 @@
+"""Resources held for one Streamlit session.
+
+A session's microphone and the threads of its voice pipeline have to be
+released when the session ends, but Streamlit has no hook for that: it
+drops the session's state and leaves what was in it to the garbage
+collector, which never collects a pipeline whose threads still run, and
+``weakref.finalize`` only closes the device once nothing refers to it. ``SessionResources``
+keeps such objects by session id and closes them explicitly, when the
+session registers a replacement and when a reaper thread finds that the
+runtime no longer has the session, i.e. its browser went away. A closed
+microphone opens again on its next use and a closed pipeline is replaced,
+should the browser reconnect to the same session.
+
+``rerun_session`` lets background work such as the voice pipeline refresh
+a session when it has something to show, instead of the session's script
+run staying alive to poll for it. ``Wakeups`` does the same for sessions
+following the log, on any page: a run that ends asks to be woken, and the
+next notification of new readings, corrections or alarms reruns every
+session that asked.
+"""
+import threading
+import time
+
+# How often, in seconds, the reaper looks for sessions that have ended
+REAP_INTERVAL = 30
+
+# Notifications that change what a page following the log shows
+WAKE_CHANNELS = ('readings', 'corrections', 'alarms')
+
+
+def session_active(session_id):
+    """Whether the Streamlit runtime still has a browser connected to ``session_id``.
+
+    Without a running server, e.g. under ``AppTest``, every session counts as active.
+    """
+    from streamlit.runtime import Runtime
+    if not Runtime.exists():
+        return True
+    return Runtime.instance().is_active_session(session_id)
+
+
+def rerun_session(session_id):
+    """Rerun the script of ``session_id`` as a click in its browser would; False if it has no browser.
+
+    Safe on any thread. Streamlit has no public call for it; this is what its
+    own file watcher does when the script changes.
+    """
+    from streamlit.runtime import Runtime
+    if not Runtime.exists():
+        return False
+    info = Runtime.instance()._session_mgr.get_active_session_info(session_id)
+    if info is None:
+        return False
+    # The session's last client state keeps the page and widget values its browser has
+    info.session.request_rerun(info.session._client_state)
+    return True
+
+
+class SessionResources:
+    """Objects with a ``close`` method, by session, closed when the session ends or replaces them"""
+
+    def __init__(self, is_active=session_active, interval=REAP_INTERVAL):
+        self.is_active = is_active
+        self.interval = interval
+        self.last_error = None
+        self._resources = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, session_id, name, resource):
+        """Hold ``resource`` as the session's ``name``, closing the one it replaces; returns it"""
+        with self._lock:
+            held = self._resources.setdefault(session_id, {})
+            replaced = held.get(name)
+            held[name] = resource
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='logbook-sessions', daemon=True)
+                self._thread.start()
+        if replaced is not None and replaced is not resource:
+            self._close(replaced)
+        return resource
+
+    def sessions(self):
+        """Ids of the sessions holding resources"""
+        with self._lock:
+            return list(self._resources)
+
+    def release(self, session_id):
+        """Close every resource of the session; returns how many were closed"""
+        with self._lock:
+            held = self._resources.pop(session_id, {})
+        for resource in held.values():
+            self._close(resource)
+        return len(held)
+
+    def reap(self):
+        """Release the resources of sessions that have ended; returns their ids"""
+        ended = [session_id for session_id in self.sessions() if not self.is_active(session_id)]
+        for session_id in ended:
+            self.release(session_id)
+        return ended
+
+    def _close(self, resource):
+        try:
+            resource.close()
+        except Exception as e:
+            # One device failing to close must not keep the others open
+            self.last_error = e
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception as e:
+                self.last_error = e
+
+
+class Wakeups:
+    """Sessions to rerun once when there is news, e.g. a reading logged elsewhere"""
+
+    def __init__(self, rerun=rerun_session):
+        self.rerun = rerun
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    def wait(self, session_id):
+        """Rerun ``session_id`` on the next ``wake``; it must ask again to hear of the one after"""
+        with self._lock:
+            self._sessions.add(session_id)
+
+    def wake(self, notification=None):
+        """Rerun every waiting session; returns their ids. Usable as a ``Notifier`` subscriber"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, set()
+        for session_id in sessions:
+            self.rerun(session_id)
+        return sorted(sessions)
+
+
+_resources = None
+_wakeups = None
+_resources_lock = threading.Lock()
+
+
+def get_session_resources():
+    """Return the process-wide session resources"""
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            _resources = SessionResources()
+        return _resources
+
+
+def get_wakeups():
+    """Return the process-wide wakeups, woken by every notification on ``WAKE_CHANNELS``"""
+    global _wakeups
+    from logbook.replicas import get_notifier
+    notifier = get_notifier()
+    with _resources_lock:
+        if _wakeups is None:
+            _wakeups = Wakeups()
+            # Subscribed here rather than by a page, since a session may open any page first
+            notifier.subscribe(_wakeups.wake, *WAKE_CHANNELS)
+        return _wakeups
@@ -0,0 +1,38 @@
+"""Operator shifts.
+
+Shifts tile the day and start at fixed hours, 06:00, 14:00 and 22:00 unless
+``LOGBOOK_SHIFT_STARTS`` says otherwise. They are lettered from A in order
+of their start hour.
+"""
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# Hours at which shifts begin; override with e.g. LOGBOOK_SHIFT_STARTS=6,18
+DEFAULT_SHIFT_STARTS = (6, 14, 22)
+
+Shift = namedtuple('Shift', ['name', 'start', 'end'])
+
+
+def shift_starts():
+    """Hours of the day at which shifts begin"""
+    configured = os.environ.get('LOGBOOK_SHIFT_STARTS')
+    if not configured:
+        return DEFAULT_SHIFT_STARTS
+    return tuple(sorted(int(hour) for hour in configured.split(',')))
+
+
+def shift_at(when=None):
+    """Return the ``Shift`` (lettered from A) that contains ``when``"""
+    when = when or datetime.now()
+    starts = shift_starts()
+    day = datetime.combine(when.date(), datetime.min.time())
+    # Candidate boundaries from yesterday's last shift to tomorrow's first
+    boundaries = [day - timedelta(days=1) + timedelta(hours=starts[-1])]
+    boundaries += [day + timedelta(hours=hour) for hour in starts]
+    boundaries.append(day + timedelta(days=1, hours=starts[0]))
+    for i in range(len(boundaries) - 1):
+        if boundaries[i] <= when < boundaries[i + 1]:
+            index = starts.index(boundaries[i].hour)
+            return Shift(chr(ord('A') + index), boundaries[i], boundaries[i + 1])
+    raise AssertionError("shift boundaries do not cover the day")
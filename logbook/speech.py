@@ -0,0 +1,229 @@
+"""Pluggable speech recognition engines.
+
+Every engine takes an ``sr.Recognizer`` and the captured ``sr.AudioData`` and
+returns a ``RecognitionResult``. Like ``recognize_google``, engines raise
+``sr.UnknownValueError`` when nothing intelligible was said and
+``sr.RequestError`` when the engine itself is unavailable.
+
+An utterance only ever names parameters and says numbers and units, so
+callers pass the parameter names it may contain as ``phrases``. Vosk then
+decodes against a grammar of just the words the parser understands (see
+``parsing.vocabulary``), which is both faster and harder to mishear, and
+Whisper gets the names as its prompt so it spells them as the registry
+does. Google's free web API takes no hints and ignores them.
+
+Transcripts are cached by a fingerprint of the audio, so the same
+recording heard again, e.g. a test phrase played back or a recording
+retried from the outbox, is not recognized twice. The fingerprint is a
+digest of the 16 kHz samples with the silence around the speech trimmed:
+only the same recording matches, never a different reading of a similar
+phrase. ``LOGBOOK_SPEECH_CACHE`` sets how many transcripts are kept
+(default 256, 0 disables the cache).
+
+The offline engines need their optional packages and a model on disk:
+
+* ``vosk``: ``pip install vosk`` and a model directory in ``LOGBOOK_VOSK_MODEL``
+  (default ``model``), e.g. vosk-model-small-en-us. Only models with a
+  dynamic graph, as the small ones have, can be constrained to a grammar;
+  the others ignore it.
+* ``whisper``: ``pip install faster-whisper``; the model size or path is taken
+  from ``LOGBOOK_WHISPER_MODEL`` (default ``base.en``).
+
+Models are loaded on first use and then kept for the life of the process.
+speech_recognition itself is only imported once audio is recognized, so
+importing this module stays cheap.
+"""
+import functools
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from logbook import metrics
+
+RecognitionResult = namedtuple('RecognitionResult', ['text', 'confidence', 'latency_ms', 'engine'])
+
+DEFAULT_ENGINE = 'google'
+SAMPLE_RATE = 16000
+DEFAULT_CACHE_SIZE = 256
+
+# Samples quieter than this, of 32768, around the speech are not part of the fingerprint
+SILENCE = 300
+
+
+def _recognize_google(recognizer, audio, phrases=None):
+    import speech_recognition as sr
+    response = recognizer.recognize_google(audio, show_all=True)
+    alternatives = response.get('alternative') if isinstance(response, dict) else None
+    if not alternatives:
+        raise sr.UnknownValueError()
+    best = alternatives[0]
+    return best['transcript'], best.get('confidence')
+
+
+@functools.lru_cache(maxsize=None)
+def _vosk_model(path):
+    import speech_recognition as sr
+    try:
+        import vosk
+    except ImportError:
+        raise sr.RequestError("Vosk is not installed; install it with 'pip install vosk'")
+    if not os.path.isdir(path):
+        raise sr.RequestError(f"Vosk model not found at {path!r}; set LOGBOOK_VOSK_MODEL")
+    vosk.SetLogLevel(-1)
+    return vosk.Model(path)
+
+
+def _recognize_vosk(recognizer, audio, phrases=None):
+    import speech_recognition as sr
+    import vosk
+    from logbook.parsing import vocabulary
+
+    model = _vosk_model(os.environ.get('LOGBOOK_VOSK_MODEL', 'model'))
+    if phrases:
+        # Any sequence of the words; anything else is heard as [unk] rather than as a near miss
+        grammar = json.dumps([' '.join(vocabulary(tuple(phrases))), '[unk]'])
+        decoder = vosk.KaldiRecognizer(model, SAMPLE_RATE, grammar)
+    else:
+        decoder = vosk.KaldiRecognizer(model, SAMPLE_RATE)
+    decoder.SetWords(True)
+    decoder.AcceptWaveform(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2))
+    result = json.loads(decoder.FinalResult())
+    words = [word for word in result.get('result', []) if word['word'] != '[unk]']
+    text = ' '.join(word['word'] for word in words) if phrases else result.get('text', '').strip()
+    if not text:
+        raise sr.UnknownValueError()
+    confidence = sum(word['conf'] for word in words) / len(words) if words else None
+    return text, confidence
+
+
+@functools.lru_cache(maxsize=None)
+def _whisper_model(name):
+    import speech_recognition as sr
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError:
+        raise sr.RequestError("faster-whisper is not installed; install it with 'pip install faster-whisper'")
+    return WhisperModel(name, device='cpu', compute_type='int8')
+
+
+def _recognize_whisper(recognizer, audio, phrases=None):
+    import speech_recognition as sr
+    import numpy as np
+
+    model = _whisper_model(os.environ.get('LOGBOOK_WHISPER_MODEL', 'base.en'))
+    samples = np.frombuffer(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2), dtype=np.int16)
+    prompt = f"{', '.join(phrases)}." if phrases else None
+    segments, _ = model.transcribe(samples.astype(np.float32) / 32768.0, language='en', beam_size=1,
+                                   initial_prompt=prompt)
+    segments = list(segments)
+    text = ' '.join(segment.text.strip() for segment in segments).strip()
+    if not text:
+        raise sr.UnknownValueError()
+    confidence = math.exp(sum(s.avg_logprob for s in segments) / len(segments))
+    return text, confidence
+
+
+ENGINES = {
+    'google': _recognize_google,
+    'vosk': _recognize_vosk,
+    'whisper': _recognize_whisper,
+}
+
+OFFLINE_ENGINES = ('vosk', 'whisper')
+
+
+def default_engine():
+    """Engine named by ``LOGBOOK_SPEECH_ENGINE``, or Google's web API"""
+    return os.environ.get('LOGBOOK_SPEECH_ENGINE', DEFAULT_ENGINE)
+
+
+def preload(engine):
+    """Load an offline engine's model now instead of on the first utterance"""
+    if engine == 'vosk':
+        _vosk_model(os.environ.get('LOGBOOK_VOSK_MODEL', 'model'))
+    elif engine == 'whisper':
+        _whisper_model(os.environ.get('LOGBOOK_WHISPER_MODEL', 'base.en'))
+
+
+class RecognitionCache:
+    """The most recent transcripts, keyed on engine, phrases and audio fingerprint"""
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+_cache = RecognitionCache(int(os.environ.get('LOGBOOK_SPEECH_CACHE', DEFAULT_CACHE_SIZE)))
+
+
+def fingerprint(audio):
+    """Digest of the utterance's 16 kHz samples, without the silence before and after it"""
+    import numpy as np
+    samples = np.frombuffer(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2), dtype=np.int16)
+    loud = np.flatnonzero(np.abs(samples.astype(np.int32)) > SILENCE)
+    if len(loud):
+        samples = samples[loud[0]:loud[-1] + 1]
+    return hashlib.blake2b(samples.tobytes(), digest_size=16).hexdigest()
+
+
+def recognize(recognizer, audio, engine=None, fallback=None, phrases=None, cache=True):
+    """Transcribe ``audio`` with ``engine``, trying ``fallback`` if it is unavailable.
+
+    ``phrases`` are the parameter names the utterance may contain, which
+    the offline engines are constrained to. A transcript of the same audio
+    from the cache is returned unless ``cache`` is False, e.g. when a
+    second opinion is wanted.
+    """
+    import speech_recognition as sr
+    engine = engine or default_engine()
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown speech engine {engine!r}; choose from {sorted(ENGINES)}")
+    phrases = tuple(phrases) if phrases else None
+    started = time.perf_counter()
+    key = None
+    if cache and _cache.size:
+        key = (engine, phrases, fingerprint(audio))
+        result = _cache.get(key)
+        if result is not None:
+            metrics.increment('logbook_speech_cache_total', engine=engine, result='hit')
+            return result._replace(latency_ms=(time.perf_counter() - started) * 1000)
+        metrics.increment('logbook_speech_cache_total', engine=engine, result='miss')
+    try:
+        text, confidence = ENGINES[engine](recognizer, audio, phrases)
+    except sr.UnknownValueError:
+        metrics.increment('logbook_speech_errors_total', engine=engine, kind='unknown')
+        raise
+    except sr.RequestError:
+        metrics.increment('logbook_speech_errors_total', engine=engine, kind='request')
+        if not fallback or fallback == engine:
+            raise
+        return recognize(recognizer, audio, fallback, phrases=phrases, cache=cache)
+    elapsed = time.perf_counter() - started
+    metrics.observe('logbook_speech_recognize_seconds', elapsed, engine=engine)
+    result = RecognitionResult(text, confidence, elapsed * 1000, engine)
+    if key is not None:
+        _cache.put(key, result)
+    return result
@@ -0,0 +1,993 @@
+"""Storage backends for the refinery logbook.
+
+Readings are kept in an append-only store that is the system of record.
+The Excel workbook is only a derived export built from it on demand.
+Readings of closed periods move to compressed files in an ``Archive``
+(see ``logbook.archive``) and are still returned by the time-range reads.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from logbook.locking import atomic_write, file_lock
+
+COLUMNS = ['Area', 'Parameter', 'Value', 'Unit', 'Timestamp', 'Status']
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DEFAULT_BACKEND = 'sqlite'
+DEFAULT_DB_PATH = 'bina_refinery_log.db'
+DEFAULT_EXCEL_PATH = 'bina_refinery_log.xlsx'
+
+# Notifications kept for replicas that fell behind; older ones are dropped as new ones arrive
+MAX_NOTIFICATIONS = 10000
+
+# Each entry upgrades the schema by one version (tracked in PRAGMA user_version)
+_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS readings (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        area TEXT NOT NULL,
+        parameter TEXT NOT NULL,
+        value REAL NOT NULL,
+        unit TEXT,
+        ts TEXT NOT NULL,
+        status TEXT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS log_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        removals INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO log_state (id, version, removals) VALUES (1, 0, 0);
+    CREATE TRIGGER IF NOT EXISTS readings_inserted AFTER INSERT ON readings
+    BEGIN
+        UPDATE log_state SET version = version + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS readings_deleted AFTER DELETE ON readings
+    BEGIN
+        UPDATE log_state SET version = version + 1, removals = removals + 1 WHERE id = 1;
+    END;
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS readings_area_parameter_ts ON readings (area, parameter, ts);
+    CREATE INDEX IF NOT EXISTS readings_area_ts ON readings (area, ts);
+    CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollups (
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        area TEXT NOT NULL,
+        parameter TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        total REAL NOT NULL,
+        minimum REAL NOT NULL,
+        maximum REAL NOT NULL,
+        last_value REAL NOT NULL,
+        last_ts TEXT NOT NULL,
+        PRIMARY KEY (period, bucket, area, parameter)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS rollups_parameter ON rollups (period, area, parameter, bucket);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS alarms (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        seq INTEGER NOT NULL,
+        rule TEXT NOT NULL,
+        area TEXT NOT NULL,
+        parameter TEXT NOT NULL,
+        value REAL NOT NULL,
+        ts TEXT NOT NULL,
+        message TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS alarms_ts ON alarms (ts);
+    CREATE INDEX IF NOT EXISTS alarms_seq ON alarms (seq);
+    CREATE TABLE IF NOT EXISTS alarm_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        evaluated_seq INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO alarm_state (id, evaluated_seq) VALUES (1, 0);
+    """,
+    # A per-row trigger more than halves bulk insert speed. Inserts always advance
+    # the AUTOINCREMENT sequence, so the state adds it to the version instead.
+    """
+    DROP TRIGGER IF EXISTS readings_inserted;
+    """,
+    # Undo marks readings void instead of deleting them; corrections is the audit trail
+    """
+    CREATE TABLE IF NOT EXISTS voids (
+        seq INTEGER PRIMARY KEY,
+        voided_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS corrections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        seq INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        operator TEXT,
+        session TEXT,
+        ts TEXT NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS voids_inserted AFTER INSERT ON voids
+    BEGIN
+        UPDATE log_state SET version = version + 1, removals = removals + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS voids_deleted AFTER DELETE ON voids
+    BEGIN
+        UPDATE log_state SET version = version + 1, removals = removals + 1 WHERE id = 1;
+    END;
+    """,
+    # Readings replayed from an outbox carry a key so a retried batch is never stored twice
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """,
+    # Recordings of voice readings; a clip's readings have keys "<clip key>:<parameter>"
+    """
+    CREATE TABLE IF NOT EXISTS clips (
+        key TEXT PRIMARY KEY,
+        file TEXT NOT NULL,
+        area TEXT NOT NULL,
+        parameter TEXT,
+        ts TEXT NOT NULL,
+        engine TEXT,
+        transcript TEXT,
+        confidence REAL,
+        recheck_engine TEXT,
+        recheck_transcript TEXT,
+        recheck_confidence REAL,
+        rechecked_at TEXT
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS clips_ts ON clips (ts);
+    CREATE TABLE IF NOT EXISTS clip_flags (
+        seq INTEGER PRIMARY KEY,
+        key TEXT NOT NULL,
+        parameter TEXT NOT NULL,
+        logged REAL NOT NULL,
+        heard REAL,
+        ts TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS clip_flags_ts ON clip_flags (ts);
+    """,
+    # Replicas of the app sharing the store tell each other about changes, and take turns at shared chores
+    """
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        ts TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires REAL NOT NULL
+    ) WITHOUT ROWID;
+    """,
+]
+
+# Schema version -> method that derives the new version's data from existing readings
+_BACKFILLS = {
+    4: 'rebuild_rollups',
+}
+
+_UPSERT_ROLLUP = """
+    INSERT INTO rollups (period, bucket, area, parameter, count, total, minimum, maximum, last_value, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (period, bucket, area, parameter) DO UPDATE SET
+        count = count + excluded.count,
+        total = total + excluded.total,
+        minimum = MIN(minimum, excluded.minimum),
+        maximum = MAX(maximum, excluded.maximum),
+        last_value = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_value ELSE last_value END,
+        last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+
+# ``version`` changes on every commit; ``removals`` only when readings are voided or restored
+LogState = namedtuple('LogState', ['last_seq', 'version', 'removals'])
+
+Reading = namedtuple('Reading', ['seq', 'area', 'parameter', 'value', 'unit', 'timestamp', 'status'])
+
+
+class ArchivedReadingError(ValueError):
+    """The reading is in an archived period, where it can no longer be voided or restored"""
+
+    def __init__(self, seq):
+        super().__init__(f"Reading #{seq} is archived and can no longer be voided or restored")
+        self.seq = seq
+
+
+def now_timestamp():
+    """Current time formatted the way the logbook stores it"""
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+class LogStorage:
+    """Interface implemented by every logbook backend.
+
+    Rows are exchanged as tuples in ``COLUMNS`` order. Every stored row gets a
+    monotonically increasing sequence number that is never reused. Void
+    readings are left out of every read.
+    """
+
+    def append(self, area, parameter, value, unit, status, timestamp=None):
+        """Store one reading and return its sequence number"""
+        return self.append_many([(area, parameter, value, unit, timestamp or now_timestamp(), status)])[0]
+
+    def append_many(self, rows, keys=None):
+        """Store several readings in one commit and return their sequence numbers.
+
+        ``keys`` optionally gives every reading an idempotency key, or None.
+        A reading whose key is already stored is left out and gets the
+        sequence number it was first stored under.
+        """
+        raise NotImplementedError
+
+    def append_frame(self, frame, skip_existing=True):
+        """Store a DataFrame of readings in ``COLUMNS`` in one commit; returns the number stored.
+
+        Timestamps must already be in the log's format. Rows are stored in
+        timestamp order. With ``skip_existing`` rows whose area, parameter and
+        timestamp are already in the log are left out. Meant for bulk imports
+        of hundreds of thousands of rows.
+        """
+        raise NotImplementedError
+
+    def void(self, seq, operator=None, session=None):
+        """Mark a reading void so it no longer counts anywhere; False if it is missing or already void.
+
+        The reading itself is kept, and the void is recorded in the
+        corrections trail with who made it. Raises ``ArchivedReadingError``
+        for a reading that has been archived.
+        """
+        raise NotImplementedError
+
+    def restore(self, seq, operator=None, session=None):
+        """Take back a void, returning False if the reading was not void.
+
+        Raises ``ArchivedReadingError`` for a reading that has been archived.
+        """
+        raise NotImplementedError
+
+    def last_seq(self):
+        """Sequence number of the newest reading, or 0 for an empty log"""
+        raise NotImplementedError
+
+    def count(self):
+        """Number of readings in the log"""
+        raise NotImplementedError
+
+    def state(self):
+        """Return a ``LogState`` that changes whenever the log does"""
+        raise NotImplementedError
+
+    def rows_after(self, seq=0, limit=None):
+        """Return ``(seq, row)`` pairs for readings newer than ``seq``, at most ``limit`` of them.
+
+        Only readings not archived yet are returned.
+        """
+        raise NotImplementedError
+
+    def iter_rows(self, start=None, end=None, areas=None, parameters=None, chunk_size=10000):
+        """Yield lists of at most ``chunk_size`` rows in ``COLUMNS`` order, oldest first.
+
+        ``start`` and ``end`` are timestamps in the log's format and bound the
+        readings as ``start <= Timestamp < end``. ``areas`` and ``parameters``
+        restrict the output to the given names.
+        """
+        raise NotImplementedError
+
+    def query(self, area=None, parameter=None, start=None, end=None, limit=None, newest_first=False):
+        """Return matching readings as a list of ``Reading`` tuples ordered by timestamp.
+
+        ``start`` and ``end`` bound the timestamps as in ``iter_rows``. With
+        ``newest_first`` and a ``limit`` this returns the latest readings.
+        """
+        raise NotImplementedError
+
+    def rollups(self, period, start=None, end=None, area=None, parameter=None):
+        """Return ``Rollup`` rows of ``period`` with ``start <= bucket < end``, oldest first"""
+        raise NotImplementedError
+
+    def latest_rollups(self, period):
+        """Return the newest ``Rollup`` of ``period`` for every area and parameter"""
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        """Recompute every rollup from the stored readings"""
+        raise NotImplementedError
+
+    def alarm_cursor(self):
+        """Sequence number of the newest reading the alarm rules have evaluated"""
+        raise NotImplementedError
+
+    def record_alarms(self, alarms, evaluated_seq, through_seq):
+        """Store alarms and move the alarm cursor from ``evaluated_seq`` to ``through_seq``.
+
+        ``alarms`` are ``(seq, rule, area, parameter, value, timestamp, message)``
+        tuples. Returns False without storing anything if the cursor is no
+        longer at ``evaluated_seq``.
+        """
+        raise NotImplementedError
+
+    def alarms(self, start=None, end=None, area=None, limit=None):
+        """Return ``Alarm`` rows with ``start <= timestamp < end``, newest first"""
+        raise NotImplementedError
+
+    def record_clip(self, key, file, area, parameter, timestamp, engine, transcript, confidence):
+        """Remember the recording readings with keys ``"<key>:<parameter>"`` were heard from"""
+        raise NotImplementedError
+
+    def clips(self, start=None, end=None, below=None, rechecked=None):
+        """Return ``Clip`` rows with ``start <= timestamp < end``, oldest first.
+
+        ``below`` keeps clips recognized with a confidence under it or none
+        at all; ``rechecked`` keeps clips that were (True) or were not
+        (False) rechecked. Each clip lists its live, unarchived readings.
+        """
+        raise NotImplementedError
+
+    def record_recheck(self, key, engine, transcript, confidence, flags):
+        """Store the second opinion on a clip and its ``Flag`` rows, replacing earlier ones"""
+        raise NotImplementedError
+
+    def clip_flags(self, start=None, end=None, limit=None):
+        """Return ``Flag`` rows of live readings with ``start <= timestamp < end``, newest first"""
+        raise NotImplementedError
+
+    def forget_clips(self, before):
+        """Drop clips recorded before ``before`` and return their files"""
+        raise NotImplementedError
+
+    def publish(self, channel, payload):
+        """Tell every process sharing the store about a change; ``payload`` is a JSON-serializable dict.
+
+        Writes of readings, voids and restores publish on the ``readings``
+        and ``corrections`` channels themselves, in the same commit.
+        """
+        raise NotImplementedError
+
+    def notifications(self, after=0, limit=None):
+        """Return ``Notification`` rows published after the one numbered ``after``, oldest first"""
+        raise NotImplementedError
+
+    def last_notification(self):
+        """Number of the newest notification, 0 if there is none"""
+        raise NotImplementedError
+
+    def data_version(self):
+        """A number that changes whenever another connection commits to the store"""
+        raise NotImplementedError
+
+    def acquire_lease(self, name, holder, seconds):
+        """Take or renew the lease ``name`` for ``seconds``; False while another holder's lease runs"""
+        raise NotImplementedError
+
+    def read_frame(self, after=0, limit=None):
+        """Return readings newer than ``after`` and not archived as a DataFrame indexed by sequence number"""
+        return _frame(self.rows_after(after, limit))
+
+    def read_range(self, start=None, end=None, areas=None, parameters=None):
+        """Return readings selected as in ``iter_rows`` as a DataFrame indexed by sequence number"""
+        raise NotImplementedError
+
+    def archive_closed(self, now=None):
+        """Move readings of closed periods into the archive and apply its retention policy.
+
+        Returns the ``Partition`` of every period written.
+        """
+        return []
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+
+# Filters out void readings, and the alarms of void readings
+_LIVE = "seq NOT IN (SELECT seq FROM voids)"
+
+
+def _frame(rows):
+    import pandas as pd
+    index = pd.Index([seq for seq, _ in rows], name='seq', dtype='int64')
+    df = pd.DataFrame([row for _, row in rows], columns=COLUMNS, index=index)
+    return df.astype({'Value': 'float64'})
+
+
+class SQLiteLogStorage(LogStorage):
+    """Append-only SQLite table in WAL mode.
+
+    Appends are single-row inserts, so their cost does not grow with the
+    size of the log. Connections are per thread because Streamlit serves each
+    session from its own script thread.
+
+    With an ``archive`` the table only keeps readings of the active period
+    once ``archive_closed`` has run, plus any not yet evaluated by the alarm
+    rules.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, archive=None):
+        self.path = path
+        self.archive = archive
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._migrate()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _migrate(self):
+        conn = self._connect()
+        # Several app processes may open a fresh database at the same moment
+        with file_lock(self.path):
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            backfills = []
+            for number, script in enumerate(_MIGRATIONS[version:], start=version + 1):
+                with conn:
+                    conn.executescript(script)
+                    conn.execute(f"PRAGMA user_version = {number}")
+                if number in _BACKFILLS:
+                    backfills.append(_BACKFILLS[number])
+            # Tables derived from existing readings are filled in once the whole schema is current
+            for backfill in backfills:
+                getattr(self, backfill)()
+
+    def append_many(self, rows, keys=None):
+        rows = [(area, parameter, float(value), unit, timestamp or now_timestamp(), status)
+                for area, parameter, value, unit, timestamp, status in rows]
+        keys = keys or [None] * len(rows)
+        conn = self._connect()
+        seqs, stored = [], []
+        with conn:
+            if any(keys):
+                # The key check must hold until commit
+                conn.execute("BEGIN IMMEDIATE")
+            for row, key in zip(rows, keys):
+                if key is not None:
+                    known = conn.execute("SELECT seq FROM idempotency_keys WHERE key = ?", (key,)).fetchone()
+                    if known is not None:
+                        seqs.append(known[0])
+                        continue
+                cursor = conn.execute(
+                    "INSERT INTO readings (area, parameter, value, unit, ts, status) VALUES (?, ?, ?, ?, ?, ?)", row
+                )
+                seqs.append(cursor.lastrowid)
+                stored.append(row)
+                if key is not None:
+                    conn.execute("INSERT INTO idempotency_keys (key, seq) VALUES (?, ?)", (key, cursor.lastrowid))
+            self._fold_rollups(conn, stored)
+            if stored:
+                self._notify(conn, 'readings', {'last': seqs[-1], 'count': len(stored)})
+        return seqs
+
+    def append_frame(self, frame, skip_existing=True):
+        from logbook.rollups import aggregate_frame
+        # Inserting in timestamp order keeps the ts index appends local; about twice as fast
+        if not frame['Timestamp'].is_monotonic_increasing:
+            frame = frame.sort_values('Timestamp', kind='stable')
+        conn = self._connect()
+        with conn:
+            # Take the write lock up front so the duplicate check stays valid until commit
+            conn.execute("BEGIN IMMEDIATE")
+            if skip_existing and len(frame):
+                frame = frame[~self._existing(conn, frame)]
+                if self.archive is not None and len(frame):
+                    frame = frame[~self.archive.contains(frame)]
+            # Zipping whole columns builds the row tuples in C; itertuples is more than twice as slow
+            conn.executemany(
+                "INSERT INTO readings (area, parameter, value, unit, ts, status) VALUES (?, ?, ?, ?, ?, ?)",
+                zip(*(frame[column].tolist() for column in COLUMNS)),
+            )
+            conn.executemany(_UPSERT_ROLLUP, aggregate_frame(frame))
+            if len(frame):
+                last = conn.execute(self._LAST_SEQ).fetchone()[0]
+                self._notify(conn, 'readings', {'last': last, 'count': len(frame)})
+        return len(frame)
+
+    @staticmethod
+    def _existing(conn, frame):
+        """Boolean mask of the frame's rows whose (area, parameter, timestamp) is already stored"""
+        import numpy as np
+        existing = np.zeros(len(frame), dtype=bool)
+        # History imported into an empty stretch of the log cannot clash
+        overlap = conn.execute(
+            "SELECT 1 FROM readings WHERE ts >= ? AND ts <= ? LIMIT 1",
+            (frame['Timestamp'].min(), frame['Timestamp'].max()),
+        ).fetchone()
+        if overlap is None:
+            return existing
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (pos INTEGER PRIMARY KEY, area TEXT, parameter TEXT, ts TEXT)")
+        conn.execute("DELETE FROM incoming")
+        conn.executemany(
+            "INSERT INTO incoming VALUES (?, ?, ?, ?)",
+            zip(range(len(frame)), frame['Area'], frame['Parameter'], frame['Timestamp']),
+        )
+        positions = [pos for pos, in conn.execute(
+            "SELECT pos FROM incoming i WHERE EXISTS ("
+            "    SELECT 1 FROM readings r WHERE r.area = i.area AND r.parameter = i.parameter AND r.ts = i.ts"
+            ")"
+        )]
+        existing[positions] = True
+        conn.execute("DELETE FROM incoming")
+        return existing
+
+    @staticmethod
+    def _fold_rollups(conn, rows):
+        from logbook.rollups import aggregate
+        conn.executemany(_UPSERT_ROLLUP, [key + tuple(partial) for key, partial in aggregate(rows).items()])
+
+    def _recompute_rollups(self, conn, area, parameter, timestamp):
+        """Rebuild the rollups of every bucket ``timestamp`` falls in from the readings"""
+        from logbook.rollups import aggregate, buckets
+        for period, start, end in buckets(timestamp):
+            conn.execute(
+                "DELETE FROM rollups WHERE period = ? AND bucket = ? AND area = ? AND parameter = ?",
+                (period, start, area, parameter),
+            )
+            rows = conn.execute(
+                "SELECT area, parameter, value, unit, ts, status FROM readings "
+                f"WHERE area = ? AND parameter = ? AND ts >= ? AND ts < ? AND {_LIVE}",
+                (area, parameter, start, end),
+            ).fetchall()
+            # A shift crosses midnight, so its bucket can straddle an archived period
+            if self.archive is not None and self.archive.partitions(start, end):
+                for archived in self.archive.iter_rows(start, end, [area], [parameter]):
+                    rows.extend(archived)
+            partial = aggregate(rows).get((period, start, area, parameter))
+            if partial is not None:
+                conn.execute(_UPSERT_ROLLUP, (period, start, area, parameter, *partial))
+
+    def void(self, seq, operator=None, session=None):
+        conn = self._connect()
+        with conn:
+            # Inserting first takes the write lock, so two sessions cannot both void it
+            voided = conn.execute(
+                "INSERT OR IGNORE INTO voids (seq, voided_at) SELECT seq, ? FROM readings WHERE seq = ?",
+                (now_timestamp(), seq),
+            ).rowcount
+            if voided:
+                self._correct(conn, seq, 'void', operator, session)
+        if not voided:
+            self._check_not_archived(conn, seq)
+        return bool(voided)
+
+    def restore(self, seq, operator=None, session=None):
+        conn = self._connect()
+        with conn:
+            restored = conn.execute("DELETE FROM voids WHERE seq = ?", (seq,)).rowcount
+            if restored:
+                self._correct(conn, seq, 'restore', operator, session)
+        if not restored:
+            self._check_not_archived(conn, seq)
+        return bool(restored)
+
+    def _check_not_archived(self, conn, seq):
+        if self.archive is None or conn.execute("SELECT 1 FROM readings WHERE seq = ?", (seq,)).fetchone():
+            return
+        if self.archive.archived(seq):
+            raise ArchivedReadingError(seq)
+
+    def _correct(self, conn, seq, action, operator, session):
+        conn.execute(
+            "INSERT INTO corrections (seq, action, operator, session, ts) VALUES (?, ?, ?, ?, ?)",
+            (seq, action, operator, session, now_timestamp()),
+        )
+        area, parameter, timestamp = conn.execute(
+            "SELECT area, parameter, ts FROM readings WHERE seq = ?", (seq,)
+        ).fetchone()
+        self._recompute_rollups(conn, area, parameter, timestamp)
+        self._notify(conn, 'corrections', {'seq': seq, 'action': action})
+
+    @staticmethod
+    def _notify(conn, channel, payload):
+        cursor = conn.execute(
+            "INSERT INTO notifications (channel, payload, ts) VALUES (?, ?, ?)",
+            (channel, json.dumps(payload), now_timestamp()),
+        )
+        conn.execute("DELETE FROM notifications WHERE id <= ?", (cursor.lastrowid - MAX_NOTIFICATIONS,))
+
+    def publish(self, channel, payload):
+        conn = self._connect()
+        with conn:
+            self._notify(conn, channel, payload)
+
+    def notifications(self, after=0, limit=None):
+        from logbook.replicas import Notification
+        rows = self._connect().execute(
+            "SELECT id, channel, payload, ts FROM notifications WHERE id > ? ORDER BY id LIMIT ?",
+            (after, -1 if limit is None else limit),
+        ).fetchall()
+        return [Notification(id, channel, json.loads(payload), ts) for id, channel, payload, ts in rows]
+
+    def last_notification(self):
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM notifications").fetchone()[0]
+
+    def data_version(self):
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def acquire_lease(self, name, holder, seconds):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            taken = conn.execute(
+                "INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires "
+                "WHERE leases.holder = excluded.holder OR leases.expires < ?",
+                (name, holder, now + seconds, now),
+            ).rowcount
+        return bool(taken)
+
+    # AUTOINCREMENT keeps the highest sequence number even once its reading is archived
+    _LAST_SEQ = "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'readings'), 0)"
+
+    def last_seq(self):
+        return self._connect().execute(self._LAST_SEQ).fetchone()[0]
+
+    def count(self):
+        live = self._connect().execute(f"SELECT COUNT(*) FROM readings WHERE {_LIVE}").fetchone()[0]
+        return live + (self.archive.rows() if self.archive is not None else 0)
+
+    def state(self):
+        row = self._connect().execute(
+            f"SELECT ({self._LAST_SEQ}), version + ({self._LAST_SEQ}), removals FROM log_state"
+        ).fetchone()
+        return LogState(*row)
+
+    def rows_after(self, seq=0, limit=None):
+        cursor = self._connect().execute(
+            f"SELECT seq, area, parameter, value, unit, ts, status FROM readings WHERE seq > ? AND {_LIVE} "
+            "ORDER BY seq LIMIT ?",
+            (seq, -1 if limit is None else limit),
+        )
+        return [(row[0], row[1:]) for row in cursor]
+
+    def read_range(self, start=None, end=None, areas=None, parameters=None):
+        where, params = self._where(start, end, areas, parameters)
+        cursor = self._connect().execute(
+            f"SELECT seq, area, parameter, value, unit, ts, status FROM readings {where}", params
+        )
+        frame = _frame([(row[0], row[1:]) for row in cursor])
+        if self.archive is not None and self.archive.partitions(start, end):
+            import pandas as pd
+            frame = pd.concat([self.archive.read_frame(start, end, areas, parameters), frame])
+        return frame
+
+    @staticmethod
+    def _where(start=None, end=None, areas=None, parameters=None):
+        clauses, params = [_LIVE], []
+        for column, names in (('area', areas), ('parameter', parameters)):
+            if names:
+                clauses.append(f"{column} IN ({', '.join('?' * len(names))})")
+                params.extend(names)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        return f"WHERE {' AND '.join(clauses)}", params
+
+    def query(self, area=None, parameter=None, start=None, end=None, limit=None, newest_first=False):
+        where, params = self._where(start, end, area and [area], parameter and [parameter])
+        order = "DESC" if newest_first else "ASC"
+        sql = f"SELECT seq, area, parameter, value, unit, ts, status FROM readings {where} ORDER BY ts {order}, seq {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        readings = [Reading(*row) for row in self._connect().execute(sql, params)]
+        if self.archive is None:
+            return readings
+        partitions = self.archive.partitions(start, end)
+        if not partitions:
+            return readings
+        if limit is not None and len(readings) >= limit:
+            # The table alone fills the limit unless an archived reading sorts before its last one
+            bound = readings[-1].timestamp
+            if newest_first and max(p.max_ts for p in partitions) < bound:
+                return readings
+            if not newest_first and min(p.min_ts for p in partitions) > bound:
+                return readings
+        readings += self.archive.query(area, parameter, start, end, limit, newest_first)
+        readings.sort(key=lambda reading: (reading.timestamp, reading.seq), reverse=newest_first)
+        return readings[:limit]
+
+    def rollups(self, period, start=None, end=None, area=None, parameter=None):
+        from logbook.rollups import Rollup
+        clauses, params = ["period = ?"], [period]
+        for column, value, op in (('bucket', start, '>='), ('bucket', end, '<'),
+                                  ('area', area, '='), ('parameter', parameter, '=')):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        cursor = self._connect().execute(
+            "SELECT period, bucket, area, parameter, count, total, minimum, maximum, last_value, last_ts "
+            f"FROM rollups WHERE {' AND '.join(clauses)} ORDER BY bucket", params
+        )
+        return [Rollup(*row) for row in cursor]
+
+    def latest_rollups(self, period):
+        from logbook.rollups import Rollup
+        cursor = self._connect().execute(
+            "SELECT period, bucket, area, parameter, count, total, minimum, maximum, last_value, last_ts "
+            "FROM rollups r WHERE period = ? AND bucket = ("
+            "    SELECT MAX(bucket) FROM rollups WHERE period = r.period AND area = r.area AND parameter = r.parameter"
+            ")",
+            (period,),
+        )
+        return [Rollup(*row) for row in cursor]
+
+    def rebuild_rollups(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM rollups")
+            for rows in self.iter_rows():
+                self._fold_rollups(conn, rows)
+
+    def alarm_cursor(self):
+        return self._connect().execute("SELECT evaluated_seq FROM alarm_state").fetchone()[0]
+
+    def record_alarms(self, alarms, evaluated_seq, through_seq):
+        conn = self._connect()
+        with conn:
+            moved = conn.execute(
+                "UPDATE alarm_state SET evaluated_seq = ? WHERE id = 1 AND evaluated_seq = ?",
+                (through_seq, evaluated_seq),
+            ).rowcount
+            if not moved:
+                return False
+            conn.executemany(
+                "INSERT INTO alarms (seq, rule, area, parameter, value, ts, message) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                alarms,
+            )
+            if alarms:
+                # Published apart from the readings, which were committed before they were evaluated
+                self._notify(conn, 'alarms', {'through': through_seq, 'count': len(alarms)})
+        return True
+
+    def alarms(self, start=None, end=None, area=None, limit=None):
+        from logbook.alarms import Alarm
+        where, params = self._where(start, end, area and [area])
+        sql = f"SELECT id, seq, rule, area, parameter, value, ts, message FROM alarms {where} ORDER BY ts DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Alarm(*row) for row in self._connect().execute(sql, params)]
+
+    def record_clip(self, key, file, area, parameter, timestamp, engine, transcript, confidence):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO clips (key, file, area, parameter, ts, engine, transcript, confidence) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, file, area, parameter, timestamp, engine, transcript, confidence),
+            )
+
+    def clips(self, start=None, end=None, below=None, rechecked=None):
+        from logbook.clips import Clip
+        clauses, params = ["1"], []
+        for clause, value in (("ts >= ?", start), ("ts < ?", end),
+                              ("(confidence IS NULL OR confidence < ?)", below)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if rechecked is not None:
+            clauses.append("rechecked_at IS NOT NULL" if rechecked else "rechecked_at IS NULL")
+        where = f"WHERE {' AND '.join(clauses)}"
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT key, file, area, parameter, ts, engine, transcript, confidence FROM clips {where} ORDER BY ts",
+            params,
+        ).fetchall()
+        clips = []
+        for row in rows:
+            # Every key of the clip's readings sorts between "<key>:" and "<key>;"
+            readings = conn.execute(
+                "SELECT r.seq, r.parameter, r.value FROM idempotency_keys k JOIN readings r ON r.seq = k.seq "
+                "WHERE k.key > ? AND k.key < ? AND r.seq NOT IN (SELECT seq FROM voids) ORDER BY r.seq",
+                (row[0] + ':', row[0] + ';'),
+            ).fetchall()
+            clips.append(Clip(*row, tuple(readings)))
+        return clips
+
+    def record_recheck(self, key, engine, transcript, confidence, flags):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE clips SET recheck_engine = ?, recheck_transcript = ?, recheck_confidence = ?, "
+                "rechecked_at = ? WHERE key = ?",
+                (engine, transcript, confidence, now_timestamp(), key),
+            )
+            conn.execute("DELETE FROM clip_flags WHERE key = ?", (key,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO clip_flags (seq, key, parameter, logged, heard, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                flags,
+            )
+
+    def clip_flags(self, start=None, end=None, limit=None):
+        from logbook.clips import Flag
+        where, params = self._where(start, end)
+        # Earlier rechecks also flagged readings they did not hear at all
+        sql = (f"SELECT seq, key, parameter, logged, heard, ts FROM clip_flags {where} AND heard IS NOT NULL "
+               "ORDER BY ts DESC, seq DESC")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Flag(*row) for row in self._connect().execute(sql, params)]
+
+    def forget_clips(self, before):
+        conn = self._connect()
+        with conn:
+            files = [row[0] for row in conn.execute("SELECT file FROM clips WHERE ts < ?", (before,))]
+            conn.execute("DELETE FROM clip_flags WHERE key IN (SELECT key FROM clips WHERE ts < ?)", (before,))
+            conn.execute("DELETE FROM clips WHERE ts < ?", (before,))
+        return files
+
+    def iter_rows(self, start=None, end=None, areas=None, parameters=None, chunk_size=10000):
+        if self.archive is not None:
+            yield from self.archive.iter_rows(start, end, areas, parameters, chunk_size)
+        where, params = self._where(start, end, areas, parameters)
+        # A separate connection keeps a long export from pinning this thread's one
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = conn.execute(
+                f"SELECT area, parameter, value, unit, ts, status FROM readings {where} ORDER BY seq", params
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def archive_closed(self, now=None):
+        from logbook.archive import VOIDED, period_bounds
+        if self.archive is None:
+            return []
+        _, active, _ = period_bounds(now or datetime.now(), self.archive.period)
+        conn = self._connect()
+        written = []
+        while True:
+            with conn:
+                # Holding the write lock keeps the readings from being voided while they are copied
+                conn.execute("BEGIN IMMEDIATE")
+                # Readings the alarm rules have not seen stay until they have been evaluated
+                through = self.alarm_cursor()
+                oldest = conn.execute(
+                    "SELECT MIN(ts) FROM readings WHERE ts < ? AND seq <= ?", (active, through)
+                ).fetchone()[0]
+                if oldest is None:
+                    break
+                key, start, end = period_bounds(oldest, self.archive.period)
+                closed = "ts >= ? AND ts < ? AND seq <= ?"
+                # Void readings go along, so the corrections trail keeps pointing at readings
+                rows = conn.execute(
+                    "SELECT r.seq, area, parameter, value, unit, ts, status, voided_at "
+                    "FROM readings r LEFT JOIN voids v ON v.seq = r.seq "
+                    "WHERE ts >= ? AND ts < ? AND r.seq <= ?",
+                    (start, end, through),
+                ).fetchall()
+                if rows:
+                    frame = _frame([(row[0], row[1:-1]) for row in rows]).reset_index()
+                    frame[VOIDED] = [row[-1] for row in rows]
+                    written.append(self.archive.write(key, start, end, frame))
+                # The archive now holds when they were voided
+                conn.execute(f"DELETE FROM voids WHERE seq IN (SELECT seq FROM readings WHERE {closed})",
+                             (start, end, through))
+                conn.execute(f"DELETE FROM readings WHERE {closed}", (start, end, through))
+        self.archive.expire(now)
+        return written
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+BACKENDS = {
+    'sqlite': SQLiteLogStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Return the process-wide storage backend.
+
+    The backend is chosen with ``LOGBOOK_BACKEND`` and its file with
+    ``LOGBOOK_DB_PATH``; ``logbook.archive.get_archive`` describes the
+    settings of the archive.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = os.environ.get('LOGBOOK_BACKEND', DEFAULT_BACKEND)
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown logbook backend {backend!r}; choose from {sorted(BACKENDS)}")
+            from logbook.archive import get_archive
+            _storage = BACKENDS[backend](os.environ.get('LOGBOOK_DB_PATH', DEFAULT_DB_PATH), archive=get_archive())
+        return _storage
+
+
+def import_legacy_workbook(storage, path=DEFAULT_EXCEL_PATH, only_if_empty=False):
+    """Copy readings from a workbook written by older versions into ``storage``.
+
+    With ``only_if_empty`` the import is skipped when the log already has
+    rows, so concurrent app starts seed the store at most once.
+    """
+    with file_lock(path):
+        if only_if_empty and storage.count():
+            return 0
+        return _import_workbook_rows(storage, path)
+
+
+def _import_workbook_rows(storage, path):
+    import pandas as pd
+
+    df = pd.read_excel(path)
+    if df.empty:
+        return 0
+    # The earliest workbooks named the area column "Equipment"
+    if 'Equipment' in df.columns:
+        df['Area'] = df['Area'].fillna(df['Equipment']) if 'Area' in df.columns else df['Equipment']
+    for column in COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    timestamps = pd.to_datetime(df['Timestamp'], errors='coerce').fillna(pd.Timestamp.now())
+    df['Timestamp'] = timestamps.dt.strftime(TIMESTAMP_FORMAT)
+    df['Status'] = df['Status'].fillna('Normal')
+    df = df.dropna(subset=['Area', 'Parameter', 'Value'])
+    rows = list(df[COLUMNS].itertuples(index=False, name=None))
+    storage.append_many(rows)
+    return len(rows)
+
+
+def export_excel(storage, path=DEFAULT_EXCEL_PATH):
+    """Write the log's active partition to an Excel workbook, atomically replacing ``path``.
+
+    Archived periods stay out of the workbook so it never reaches Excel's
+    row limit; export them with ``logbook.export`` instead.
+    """
+    df = storage.read_frame()
+    with file_lock(path):
+        with atomic_write(path) as tmp_path:
+            df.to_excel(tmp_path, index=False)
+    return len(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the refinery logbook store")
+    parser.add_argument('--export-excel', metavar='PATH', nargs='?', const=DEFAULT_EXCEL_PATH,
+                        help="write the log to an Excel workbook")
+    parser.add_argument('--import-excel', metavar='PATH',
+                        help="append readings from a legacy workbook")
+    args = parser.parse_args(argv)
+
+    storage = get_storage()
+    if args.import_excel:
+        print(f"Imported {import_legacy_workbook(storage, args.import_excel)} readings")
+    if args.export_excel:
+        print(f"Exported {export_excel(storage, args.export_excel)} readings to {args.export_excel}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+"""Static styling for the Streamlit app"""
+import functools
+import os
+
+_STYLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'style.css')
+
+
+@functools.lru_cache(maxsize=None)
+def load_css():
+    """The app's stylesheet wrapped in a <style> tag, read from disk once per process"""
+    with open(_STYLE_PATH, encoding='utf-8') as f:
+        return f"<style>\n{f.read()}</style>\n"
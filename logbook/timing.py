@@ -0,0 +1,39 @@
+"""Cold-start and rerun timings of the Streamlit script.
+
+Streamlit executes the script again on every interaction, but imported
+modules, cached resources and this module's state live for the whole
+process. The first run of a process is therefore the cold start and every
+later run a warm rerun.
+"""
+import statistics
+import threading
+
+from logbook import metrics
+
+_lock = threading.Lock()
+_cold_ms = None
+_warm_ms = []
+MAX_SAMPLES = 500
+
+
+def record_run(seconds):
+    """Record how long one run of the script took"""
+    global _cold_ms
+    metrics.observe('logbook_script_run_seconds', seconds, run='cold' if _cold_ms is None else 'warm')
+    with _lock:
+        if _cold_ms is None:
+            _cold_ms = seconds * 1000
+        else:
+            _warm_ms.append(seconds * 1000)
+            del _warm_ms[:-MAX_SAMPLES]
+
+
+def summary():
+    """Return cold-start and warm-rerun timings in milliseconds"""
+    with _lock:
+        return {
+            'cold_start_ms': _cold_ms,
+            'warm_reruns': len(_warm_ms),
+            'warm_last_ms': _warm_ms[-1] if _warm_ms else None,
+            'warm_median_ms': statistics.median(_warm_ms) if _warm_ms else None,
+        }
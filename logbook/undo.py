@@ -0,0 +1,111 @@
+"""Per-session undo and redo of logged readings.
+
+Undo never deletes anything: the store marks the reading void and records
+who did it in its corrections trail, and redo takes the void back. Either
+is one row plus a recompute of the reading's rollup buckets, so the cost
+does not grow with the log.
+
+A history only holds readings its own session and operator logged, so an
+operator can never undo a reading someone else wrote in the meantime.
+"""
+from collections import deque, namedtuple
+
+from logbook.storage import ArchivedReadingError
+
+DEFAULT_LIMIT = 100
+
+# ``seq`` is None until the write queue has committed the reading
+Entry = namedtuple('Entry', ['ticket', 'seq', 'area', 'parameter', 'value', 'unit', 'timestamp'])
+
+
+class UndoHistory:
+    """Undo and redo stacks of one operator's readings in one session"""
+
+    def __init__(self, operator=None, session=None, limit=DEFAULT_LIMIT):
+        self.operator = operator
+        self.session = session
+        self._undo = deque(maxlen=limit)
+        self._redo = []
+
+    def record(self, tickets, rows):
+        """Remember readings just submitted to the write queue; clears the redo stack"""
+        for ticket, (area, parameter, value, unit, timestamp, _) in zip(tickets, rows):
+            self._undo.append(Entry(ticket, None, area, parameter, value, unit, timestamp))
+        self._redo.clear()
+
+    def resolve(self, queue):
+        """Note the sequence numbers of committed readings before the queue forgets them.
+
+        Readings the queue deferred to its outbox leave the history: they
+        get their sequence numbers only when replayed, out of the session's
+        sight, so they can no longer be undone from here.
+        """
+        from logbook.writer import DEFERRED
+        for i, entry in enumerate(self._undo):
+            if entry.seq is None:
+                seq = queue.seq(entry.ticket)
+                if seq is not None:
+                    self._undo[i] = entry._replace(seq=seq)
+        kept = [entry for entry in self._undo if entry.seq is not None or queue.status(entry.ticket) != DEFERRED]
+        if len(kept) < len(self._undo):
+            self._undo = deque(kept, maxlen=self._undo.maxlen)
+
+    def next_undo(self):
+        """The reading ``undo`` would void, or None"""
+        return self._undo[-1] if self._undo else None
+
+    def next_redo(self):
+        """The reading ``redo`` would restore, or None"""
+        return self._redo[-1] if self._redo else None
+
+    def undo(self, storage, queue, timeout=10):
+        """Void the most recent reading of this history and return its entry.
+
+        Returns None if there is nothing to undo, the reading is still
+        waiting to be written after ``timeout`` seconds, or it was already
+        void. A reading archived in the meantime leaves the history and
+        ``ArchivedReadingError`` is raised.
+        """
+        if not self._undo:
+            return None
+        if self._undo[-1].seq is None:
+            queue.flush(timeout=timeout)
+            self.resolve(queue)
+        entry = self._undo[-1]
+        if entry.seq is None:
+            return None
+        # Popped only once the store answered, so a failed void can be tried again
+        try:
+            voided = storage.void(entry.seq, self.operator, self.session)
+        except ArchivedReadingError:
+            self._undo.pop()
+            raise
+        self._undo.pop()
+        if not voided:
+            return None
+        self._redo.append(entry)
+        return entry
+
+    def redo(self, storage):
+        """Restore the most recently undone reading and return its entry, or None.
+
+        Like ``undo``, drops an archived reading and raises ``ArchivedReadingError``.
+        """
+        if not self._redo:
+            return None
+        entry = self._redo[-1]
+        try:
+            restored = storage.restore(entry.seq, self.operator, self.session)
+        except ArchivedReadingError:
+            self._redo.pop()
+            raise
+        self._redo.pop()
+        if not restored:
+            return None
+        self._undo.append(entry)
+        return entry
+
+
+def describe(entry):
+    """One-line description of an entry for confirmation prompts"""
+    return f"{entry.parameter} = {entry.value} {entry.unit} ({entry.area}, {entry.timestamp})"
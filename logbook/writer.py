@@ -0,0 +1,269 @@
+"""Write-behind queue for new readings.
+
+Sessions hand validated readings to a process-wide queue and get a ticket
+back immediately. A background thread commits the buffered readings to the
+log store in batches, once enough have piled up or the oldest has waited
+long enough, and again on shutdown so a clean exit never loses a reading.
+
+With an ``Outbox`` (see ``logbook.outbox``) a batch the store refuses is
+moved there instead of being retried from memory, and its tickets read
+``DEFERRED``. The queue replays the outbox in order before committing
+anything newer, so nothing overtakes readings that were held back.
+"""
+import atexit
+import itertools
+import os
+import threading
+import time
+
+from logbook import metrics
+from logbook.outbox import get_outbox
+from logbook.storage import get_storage, now_timestamp
+
+DEFAULT_MAX_BATCH = 200
+DEFAULT_MAX_DELAY = 0.25
+RETRY_DELAY = 1.0
+REPLAY_INTERVAL = 5.0
+
+PENDING = 'pending'
+FLUSHED = 'flushed'
+DEFERRED = 'deferred'
+
+
+class WriteBehindQueue:
+    """Buffers readings in memory and commits them from a background thread"""
+
+    def __init__(self, storage, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY, outbox=None):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.outbox = outbox
+        self.last_error = None
+        self._on_flush = []
+        self._tickets = itertools.count(1)
+        self._buffer = []
+        self._oldest = None
+        self._acks = {}
+        self._deferred = set()
+        # Whether the outbox may hold readings, and when replaying them was last tried
+        self._backlog = outbox is not None and outbox.state().readings > 0
+        self._replayed = 0.0
+        self._force = False
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def add_flush_listener(self, callback):
+        """Call ``callback(seqs)`` after each successful batch commit"""
+        self._on_flush.append(callback)
+
+    def submit(self, area, parameter, value, unit, status, timestamp=None):
+        """Queue one reading and return its ticket"""
+        return self.submit_many([(area, parameter, value, unit, timestamp or now_timestamp(), status)])[0]
+
+    def submit_many(self, rows, track=True, keys=None):
+        """Queue readings given as tuples in ``COLUMNS`` order and return their tickets.
+
+        With ``track=False`` no acknowledgements are kept, for callers that
+        never ask about their tickets and so would never ``forget`` them.
+        ``keys`` are idempotency keys for the store's ``append_many``.
+        """
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("Write-behind queue is shut down")
+            tickets = []
+            for row, key in zip(rows, keys or itertools.repeat(None)):
+                ticket = next(self._tickets)
+                self._buffer.append((ticket, tuple(row), key))
+                if track:
+                    self._acks[ticket] = None
+                tickets.append(ticket)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify()
+        return tickets
+
+    def status(self, ticket):
+        """Return ``PENDING``, ``FLUSHED`` or ``DEFERRED`` for a ticket from ``submit``"""
+        with self._cond:
+            if self._acks.get(ticket) is not None:
+                return FLUSHED
+            return DEFERRED if ticket in self._deferred else PENDING
+
+    def seq(self, ticket):
+        """Sequence number a flushed ticket was stored under, or None while pending"""
+        with self._cond:
+            return self._acks.get(ticket)
+
+    def forget(self, tickets):
+        """Drop acknowledgements the caller no longer needs"""
+        with self._cond:
+            for ticket in tickets:
+                if self._acks.get(ticket) is not None or ticket in self._deferred:
+                    self._acks.pop(ticket, None)
+                    self._deferred.discard(ticket)
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def _due(self):
+        if self._backlog and (self._force or time.monotonic() - self._replayed >= REPLAY_INTERVAL):
+            return True
+        if not self._buffer:
+            return False
+        return (self._stopping or self._force or len(self._buffer) >= self.max_batch
+                or time.monotonic() - self._oldest >= self.max_delay)
+
+    def _timeout(self):
+        """How long the thread may sleep before something becomes due"""
+        timeouts = []
+        if self._oldest is not None:
+            timeouts.append(self._oldest + self.max_delay - time.monotonic())
+        if self._backlog:
+            timeouts.append(self._replayed + REPLAY_INTERVAL - time.monotonic())
+        return max(0.0, min(timeouts)) if timeouts else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._stopping:
+                        return
+                    self._cond.wait(self._timeout())
+                stopping = self._stopping
+            if not self._commit_batch():
+                if stopping:
+                    return
+                time.sleep(RETRY_DELAY)
+
+    def _commit_batch(self):
+        # Readings held back in the outbox go first, so nothing overtakes them
+        if self._backlog:
+            replay_due = self._force or time.monotonic() - self._replayed >= REPLAY_INTERVAL
+            if not (replay_due and self._replay()):
+                self._spill()
+                return not self._buffer
+        with self._cond:
+            batch = self._buffer[:self.max_batch]
+            if not batch:
+                self._force = False
+                return True
+        try:
+            with metrics.timed('logbook_write_seconds'):
+                seqs = self.storage.append_many([row for _, row, _ in batch], [key for _, _, key in batch])
+        except Exception as e:
+            # Nothing was committed; keep the readings, in the outbox if there is one
+            self.last_error = e
+            self._spill()
+            return False
+        with self._cond:
+            del self._buffer[:len(batch)]
+            self._oldest = time.monotonic() if self._buffer else None
+            self._force = self._force and bool(self._buffer)
+            for (ticket, _, _), seq in zip(batch, seqs):
+                if ticket in self._acks:
+                    self._acks[ticket] = seq
+            self._cond.notify_all()
+        self.last_error = None
+        self._committed(seqs)
+        return True
+
+    def _committed(self, seqs):
+        metrics.increment('logbook_write_rows_total', len(seqs))
+        for callback in self._on_flush:
+            callback(seqs)
+
+    def _replay(self):
+        """Commit the outbox's readings in order; False if the store still refuses them"""
+        self._replayed = time.monotonic()
+        while True:
+            batch = self.outbox.take_readings(self.max_batch)
+            if not batch.ids:
+                self._backlog = False
+                return True
+            try:
+                with metrics.timed('logbook_write_seconds'):
+                    seqs = self.storage.append_many(batch.rows, batch.keys)
+            except Exception as e:
+                self.last_error = e
+                return False
+            # Should this fail, the keys keep the next replay from storing the batch twice
+            self.outbox.drop_readings(batch.ids)
+            self.last_error = None
+            self._committed(seqs)
+
+    def _spill(self):
+        """Move everything buffered to the outbox, if there is one"""
+        if self.outbox is None:
+            return
+        with self._cond:
+            # Wait for the next replay instead of retrying at once
+            self._force = False
+            batch = list(self._buffer)
+        if not batch:
+            return
+        try:
+            self.outbox.put_readings([row for _, row, _ in batch], [key for _, _, key in batch])
+        except Exception:
+            # The outbox is not writable either; keep retrying from memory
+            return
+        with self._cond:
+            del self._buffer[:len(batch)]
+            self._oldest = time.monotonic() if self._buffer else None
+            for ticket, _, _ in batch:
+                if ticket in self._acks:
+                    self._deferred.add(ticket)
+                    del self._acks[ticket]
+            self._backlog = True
+            self._cond.notify_all()
+
+    def replay(self):
+        """Replay the outbox now, e.g. after readings were added to it from elsewhere"""
+        with self._cond:
+            self._backlog = self.outbox is not None
+            self._force = True
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is committed or deferred; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._force = bool(self._buffer)
+            self._cond.notify_all()
+            while self._buffer:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self):
+        """Commit everything still buffered and stop the background thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        # The thread gives up if the store fails during shutdown; make one last attempt
+        if self._buffer:
+            self._commit_batch()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """Return the process-wide write-behind queue"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteBehindQueue(
+                get_storage(),
+                max_batch=int(os.environ.get('LOGBOOK_WRITE_BATCH', DEFAULT_MAX_BATCH)),
+                max_delay=float(os.environ.get('LOGBOOK_WRITE_DELAY', DEFAULT_MAX_DELAY)),
+                outbox=get_outbox(),
+            )
+            atexit.register(_queue.stop)
+        return _queue
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from logbook.cache import get_log_cache
+from logbook.parameters import STATUSES, get_registry
+from logbook.replicas import get_notifier
+from logbook.sessions import get_wakeups
+from logbook.shifts import shift_at
+from logbook.storage import TIMESTAMP_FORMAT, get_storage
+from logbook.theme import load_css
+
+STATUS_BADGES = {
+    "Normal": "🟢 Normal",
+    "Below Range": "🔵 Below Range",
+    "Above Range": "🔴 Above Range",
+}
+NO_DATA = "⚪ No data"
+
+st.markdown(load_css(), unsafe_allow_html=True)
+
+st.title("Shift Dashboard")
+st.write("Live summary of every parameter, built from hourly, shift and daily rollups")
+
+with st.sidebar:
+    auto_refresh = st.toggle(
+        "Show new readings as they are logged", value=True, key="dashboard_auto_refresh",
+        help="Readings and alarms from any session, replica or device appear without clicking anything"
+    )
+
+# Everything published up to here is on this run's page
+seen_notification = get_notifier().cursor
+
+registry = get_registry()
+period = st.radio("Summarize over the current", options=["shift", "day"], horizontal=True, key="dashboard_period")
+areas = st.multiselect("Areas (all if empty)", options=registry.areas, key="dashboard_areas") or registry.areas
+
+storage = get_storage()
+cache = get_log_cache()
+now = datetime.now()
+if period == "shift":
+    current = shift_at(now)
+    bucket_start, bucket_end = current.start, current.end
+    st.caption(f"Shift {current.name}: {current.start:%Y-%m-%d %H:%M} – {current.end:%H:%M}")
+else:
+    bucket_start = datetime.combine(now.date(), datetime.min.time())
+    bucket_end = bucket_start + timedelta(days=1)
+    st.caption(f"Day: {bucket_start:%Y-%m-%d}")
+
+# Three small reads of the rollup table, cached until the log changes; no raw readings are scanned
+bucket_bounds = bucket_start.strftime(TIMESTAMP_FORMAT), bucket_end.strftime(TIMESTAMP_FORMAT)
+summaries = {
+    (r.area, r.parameter): r
+    for r in cache.get(('rollups', period, *bucket_bounds),
+                       lambda: storage.rollups(period, start=bucket_bounds[0], end=bucket_bounds[1]))
+}
+latest = {(r.area, r.parameter): r
+          for r in cache.get(('latest_rollups', 'hour'), lambda: storage.latest_rollups('hour'))}
+trend_start = (now - timedelta(hours=23)).replace(minute=0, second=0, microsecond=0).strftime(TIMESTAMP_FORMAT)
+trends = {}
+for r in cache.get(('rollups', 'hour', trend_start, None), lambda: storage.rollups('hour', start=trend_start)):
+    trends.setdefault((r.area, r.parameter), []).append(r.mean)
+
+badges = [STATUS_BADGES[status] for status in STATUSES]
+for area in areas:
+    st.subheader(area)
+    tags = registry.tags(area)
+    last = [latest.get((area, tag.name)) for tag in tags]
+    summary = [summaries.get((area, tag.name)) for tag in tags]
+    # One vectorized range check for every tag of the area that has a reading
+    with_data = [tag.id for tag, rollup in zip(tags, last) if rollup]
+    statuses = iter(registry.check(with_data, [rollup.last_value for rollup in last if rollup]))
+    frame = pd.DataFrame({
+        "Parameter": [tag.name for tag in tags],
+        "Status": [badges[next(statuses)] if rollup else NO_DATA for rollup in last],
+        "Last": [rollup.last_value if rollup else None for rollup in last],
+        "Last at": [rollup.last_timestamp if rollup else None for rollup in last],
+        "Min": [rollup.minimum if rollup else None for rollup in summary],
+        "Mean": [rollup.mean if rollup else None for rollup in summary],
+        "Max": [rollup.maximum if rollup else None for rollup in summary],
+        "Readings": [rollup.count if rollup else 0 for rollup in summary],
+        "Unit": [tag.unit for tag in tags],
+        "Trend (24h)": [trends.get((area, tag.name), []) for tag in tags],
+    })
+    st.dataframe(
+        frame,
+        column_config={
+            "Mean": st.column_config.NumberColumn(format="%.2f"),
+            "Trend (24h)": st.column_config.LineChartColumn("Hourly mean (24h)"),
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+
+st.subheader("🚨 Alarms")
+# Evaluated by whichever process committed the readings; their alarms wake this page
+alarms = storage.alarms(start=bucket_start.strftime(TIMESTAMP_FORMAT), limit=200)
+if alarms:
+    st.dataframe(
+        pd.DataFrame(alarms).drop(columns=['id', 'seq']),
+        column_config={"rule": "Rule", "area": "Area", "parameter": "Parameter", "value": "Value",
+                       "timestamp": "Timestamp", "message": "Details"},
+        hide_index=True,
+        use_container_width=True,
+    )
+else:
+    st.caption(f"No alarms this {period}")
+
+# New readings and alarms rerun this session when they arrive, so the run can end here
+if auto_refresh:
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        get_wakeups().wait(ctx.session_id)
+    # Notifications that arrived during this run are not on its page yet
+    if get_notifier().cursor > seen_notification:
+        st.rerun()
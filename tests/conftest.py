@@ -0,0 +1,38 @@
+import pytest
+
+from logbook.archive import Archive
+from logbook.outbox import Outbox
+from logbook.parameters import ParameterRegistry
+from logbook.storage import SQLiteLogStorage
+from logbook.writer import WriteBehindQueue
+
+AREA = "Area 1 - Crude Processing"
+
+
+@pytest.fixture
+def registry():
+    return ParameterRegistry({
+        AREA: {
+            "Pressure": {"min": 1, "max": 3, "unit": "bar"},
+            "Top Temperature": {"min": 100, "max": 150, "unit": "°C"},
+        },
+    })
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteLogStorage(str(tmp_path / 'log.db'), archive=Archive(str(tmp_path / 'archive')))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path / 'outbox.db'))
+
+
+@pytest.fixture
+def queue(storage, outbox):
+    queue = WriteBehindQueue(storage, max_delay=0.01, outbox=outbox)
+    yield queue
+    queue.stop()
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from conftest import AREA
+
+from logbook.alarms import AlarmEngine, RangeRule, RateOfChangeRule, RepeatedExcursionRule
+
+
+def reading(value, minute, parameter="Pressure", hour=8):
+    unit = "bar" if parameter == "Pressure" else "°C"
+    return (AREA, parameter, value, unit, f"2026-03-01 {hour:02d}:{minute:02d}:00", "Normal")
+
+
+def raised(storage):
+    return sorted((alarm.seq, alarm.rule) for alarm in storage.alarms())
+
+
+def test_out_of_range_reading_raises_an_alarm(storage, registry):
+    storage.append_many([reading(2.0, 0), reading(3.5, 30), reading(99.0, 40, "Top Temperature")])
+    assert AlarmEngine(storage, [RangeRule()], registry).process() == 2
+    alarms = {alarm.seq: alarm.message for alarm in storage.alarms()}
+    assert alarms == {2: "3.5 bar is above the range 1 - 3", 3: "99 °C is below the range 100 - 150"}
+
+
+def test_fast_change_raises_an_alarm(storage, registry):
+    # The range is 2 bar wide, so half of it per hour allows 1 bar within the hour
+    storage.append_many([reading(1.5, 0), reading(2.4, 10), reading(1.2, 20), reading(2.9, 15, hour=11)])
+    assert AlarmEngine(storage, [RateOfChangeRule()], registry).process() == 1
+    [alarm] = storage.alarms()
+    assert (alarm.seq, alarm.message) == (3, "changed by -1.2 bar in 10 min")
+
+
+def test_repeated_excursions_raise_one_alarm(storage, registry):
+    rule = RepeatedExcursionRule(count=3, window=timedelta(hours=1))
+    storage.append_many([reading(3.5, minute) for minute in (0, 10, 20, 30)] + [reading(3.5, 0, hour=12)])
+    assert AlarmEngine(storage, [rule], registry).process() == 1
+    [alarm] = storage.alarms()
+    assert (alarm.seq, alarm.message) == (3, "3 excursions within 20 min")
+
+
+def test_each_reading_is_evaluated_once(storage, registry):
+    rules = [RangeRule(), RepeatedExcursionRule(count=3, window=timedelta(hours=1))]
+    engine = AlarmEngine(storage, rules, registry, batch_size=2)
+    storage.append_many([reading(3.5, 0), reading(2.0, 10), reading(3.6, 20)])
+    seen = storage.last_notification()
+    assert engine.process() == 2
+    assert storage.alarm_cursor() == 3
+    assert [n.payload['count'] for n in storage.notifications(seen) if n.channel == 'alarms'] == [1, 1]
+
+    assert AlarmEngine(storage, rules, registry).process() == 0
+    storage.append_many([reading(3.7, 30)])
+    # The earlier excursions are loaded as context for the new one
+    assert engine.process() == 2
+    assert raised(storage) == [(1, 'range'), (3, 'range'), (4, 'range'), (4, 'repeated_excursion')]
+
+
+def test_batch_evaluated_elsewhere_is_not_recorded_again(storage):
+    storage.append_many([reading(3.5, 0)])
+    assert storage.record_alarms([], 0, 1)
+    assert not storage.record_alarms([(1, 'range', AREA, "Pressure", 3.5, "2026-03-01 08:00:00", "late")], 0, 1)
+    assert storage.alarms() == []
@@ -0,0 +1,65 @@
+import pytest
+from conftest import AREA
+
+from logbook.storage import ArchivedReadingError
+
+# In March, readings of February and before belong to closed periods
+NOW = "2026-03-15 12:00:00"
+
+
+def log(storage, *values, day="2026-02-10"):
+    seqs = storage.append_many([(AREA, "Pressure", value, "bar", f"{day} 08:{i:02d}:00", "Normal")
+                                for i, value in enumerate(values)])
+    # Only readings the alarm rules have evaluated are archived
+    storage.record_alarms([], storage.alarm_cursor(), storage.last_seq())
+    return seqs
+
+
+def test_closed_period_moves_to_the_archive(storage):
+    log(storage, 1.0, 1.1)
+    [current] = log(storage, 1.2, day="2026-03-10")
+    storage.archive_closed(NOW)
+    assert storage.archive.rows() == 2
+    assert storage.count() == 3
+    assert [r.value for r in storage.query()] == [1.0, 1.1, 1.2]
+    assert storage.query()[-1].seq == current
+
+
+def test_void_readings_are_archived_but_not_read(storage):
+    kept, voided = log(storage, 1.0, 1.1)
+    assert storage.void(voided, operator="op")
+    storage.archive_closed(NOW)
+    [partition] = storage.archive.partitions()
+    assert (partition.rows, partition.voided) == (1, 1)
+    assert storage.count() == 1
+    assert [r.seq for r in storage.query()] == [kept]
+    assert storage.archive.archived(voided)
+
+
+def test_archived_readings_can_no_longer_be_voided_or_restored(storage):
+    kept, voided = log(storage, 1.0, 1.1)
+    storage.void(voided)
+    storage.archive_closed(NOW)
+    with pytest.raises(ArchivedReadingError):
+        storage.void(kept)
+    with pytest.raises(ArchivedReadingError):
+        storage.restore(voided)
+    assert [r.seq for r in storage.query()] == [kept]
+
+
+def test_missing_and_live_readings_keep_their_answers(storage):
+    [seq] = log(storage, 1.0, day="2026-03-10")
+    storage.archive_closed(NOW)
+    assert storage.void(seq)
+    assert not storage.void(seq)
+    assert storage.restore(seq)
+    assert not storage.restore(seq)
+    assert not storage.void(seq + 100)
+
+
+def test_restored_reading_counts_again(storage):
+    [seq] = log(storage, 1.0, day="2026-03-10")
+    storage.void(seq)
+    assert storage.query() == []
+    storage.restore(seq)
+    assert [r.seq for r in storage.query()] == [seq]
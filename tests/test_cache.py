@@ -0,0 +1,65 @@
+from conftest import AREA
+
+from logbook.cache import LogCache
+from logbook.query import LogQuery
+
+
+def append(storage, value, minute=0):
+    return storage.append(AREA, "Pressure", value, "bar", "Normal", f"2026-03-01 08:{minute:02d}:00")
+
+
+def test_answer_is_kept_until_the_log_changes(storage):
+    cache = LogCache(storage)
+    append(storage, 1.0)
+    reads = []
+    read = lambda: reads.append(1) or storage.query()  # noqa: E731
+    assert [r.value for r in cache.get('all', read)] == [1.0]
+    assert [r.value for r in cache.get('all', read)] == [1.0]
+    assert (len(reads), cache.hits) == (1, 1)
+
+    append(storage, 1.1, minute=1)
+    assert [r.value for r in cache.get('all', read)] == [1.0, 1.1]
+    assert len(reads) == 2
+
+
+def test_voids_and_restores_clear_the_cache(storage):
+    cache, query = LogCache(storage), LogQuery(storage)
+    seq = append(storage, 1.0)
+    read = lambda: query.last(n=5)  # noqa: E731
+    assert len(cache.get('last', read)) == 1
+    storage.void(seq)
+    assert cache.get('last', read) == []
+    storage.restore(seq)
+    assert len(cache.get('last', read)) == 1
+
+
+def test_change_from_another_connection_is_seen(storage, tmp_path):
+    from logbook.storage import SQLiteLogStorage
+    cache = LogCache(storage)
+    assert cache.get('count', storage.count) == 0
+    other = SQLiteLogStorage(storage.path)
+    try:
+        append(other, 1.0)
+    finally:
+        other.close()
+    assert cache.get('count', storage.count) == 1
+
+
+def test_least_recently_used_answer_goes_first(storage):
+    cache = LogCache(storage, size=2)
+    for key in ('a', 'b', 'a', 'c'):
+        cache.get(key, lambda: key)
+    assert cache.misses == 3
+    cache.get('a', lambda: 'again')
+    assert cache.hits == 2
+    assert cache.get('b', lambda: 'again') == 'again'
+
+
+def test_query_reads_through_the_cache(storage):
+    cache = LogCache(storage)
+    query = LogQuery(storage, cache=cache)
+    append(storage, 1.0)
+    first = query.last(AREA, "Pressure", n=3)
+    assert query.last(AREA, "Pressure", n=3) is first
+    assert query.window("2026-03-01 00:00:00", "2026-03-02 00:00:00") == first
+    assert cache.hits == 1
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from conftest import AREA
+
+from logbook import clips as clips_module
+from logbook import pipeline
+from logbook.clips import Clip, ClipStore, Flag, compare, recheck
+
+TIMESTAMP = "2026-03-01 08:00:00"
+
+
+@pytest.fixture(autouse=True)
+def registered(registry, monkeypatch):
+    monkeypatch.setattr(pipeline, 'get_registry', lambda: registry)
+
+
+def clip(parameter="Pressure", readings=((1, "Pressure", 2.5),), key='c1'):
+    return Clip(key, f"2026-03-01/{key}.flac", AREA, parameter, TIMESTAMP, 'vosk', "", 0.5, readings)
+
+
+def log_clip(storage, key, parameter, value, confidence=0.5):
+    storage.record_clip(key, f"2026-03-01/{key}.flac", AREA, parameter, TIMESTAMP, 'vosk', str(value), confidence)
+    storage.append_many([(AREA, parameter, value, "bar", TIMESTAMP, "Normal")], [f"{key}:{parameter}"])
+
+
+def test_same_value_is_not_flagged():
+    assert compare(clip(), "two point five") == ([], [])
+
+
+def test_other_value_is_flagged():
+    flags, unheard = compare(clip(), "three point five")
+    assert flags == [Flag(1, 'c1', "Pressure", 2.5, 3.5, TIMESTAMP)]
+    assert unheard == []
+
+
+def test_readings_a_transcript_misses_are_only_counted():
+    dictated = clip(None, ((1, "Pressure", 2.5), (2, "Top Temperature", 120.0)))
+    flags, unheard = compare(dictated, "pressure two point five")
+    assert flags == []
+    assert unheard == [(2, 'c1', "Top Temperature")]
+    assert compare(dictated, "") == ([], [(1, 'c1', "Pressure"), (2, 'c1', "Top Temperature")])
+
+
+def test_recheck_records_flags_and_counts_failures(storage, monkeypatch, tmp_path):
+    log_clip(storage, 'same', "Pressure", 2.5)
+    log_clip(storage, 'other', "Pressure", 2.0)
+    log_clip(storage, 'broken', "Pressure", 1.5)
+    log_clip(storage, 'sure', "Pressure", 2.2, confidence=0.95)
+    heard = {'same': ("2.5", 0.9, None), 'other': ("2.8", 0.9, None), 'broken': (None, None, "OSError: no file")}
+    monkeypatch.setattr(clips_module, '_transcribe',
+                        lambda path, engine: heard[os.path.splitext(os.path.basename(path))[0]])
+
+    report = recheck(ClipStore(str(tmp_path), storage), 'google', processes=False, workers=2)
+    assert (report.clips, report.rechecked, report.flagged, report.failed) == (3, 2, 1, 1)
+    assert [(flag.key, flag.logged, flag.heard) for flag in storage.clip_flags()] == [('other', 2.0, 2.8)]
+    # Clips rechecked before are left out unless asked for again
+    assert [c.key for c in storage.clips(rechecked=False)] == ['broken', 'sure']
+
+
+def test_clip_of_a_parameter_no_longer_registered_fails_alone(storage, monkeypatch, tmp_path):
+    log_clip(storage, 'gone', "Flow", 3.0)
+    log_clip(storage, 'kept', "Pressure", 2.0)
+    monkeypatch.setattr(clips_module, '_transcribe', lambda path, engine: ("2.8", 0.9, None))
+
+    report = recheck(ClipStore(str(tmp_path), storage), 'google', processes=False, workers=1)
+    assert (report.clips, report.rechecked, report.flagged, report.failed) == (2, 1, 1, 1)
+    assert [flag.key for flag in storage.clip_flags()] == ['kept']
+
+
+def test_saved_clip_is_linked_to_its_readings(storage, tmp_path):
+    import speech_recognition as sr
+
+    from logbook.speech import RecognitionResult
+    store = ClipStore(str(tmp_path), storage)
+    audio = sr.AudioData(b'\0' * 3200, 16000, 2)
+    assert store.save('k', audio, AREA, "Pressure", TIMESTAMP, RecognitionResult("2.5", 0.6, 10.0, 'vosk'))
+    storage.append_many([(AREA, "Pressure", 2.5, "bar", TIMESTAMP, "Normal")], ['k:Pressure'])
+    [saved] = storage.clips()
+    assert (saved.key, saved.transcript, saved.readings) == ('k', "2.5", ((1, "Pressure", 2.5),))
+    assert (tmp_path / saved.file).exists()
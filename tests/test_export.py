@@ -0,0 +1,81 @@
+import csv
+import gzip
+import io
+from datetime import date
+
+import pytest
+from conftest import AREA
+
+from logbook.export import date_bounds, export_to_tempfile, write_export
+from logbook.storage import COLUMNS
+
+ROWS = [
+    (AREA, "Pressure", 2.5, "bar", "2026-02-28 23:00:00", "Normal"),
+    (AREA, "Top Temperature", 120.0, "°C", "2026-03-01 08:00:00", "Normal"),
+    (AREA, "Pressure", 3.5, "bar", "2026-03-01 23:59:59", "Above Range"),
+    (AREA, "Pressure", 2.6, "bar", "2026-03-02 00:00:00", "Normal"),
+]
+
+
+def read_csv(data):
+    rows = list(csv.reader(io.StringIO(data.decode('utf-8'))))
+    assert rows[0] == COLUMNS
+    return [(area, parameter, float(value), unit, ts, status) for area, parameter, value, unit, ts, status in rows[1:]]
+
+
+def read_parquet(data):
+    import pyarrow.parquet as pq
+    return [tuple(row.values()) for row in pq.read_table(io.BytesIO(data)).to_pylist()]
+
+
+def export(storage, fmt, **filters):
+    out = io.BytesIO()
+    rows = write_export(storage, out, fmt, chunk_size=1, **filters)
+    return rows, out.getvalue()
+
+
+@pytest.mark.parametrize('fmt, read', [
+    ('csv', read_csv),
+    ('csv.gz', lambda data: read_csv(gzip.decompress(data))),
+    ('parquet', read_parquet),
+])
+def test_every_format_holds_the_whole_log(storage, fmt, read):
+    storage.append_many(ROWS)
+    rows, data = export(storage, fmt)
+    assert rows == len(ROWS)
+    assert read(data) == ROWS
+
+
+def test_date_range_includes_the_whole_last_day(storage):
+    storage.append_many(ROWS)
+    start, end = date_bounds(date(2026, 3, 1), date(2026, 3, 1))
+    assert (start, end) == ("2026-03-01 00:00:00", "2026-03-02 00:00:00")
+    assert read_csv(export(storage, 'csv', start=start, end=end)[1]) == ROWS[1:3]
+    assert date_bounds() == (None, None)
+
+
+def test_area_and_parameter_filters(storage):
+    storage.append_many(ROWS + [("Area 2 - Vacuum Processing", "Pressure", 0.1, "bar", "2026-03-01 09:00:00",
+                                 "Normal")])
+    rows, data = export(storage, 'csv', areas=[AREA], parameters=["Pressure"])
+    assert read_csv(data) == [ROWS[0], ROWS[2], ROWS[3]]
+
+
+def test_voided_and_archived_readings(storage):
+    seqs = storage.append_many(ROWS)
+    storage.record_alarms([], storage.alarm_cursor(), storage.last_seq())
+    storage.archive_closed("2026-03-15 12:00:00")
+    assert storage.archive.rows() == 1
+    storage.void(seqs[1])
+    # The archived February reading comes first, as it was logged
+    assert read_csv(export(storage, 'csv')[1]) == [ROWS[0], ROWS[2], ROWS[3]]
+
+
+def test_tempfile_is_rewound_and_unknown_formats_are_refused(storage):
+    storage.append_many(ROWS)
+    spool, rows = export_to_tempfile(storage, 'csv')
+    with spool:
+        assert rows == len(ROWS)
+        assert read_csv(spool.read()) == ROWS
+    with pytest.raises(ValueError):
+        export_to_tempfile(storage, 'xlsx')
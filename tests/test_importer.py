@@ -0,0 +1,71 @@
+import csv
+
+from conftest import AREA
+
+from logbook.importer import import_file, normalize
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def readings(storage):
+    return [(r.parameter, r.value, r.unit, r.timestamp, r.status) for r in storage.query()]
+
+
+def test_long_file_is_validated_and_rejects_are_written(storage, registry, tmp_path):
+    path = write_csv(tmp_path / 'log.csv', ['Equipment', 'Tag', 'Value', 'Units', 'Time'], [
+        [AREA, "Pressure", "2.5", "bar", "2026-03-01 08:00:00"],
+        [AREA, "Top Temperature", "160", "", "2026-03-01 08:00:00"],
+        [AREA, "Pressure", "high", "bar", "2026-03-01 09:00:00"],
+        [AREA, "Flow", "7", "", "2026-03-01 09:00:00"],
+        [AREA, "Pressure", "2.6", "psi", "2026-03-01 10:00:00"],
+        [AREA, "Pressure", "2.7", "bar", "yesterday"],
+        ["", "Pressure", "2.8", "bar", "2026-03-01 11:00:00"],
+    ])
+    report = import_file(path, storage, registry)
+    assert (report.read, report.imported, report.duplicates, report.rejected) == (7, 2, 0, 5)
+    assert readings(storage) == [("Pressure", 2.5, "bar", "2026-03-01 08:00:00", "Normal"),
+                                 ("Top Temperature", 160.0, "°C", "2026-03-01 08:00:00", "Above Range")]
+    with open(report.rejects_path, encoding='utf-8') as f:
+        reasons = [row['Reason'] for row in csv.DictReader(f)]
+    assert reasons == ["value is not a number", "unknown area or parameter",
+                       "unit does not match the parameter's unit", "timestamp not understood",
+                       "missing area or parameter"]
+
+
+def test_reimport_skips_readings_already_logged(storage, registry, tmp_path):
+    rows = [[AREA, "Pressure", str(1 + minute / 100), f"2026-03-01 08:{minute:02d}:00"] for minute in range(10)]
+    path = write_csv(tmp_path / 'log.csv', ['Area', 'Parameter', 'Value', 'Timestamp'], rows)
+    assert import_file(path, storage, registry, chunk_size=3).imported == 10
+
+    overlapping = write_csv(tmp_path / 'more.csv', ['Area', 'Parameter', 'Value', 'Timestamp'],
+                            rows[5:] + rows[5:6] + [[AREA, "Pressure", "2", "2026-03-01 09:00:00"]])
+    report = import_file(overlapping, storage, registry, chunk_size=4)
+    assert (report.read, report.imported, report.duplicates) == (7, 1, 6)
+    assert storage.count() == 11
+
+
+def test_wide_dcs_dump_becomes_one_reading_per_cell(storage, registry, tmp_path):
+    path = write_csv(tmp_path / 'dcs.csv', ['Timestamp', 'Pressure', 'Top Temperature'], [
+        ["01/03/2026 08:00", "2.5", "120"],
+        ["01/03/2026 09:00", "0.5", ""],
+    ])
+    report = import_file(path, storage, registry, area=AREA, timestamp_format='%d/%m/%Y %H:%M', chunk_size=1)
+    assert (report.imported, report.rejected) == (3, 0)
+    assert readings(storage) == [("Pressure", 2.5, "bar", "2026-03-01 08:00:00", "Normal"),
+                                 ("Top Temperature", 120.0, "°C", "2026-03-01 08:00:00", "Normal"),
+                                 ("Pressure", 0.5, "bar", "2026-03-01 09:00:00", "Below Range")]
+
+
+def test_wide_row_key_is_given_to_each_of_its_readings():
+    import pandas as pd
+    chunk = pd.DataFrame({'Key': ["r1", None], 'Timestamp': ["t1", "t2"], 'Pressure': ["2.5", "2.6"]})
+    normalized = normalize(chunk, area=AREA)
+    assert normalized.loc[0, 'Key'] == "r1:Pressure"
+    assert pd.isna(normalized.loc[1, 'Key'])
+    assert normalized['Area'].tolist() == [AREA, AREA]
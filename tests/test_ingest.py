@@ -0,0 +1,54 @@
+from conftest import AREA
+
+from logbook.ingest import ingest, parse_payload
+
+
+def test_keyed_readings_are_stored_once(storage, registry, queue):
+    records = [
+        {"area": AREA, "parameter": "Pressure", "value": 2.5, "timestamp": "2026-03-01 08:00:00", "key": "k-1"},
+        {"area": AREA, "parameter": "Pressure", "value": 2.6, "timestamp": "2026-03-01 09:00:00", "key": "k-2"},
+    ]
+    first = ingest(records, registry, queue, wait=True)
+    again = ingest(records, registry, queue, wait=True)
+    assert first.accepted == again.accepted == 2
+    assert again.seqs == first.seqs
+    assert storage.count() == 2
+
+
+def test_readings_without_keys_are_stored_each_time(storage, registry, queue):
+    records = [{"area": AREA, "parameter": "Pressure", "value": 2.5, "timestamp": "2026-03-01 08:00:00"}]
+    ingest(records, registry, queue, wait=True)
+    ingest(records, registry, queue, wait=True)
+    assert storage.count() == 2
+
+
+def test_retried_round_is_stored_once(storage, registry, queue):
+    body = b'{"area": "Area 1 - Crude Processing", "Pressure": 2.5, "Top Temperature": 120, ' \
+           b'"timestamp": "2026-03-01 08:00:00", "key": "r-17"}'
+    first = ingest(parse_payload(body), registry, queue, wait=True)
+    again = ingest(parse_payload(body), registry, queue, wait=True)
+    assert first.accepted == 2
+    assert again.seqs == first.seqs
+    assert sorted((r.parameter, r.value) for r in storage.query()) == [("Pressure", 2.5), ("Top Temperature", 120.0)]
+
+
+def test_round_keys_are_per_parameter(storage, registry, queue):
+    ingest([{"area": AREA, "Pressure": 2.5, "timestamp": "2026-03-01 08:00:00", "key": "r-1"}],
+           registry, queue, wait=True)
+    # The same round key with another parameter is a reading not stored before
+    result = ingest([{"area": AREA, "Pressure": 2.5, "Top Temperature": 120, "timestamp": "2026-03-01 08:00:00",
+                      "key": "r-1"}], registry, queue, wait=True)
+    assert result.accepted == 2
+    assert storage.count() == 2
+
+
+def test_rejected_readings_are_reported_not_stored(storage, registry, queue):
+    result = ingest([
+        {"area": AREA, "parameter": "Pressure", "value": "high", "key": "k-1"},
+        {"area": AREA, "parameter": "Flow", "value": 3, "key": "k-2"},
+        {"area": AREA, "parameter": "Pressure", "value": 2.5, "key": "k-3"},
+    ], registry, queue, wait=True)
+    assert result.accepted == 1
+    assert len(result.rejected) == 2
+    assert all(row['Reason'] for row in result.rejected)
+    assert storage.count() == 1
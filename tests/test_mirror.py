@@ -0,0 +1,60 @@
+import sqlite3
+import time
+
+from conftest import AREA
+
+from logbook.mirror import ExcelMirror
+
+
+class LockedStorage:
+    """Storage whose lease table is locked ``locked`` times before it answers"""
+
+    def __init__(self, storage, locked=1):
+        self.storage = storage
+        self.locked = locked
+
+    def acquire_lease(self, name, holder, seconds):
+        if self.locked:
+            self.locked -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.storage.acquire_lease(name, holder, seconds)
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_workbook_follows_the_log(storage, tmp_path):
+    import openpyxl
+    path = tmp_path / 'log.xlsx'
+    storage.append(AREA, "Pressure", 2.5, "bar", "Normal", "2026-03-01 08:00:00")
+    mirror = ExcelMirror(storage, str(path), delay=0)
+    try:
+        assert mirror.sync()
+        assert not mirror.sync()
+        rows = list(openpyxl.load_workbook(path).active.iter_rows(values_only=True))
+        assert rows[1][:3] == (AREA, "Pressure", 2.5)
+    finally:
+        mirror.stop(final_sync=False)
+
+
+def test_store_error_does_not_end_the_thread(storage, tmp_path):
+    path = tmp_path / 'log.xlsx'
+    mirror = ExcelMirror(LockedStorage(storage), str(path), delay=0)
+    try:
+        mirror.request()
+        wait_for(lambda: mirror.last_error is not None)
+        assert isinstance(mirror.last_error, sqlite3.OperationalError)
+
+        mirror.request()
+        wait_for(path.exists)
+        wait_for(lambda: mirror.last_error is None)
+        assert mirror._thread.is_alive()
+    finally:
+        mirror.stop(final_sync=False)
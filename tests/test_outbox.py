@@ -0,0 +1,131 @@
+import time
+
+from conftest import AREA
+
+from logbook.writer import DEFERRED, FLUSHED, WriteBehindQueue
+
+
+class FlakyStorage:
+    """Storage that refuses every write while ``down``"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.down = False
+
+    def append_many(self, rows, keys=None):
+        if self.down:
+            raise OSError("log store unreachable")
+        return self.storage.append_many(rows, keys)
+
+
+def reading(value, minute):
+    return (AREA, "Pressure", value, "bar", f"2026-03-01 08:{minute:02d}:00", "Normal")
+
+
+def stored_values(storage):
+    return [r.value for r in sorted(storage.query(), key=lambda r: r.seq)]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_refused_batch_spills_and_replays_in_order(storage, outbox):
+    flaky = FlakyStorage(storage)
+    flaky.down = True
+    queue = WriteBehindQueue(flaky, max_delay=0.01, outbox=outbox)
+    try:
+        first = queue.submit_many([reading(1.0, 0), reading(1.1, 1)])
+        assert queue.flush(10)
+        second = queue.submit_many([reading(1.2, 2)])
+        assert queue.flush(10)
+        assert [queue.status(ticket) for ticket in first + second] == [DEFERRED] * 3
+        assert outbox.state().readings == 3
+        assert storage.count() == 0
+
+        flaky.down = False
+        # A reading queued after the store came back must not overtake the spilled ones
+        [third] = queue.submit_many([reading(1.3, 3)])
+        assert queue.flush(10)
+        assert queue.status(third) == FLUSHED
+        assert outbox.state().readings == 0
+        assert stored_values(storage) == [1.0, 1.1, 1.2, 1.3]
+    finally:
+        queue.stop()
+
+
+def test_replay_waits_for_the_store(storage, outbox):
+    flaky = FlakyStorage(storage)
+    flaky.down = True
+    queue = WriteBehindQueue(flaky, max_delay=0.01, outbox=outbox)
+    try:
+        queue.submit_many([reading(1.0, 0)])
+        queue.flush(10)
+        queue.replay()
+        wait_for(lambda: queue.last_error is not None)
+        assert outbox.state().readings == 1
+
+        flaky.down = False
+        queue.replay()
+        wait_for(lambda: outbox.state().readings == 0)
+        assert stored_values(storage) == [1.0]
+    finally:
+        queue.stop()
+
+
+def test_outbox_left_by_an_earlier_process_is_replayed(storage, outbox):
+    outbox.put_readings([reading(1.0, 0), reading(1.1, 1)], ['k-1', 'k-2'])
+    queue = WriteBehindQueue(storage, max_delay=0.01, outbox=outbox)
+    try:
+        queue.submit_many([reading(1.2, 2)])
+        assert queue.flush(10)
+        assert stored_values(storage) == [1.0, 1.1, 1.2]
+    finally:
+        queue.stop()
+
+
+def test_replayed_batch_whose_commit_was_lost_is_not_stored_twice(storage, outbox):
+    rows, keys = [reading(1.0, 0), reading(1.1, 1)], ['k-1', 'k-2']
+    # The store committed the batch but the outbox never heard of it
+    storage.append_many(rows, keys)
+    outbox.put_readings(rows, keys)
+    queue = WriteBehindQueue(storage, max_delay=0.01, outbox=outbox)
+    try:
+        queue.replay()
+        wait_for(lambda: outbox.state().readings == 0)
+        assert stored_values(storage) == [1.0, 1.1]
+    finally:
+        queue.stop()
+
+
+class ReplayCounter:
+    def __init__(self):
+        self.replays = 0
+
+    def replay(self):
+        self.replays += 1
+
+
+def test_recording_of_a_parameter_no_longer_registered_does_not_hold_up_the_rest(outbox, registry, monkeypatch):
+    import speech_recognition as sr
+
+    from logbook import pipeline, speech
+    from logbook.outbox import RecordingRetrier
+    monkeypatch.setattr(pipeline, 'get_registry', lambda: registry)
+    monkeypatch.setattr(speech, 'recognize', lambda *args, **kwargs: speech.RecognitionResult("2.5", 0.9, 1.0, 'vosk'))
+    audio = sr.AudioData(b'\0' * 3200, 16000, 2)
+    outbox.put_recording(AREA, "Flow", "2026-03-01 08:00:00", audio, key='gone')
+    outbox.put_recording("Area 9 - Closed", None, "2026-03-01 08:00:30", audio, key='closed')
+    outbox.put_recording(AREA, "Pressure", "2026-03-01 08:01:00", audio, key='kept')
+
+    queue = ReplayCounter()
+    retrier = RecordingRetrier(outbox, queue, interval=3600)
+    assert retrier.retry() == 1
+    assert outbox.state() == (1, 0, 2)
+    assert outbox.take_readings(10).keys == ['kept:Pressure']
+    assert queue.replays == 1
+    # Set aside, they are not tried again
+    assert retrier.retry() == 0
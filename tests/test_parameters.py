@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+from conftest import AREA
+
+from logbook import parameters
+from logbook.parameters import AREA_PARAMETERS, ParameterRegistry, get_registry, load_registry, registry_error
+
+LIMITS = {AREA: {"Pressure": {"min": 1, "max": 3, "unit": "bar"}}}
+
+
+@pytest.fixture
+def parameter_file(tmp_path, monkeypatch):
+    """A registry file in use by ``get_registry``, rechecked on every call"""
+    path = tmp_path / 'parameters.json'
+    path.write_text(json.dumps(LIMITS), encoding='utf-8')
+    monkeypatch.setenv('LOGBOOK_PARAMETERS', str(path))
+    monkeypatch.setattr(parameters, 'RELOAD_INTERVAL', 0)
+    monkeypatch.setattr(parameters, '_registry', None)
+    monkeypatch.setattr(parameters, '_registry_error', None)
+    return path
+
+
+def edit(path, text):
+    # A later modification time than the one loaded, however coarse the file system's clock
+    mtime = os.stat(path).st_mtime_ns
+    path.write_text(text, encoding='utf-8')
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+
+def test_registry_checks_readings_by_tag(registry):
+    pressure, temperature = registry.tag_id(AREA, "Pressure"), registry.tag_id(AREA, "Top Temperature")
+    assert registry.tag_id(AREA, "Flow") is None
+    assert registry.check([pressure, pressure, temperature], [0.5, 2.0, 151]).tolist() == [1, 0, 2]
+    assert registry.status(pressure, 3.5) == "Above Range"
+    assert registry.parameter_names(AREA) == ("Pressure", "Top Temperature")
+    assert registry.tag(temperature).unit == "°C"
+
+
+@pytest.mark.parametrize('limits', [
+    {AREA: {}},
+    {AREA: {"Pressure": {"min": 1, "unit": "bar"}}},
+    {AREA: {"Pressure": {"min": 3, "max": 1, "unit": "bar"}}},
+])
+def test_invalid_limits_are_refused(limits):
+    with pytest.raises(ValueError):
+        ParameterRegistry(limits)
+
+
+def test_edited_file_is_picked_up(parameter_file):
+    assert get_registry().as_dict() == {AREA: {"Pressure": {"min": 1.0, "max": 3.0, "unit": "bar"}}}
+    assert get_registry() is get_registry()
+
+    edit(parameter_file, json.dumps({AREA: {"Pressure": {"min": 1, "max": 4, "unit": "bar"}}}))
+    assert get_registry().tag(0).max == 4.0
+    assert AREA_PARAMETERS[AREA]["Pressure"]["max"] == 4.0
+
+
+def test_broken_edit_keeps_the_last_good_registry(parameter_file):
+    good = get_registry()
+    edit(parameter_file, '{"Area 1 - Crude Processing": ')
+    assert get_registry() is good
+    assert isinstance(registry_error(), ValueError)
+
+    edit(parameter_file, json.dumps({AREA: {"Pressure": {"min": 0, "max": 3, "unit": "bar"}}}))
+    assert get_registry().tag(0).min == 0.0
+    assert registry_error() is None
+
+
+def test_unreadable_file_without_a_registry_raises(parameter_file):
+    parameter_file.write_text('[]', encoding='utf-8')
+    with pytest.raises(ValueError):
+        get_registry()
+    with pytest.raises(ValueError):
+        load_registry(str(parameter_file))
@@ -0,0 +1,60 @@
+import pytest
+
+from logbook.parsing import extract_numeric_value, parse_dictation, parse_reading
+
+
+@pytest.mark.parametrize('text, value', [
+    ("123.5", 123.5),
+    ("-4", -4.0),
+    ("1,500", 1500.0),
+    ("1,500,000.5", 1500000.5),
+    ("one hundred twenty three point five", 123.5),
+    ("minus four", -4.0),
+    ("twenty five hundred", 2500.0),
+    ("a hundred and ten", 110.0),
+    ("one two three", 123.0),
+    ("point twenty five", 0.25),
+    ("120 degrees celsius", 120.0),
+])
+def test_reads_numbers(text, value):
+    assert extract_numeric_value(text) == value
+
+
+def test_spaced_sign_is_kept():
+    assert extract_numeric_value("- 5") == -5.0
+    assert extract_numeric_value("temperature is - 12.5 degrees") == -12.5
+    assert extract_numeric_value("+ 5") == 5.0
+
+
+def test_exponent():
+    assert extract_numeric_value("1e5") == 100000.0
+    assert extract_numeric_value("pressure 3.5e-2 bar") == pytest.approx(0.035)
+
+
+def test_decimal_comma():
+    assert extract_numeric_value("2,5") == 2.5
+    assert extract_numeric_value("pressure 1234,5") == 1234.5
+
+
+@pytest.mark.parametrize('text', [
+    "nineteen eighty four",
+    "twenty five six",
+    "one twenty",
+    "twenty thirteen",
+    "two hundred hundred",
+])
+def test_number_words_that_are_not_one_number_give_no_value(text):
+    parsed = parse_reading(text)
+    assert parsed.value is None
+    assert parsed.confidence == 0.0
+
+
+def test_dictation_leaves_unreadable_value_missing():
+    readings, missing = parse_dictation("pressure nineteen eighty four, feed rate 1500", ['Pressure', 'Feed Rate'])
+    assert [(reading.parameter, reading.value) for reading in readings] == [('Feed Rate', 1500.0)]
+    assert missing == ['Pressure']
+
+
+def test_range_and_unit():
+    parsed = parse_reading("between 120 and 130 degrees")
+    assert (parsed.value, parsed.upper, parsed.unit) == (120.0, 130.0, '°C')
@@ -0,0 +1,41 @@
+import time
+
+import speech_recognition as sr
+from conftest import AREA
+
+from logbook import pipeline
+from logbook.pipeline import VoicePipeline
+
+
+class SilentMicrophone:
+    """Audio session that never hears anything"""
+
+    calibrated = True
+
+    def __init__(self):
+        self.listens = 0
+
+    def listen(self, timeout, phrase_time_limit):
+        self.listens += 1
+        time.sleep(0.01)
+        raise sr.WaitTimeoutError("listening timed out")
+
+
+def test_silence_in_a_round_neither_notifies_nor_keeps_it_alive(monkeypatch):
+    monkeypatch.setattr(pipeline, 'ROUND_IDLE_SECONDS', 1)
+    microphone = SilentMicrophone()
+    voice = VoicePipeline(microphone, listen_timeout=0.01)
+    states = []
+    voice.add_listener(lambda: states.append(voice.state))
+    try:
+        voice.start_round(AREA)
+        deadline = time.monotonic() + 5
+        while voice.round_area is not None:
+            assert time.monotonic() < deadline, "the round never timed out"
+            time.sleep(0.01)
+        time.sleep(0.3)
+    finally:
+        voice.close()
+    assert microphone.listens >= 3
+    assert states == ['listening', 'idle']
+    assert not voice.busy
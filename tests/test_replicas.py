@@ -0,0 +1,101 @@
+import time
+
+import pytest
+from conftest import AREA
+
+from logbook.replicas import Notifier, replica_environment
+from logbook.sessions import SessionResources, Wakeups
+from logbook.storage import SQLiteLogStorage
+
+
+@pytest.fixture
+def other(storage):
+    """Another connection to the store, standing in for another replica"""
+    other = SQLiteLogStorage(storage.path)
+    yield other
+    other.close()
+
+
+def append(storage, value=2.5):
+    return storage.append(AREA, "Pressure", value, "bar", "Normal", "2026-03-01 08:00:00")
+
+
+class Resource:
+    def __init__(self, error=None):
+        self.closed = 0
+        self.error = error
+
+    def close(self):
+        self.closed += 1
+        if self.error is not None:
+            raise self.error
+
+
+def test_subscribers_get_the_channels_they_asked_for(storage, other):
+    # Polled by hand; the thread only looks once an hour
+    notifier = Notifier(storage, interval=3600)
+    readings, everything = [], []
+    notifier.subscribe(readings.append, 'readings')
+    notifier.subscribe(everything.append)
+    notifier.subscribe(lambda notification: 1 / 0)
+
+    seq = append(other)
+    other.void(seq)
+    notifier.publish('shutdown', replica="a")
+    assert notifier.poll() == 3
+    assert [n.payload for n in readings] == [{'last': seq, 'count': 1}]
+    assert [n.channel for n in everything] == ['readings', 'corrections', 'shutdown']
+    assert isinstance(notifier.last_error, ZeroDivisionError)
+    assert notifier.cursor == everything[-1].id
+    assert notifier.poll() == 0
+
+
+def test_wait_returns_once_another_replica_commits(storage, other):
+    notifier = Notifier(storage, interval=0.01)
+    seen = notifier.cursor
+    assert notifier.wait(seen, timeout=0.05) == seen
+    append(other)
+    assert notifier.wait(seen, timeout=5) > seen
+
+
+def test_lease_is_held_by_one_replica_until_it_runs_out(storage, other):
+    assert storage.acquire_lease('excel', "a", 60)
+    assert not other.acquire_lease('excel', "b", 60)
+    assert storage.acquire_lease('excel', "a", 0)
+    time.sleep(0.01)
+    assert other.acquire_lease('excel', "b", 60)
+
+
+def test_waiting_sessions_are_rerun_once():
+    reruns = []
+    wakeups = Wakeups(rerun=reruns.append)
+    wakeups.wait('s1')
+    wakeups.wait('s1')
+    wakeups.wait('s2')
+    assert wakeups.wake() == ['s1', 's2']
+    assert wakeups.wake() == []
+    assert sorted(reruns) == ['s1', 's2']
+
+
+def test_resources_are_closed_when_replaced_or_the_session_ends():
+    active = {'s1', 's2'}
+    resources = SessionResources(is_active=active.__contains__, interval=3600)
+    old, new, other = Resource(), Resource(), Resource(OSError("device busy"))
+    resources.register('s1', 'microphone', old)
+    resources.register('s1', 'microphone', new)
+    resources.register('s2', 'microphone', other)
+    assert (old.closed, new.closed) == (1, 0)
+
+    active.clear()
+    assert sorted(resources.reap()) == ['s1', 's2']
+    assert (new.closed, other.closed) == (1, 1)
+    assert isinstance(resources.last_error, OSError)
+    assert resources.sessions() == []
+
+
+def test_only_the_first_replica_serves_ingestion():
+    base = {'LOGBOOK_INGEST_PORT': "8600", 'LOGBOOK_METRICS_PORT': "9100"}
+    first, second = replica_environment(0, base), replica_environment(1, base)
+    assert first == {**base, 'LOGBOOK_REPLICA': "replica-0"}
+    assert 'LOGBOOK_INGEST_PORT' not in second
+    assert second['LOGBOOK_METRICS_PORT'] == "9101"
@@ -0,0 +1,67 @@
+import pytest
+from conftest import AREA
+
+from logbook.rollups import aggregate, aggregate_frame
+from logbook.storage import COLUMNS
+
+ROWS = [
+    (AREA, "Pressure", 2.0, "bar", "2026-03-01 05:30:00", "Normal"),
+    (AREA, "Pressure", 3.0, "bar", "2026-03-01 06:10:00", "Normal"),
+    (AREA, "Pressure", 1.0, "bar", "2026-03-01 06:50:00", "Normal"),
+    (AREA, "Top Temperature", 120.0, "°C", "2026-03-01 06:20:00", "Normal"),
+]
+
+
+@pytest.fixture(autouse=True)
+def default_shifts(monkeypatch):
+    monkeypatch.delenv('LOGBOOK_SHIFT_STARTS', raising=False)
+
+
+def summary(storage, period, parameter="Pressure"):
+    return [(r.bucket, r.count, r.total, r.minimum, r.maximum, r.last_value)
+            for r in storage.rollups(period, parameter=parameter)]
+
+
+def test_appended_readings_are_folded_into_every_period(storage):
+    storage.append_many(ROWS[:2])
+    storage.append_many(ROWS[2:])
+    assert summary(storage, 'hour') == [("2026-03-01 05:00:00", 1, 2.0, 2.0, 2.0, 2.0),
+                                        ("2026-03-01 06:00:00", 2, 4.0, 1.0, 3.0, 1.0)]
+    # The night shift ends at six
+    assert summary(storage, 'shift') == [("2026-02-28 22:00:00", 1, 2.0, 2.0, 2.0, 2.0),
+                                         ("2026-03-01 06:00:00", 2, 4.0, 1.0, 3.0, 1.0)]
+    [day] = storage.rollups('day', parameter="Pressure")
+    assert (day.count, day.mean, day.last_value) == (3, 2.0, 1.0)
+
+
+def test_void_recomputes_only_its_buckets(storage):
+    seqs = storage.append_many(ROWS)
+    storage.void(seqs[2])
+    assert summary(storage, 'hour') == [("2026-03-01 05:00:00", 1, 2.0, 2.0, 2.0, 2.0),
+                                        ("2026-03-01 06:00:00", 1, 3.0, 3.0, 3.0, 3.0)]
+    assert summary(storage, 'day', "Top Temperature")[0][1] == 1
+
+    storage.restore(seqs[2])
+    assert summary(storage, 'hour')[1] == ("2026-03-01 06:00:00", 2, 4.0, 1.0, 3.0, 1.0)
+
+
+def test_last_voided_reading_removes_its_bucket(storage):
+    [seq] = storage.append_many(ROWS[:1])
+    storage.void(seq)
+    assert storage.rollups('hour') == []
+
+
+def test_frame_aggregation_matches_row_aggregation():
+    import pandas as pd
+    frame = pd.DataFrame(ROWS, columns=COLUMNS)
+    by_rows = {key: tuple(partial) for key, partial in aggregate(ROWS).items()}
+    by_frame = {tuple(row[:4]): tuple(row[4:]) for row in aggregate_frame(frame)}
+    assert by_frame == by_rows
+
+
+def test_bulk_append_matches_a_rebuild(storage):
+    import pandas as pd
+    assert storage.append_frame(pd.DataFrame(ROWS, columns=COLUMNS)) == len(ROWS)
+    folded = {period: storage.rollups(period) for period in ('hour', 'shift', 'day')}
+    storage.rebuild_rollups()
+    assert {period: storage.rollups(period) for period in folded} == folded
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+import speech_recognition as sr
+
+from logbook import speech
+from logbook.parsing import vocabulary
+from logbook.speech import RecognitionCache, RecognitionResult, fingerprint, recognize
+
+
+def audio(*parts):
+    """16 kHz audio of the given sample arrays back to back"""
+    return sr.AudioData(np.concatenate(parts).astype(np.int16).tobytes(), 16000, 2)
+
+
+SPEECH = (np.sin(np.arange(8000) / 5) * 8000).astype(np.int16)
+
+
+class Engine:
+    """Fake engine that counts how often it is asked"""
+
+    def __init__(self, text="pressure two point five", error=None):
+        self.text = text
+        self.error = error
+        self.calls = []
+
+    def __call__(self, recognizer, audio, phrases=None):
+        self.calls.append(phrases)
+        if self.error is not None:
+            raise self.error
+        return self.text, 0.9
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    monkeypatch.setattr(speech, '_cache', RecognitionCache())
+    fakes = {'vosk': Engine(), 'whisper': Engine("pressure two point six"), 'google': Engine()}
+    for name, engine in fakes.items():
+        monkeypatch.setitem(speech.ENGINES, name, engine)
+    return fakes
+
+
+def test_fingerprint_ignores_the_silence_around_the_speech():
+    quiet = np.full(4000, 100)
+    plain = fingerprint(audio(SPEECH))
+    assert fingerprint(audio(np.zeros(16000), SPEECH, quiet)) == plain
+    assert fingerprint(audio(SPEECH[:-10])) != plain
+    assert fingerprint(audio(SPEECH // 2)) != plain
+
+
+def test_same_recording_is_recognized_once_per_engine_and_phrases(engines):
+    recognizer = sr.Recognizer()
+    first = recognize(recognizer, audio(SPEECH), 'vosk', phrases=["Pressure"])
+    again = recognize(recognizer, audio(np.zeros(800), SPEECH), 'vosk', phrases=["Pressure"])
+    assert (again.text, again.engine) == (first.text, 'vosk')
+    assert engines['vosk'].calls == [("Pressure",)]
+
+    recognize(recognizer, audio(SPEECH), 'vosk')
+    recognize(recognizer, audio(SPEECH), 'whisper', phrases=["Pressure"])
+    assert len(engines['vosk'].calls) == 2
+    assert len(engines['whisper'].calls) == 1
+
+
+def test_second_opinion_skips_the_cache(engines):
+    recognizer = sr.Recognizer()
+    recognize(recognizer, audio(SPEECH), 'vosk')
+    recognize(recognizer, audio(SPEECH), 'vosk', cache=False)
+    assert len(engines['vosk'].calls) == 2
+
+
+def test_fallback_answers_when_the_engine_is_unavailable(engines):
+    engines['vosk'].error = sr.RequestError("no model")
+    result = recognize(sr.Recognizer(), audio(SPEECH), 'vosk', fallback='whisper')
+    assert (result.text, result.engine) == ("pressure two point six", 'whisper')
+    with pytest.raises(sr.RequestError):
+        recognize(sr.Recognizer(), audio(SPEECH), 'vosk')
+    with pytest.raises(ValueError):
+        recognize(sr.Recognizer(), audio(SPEECH), 'sphinx')
+
+
+def test_cache_keeps_the_most_recent_transcripts():
+    cache = RecognitionCache(size=2)
+    for key in 'abc':
+        cache.put(key, RecognitionResult(key, None, 1.0, 'vosk'))
+        cache.get('a')
+    assert cache.get('b') is None
+    assert cache.get('a').text == 'a'
+
+
+def test_vocabulary_covers_what_the_parser_reads():
+    words = vocabulary(("Top Temperature", "Pressure"))
+    assert {'top', 'temperature', 'pressure', 'point', 'minus', 'hundred', 'bar'} <= set(words)
+    assert 'flow' not in words
+    assert set("top temperature one hundred twenty five degrees".split()) <= set(words)
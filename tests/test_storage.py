@@ -0,0 +1,48 @@
+from conftest import AREA
+
+from logbook.storage import COLUMNS, SQLiteLogStorage, import_legacy_workbook
+
+
+def row(parameter="Pressure", value=2.5, minute=0):
+    return (AREA, parameter, value, "bar", f"2026-03-01 08:{minute:02d}:00", "Normal")
+
+
+def test_readings_get_increasing_sequence_numbers_and_outlive_the_connection(storage):
+    assert storage.last_seq() == 0
+    assert storage.append_many([row(minute=0), row(minute=1)]) == [1, 2]
+    assert storage.append(AREA, "Pressure", 2.7, "bar", "Normal", "2026-03-01 08:02:00") == 3
+
+    reopened = SQLiteLogStorage(storage.path)
+    try:
+        assert (reopened.last_seq(), reopened.count()) == (3, 3)
+        assert [reading.value for reading in reopened.query()] == [2.5, 2.5, 2.7]
+    finally:
+        reopened.close()
+
+
+def test_rows_after_reads_only_newer_readings(storage):
+    storage.append_many([row(value=1.0), row(value=2.0, minute=1), row(value=3.0, minute=2)])
+    assert [(seq, stored[2]) for seq, stored in storage.rows_after(1)] == [(2, 2.0), (3, 3.0)]
+    assert [seq for seq, _ in storage.rows_after(0, limit=2)] == [1, 2]
+    assert storage.rows_after(3) == []
+
+
+def test_iter_rows_filters_and_chunks(storage):
+    storage.append_many([row(value=1.0), row("Top Temperature", 120.0, minute=1), row(value=3.0, minute=2),
+                         (AREA.replace("1", "2"), "Pressure", 4.0, "bar", "2026-03-01 08:03:00", "Normal")])
+    chunks = list(storage.iter_rows(areas=[AREA], parameters=["Pressure"], chunk_size=1))
+    assert [[stored[2] for stored in chunk] for chunk in chunks] == [[1.0], [3.0]]
+    window = [stored for chunk in storage.iter_rows("2026-03-01 08:01:00", "2026-03-01 08:03:00") for stored in chunk]
+    assert [stored[1] for stored in window] == ["Top Temperature", "Pressure"]
+
+
+def test_legacy_workbook_is_imported_once(storage, tmp_path):
+    import pandas as pd
+    path = str(tmp_path / 'log.xlsx')
+    legacy = pd.DataFrame([row(), row(value=2.6, minute=1)], columns=COLUMNS).rename(columns={'Area': 'Equipment'})
+    legacy.loc[1, 'Status'] = None
+    legacy.to_excel(path, index=False)
+
+    assert import_legacy_workbook(storage, path, only_if_empty=True) == 2
+    assert import_legacy_workbook(storage, path, only_if_empty=True) == 0
+    assert [(r.area, r.value, r.status) for r in storage.query()] == [(AREA, 2.5, "Normal"), (AREA, 2.6, "Normal")]
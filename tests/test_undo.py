@@ -0,0 +1,107 @@
+import sqlite3
+
+import pytest
+from conftest import AREA
+
+from logbook.storage import ArchivedReadingError
+from logbook.undo import UndoHistory
+from logbook.writer import FLUSHED
+
+
+class CommittedQueue:
+    """Write queue whose ticket ``n`` was stored as reading ``n``"""
+
+    def flush(self, timeout=None):
+        return True
+
+    def seq(self, ticket):
+        return ticket
+
+    def status(self, ticket):
+        return FLUSHED
+
+
+class FailingStorage:
+    """Storage whose voids and restores raise ``error`` until it is cleared"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.voids = set()
+
+    def void(self, seq, operator=None, session=None):
+        if self.error:
+            raise self.error
+        if seq in self.voids:
+            return False
+        self.voids.add(seq)
+        return True
+
+    def restore(self, seq, operator=None, session=None):
+        if self.error:
+            raise self.error
+        if seq not in self.voids:
+            return False
+        self.voids.remove(seq)
+        return True
+
+
+def history(*tickets):
+    history = UndoHistory(operator="op", session="s")
+    history.record(tickets, [(AREA, "Pressure", 2.5, "bar", "2026-03-01 08:00:00", "Normal")] * len(tickets))
+    return history
+
+
+def test_failed_undo_keeps_the_reading():
+    storage = FailingStorage(sqlite3.OperationalError("database is locked"))
+    queue, undo = CommittedQueue(), history(1, 2)
+    with pytest.raises(sqlite3.OperationalError):
+        undo.undo(storage, queue)
+    assert undo.next_undo().seq == 2
+    assert undo.next_redo() is None
+    storage.error = None
+    assert undo.undo(storage, queue).seq == 2
+    assert storage.voids == {2}
+
+
+def test_failed_redo_keeps_the_reading():
+    storage, queue, undo = FailingStorage(), CommittedQueue(), history(1)
+    undo.undo(storage, queue)
+    storage.error = sqlite3.OperationalError("database is locked")
+    with pytest.raises(sqlite3.OperationalError):
+        undo.redo(storage)
+    assert undo.next_redo().seq == 1
+    storage.error = None
+    assert undo.redo(storage).seq == 1
+    assert storage.voids == set()
+    assert undo.next_undo().seq == 1
+
+
+def test_archived_reading_leaves_the_history():
+    storage, queue, undo = FailingStorage(ArchivedReadingError(2)), CommittedQueue(), history(1, 2)
+    with pytest.raises(ArchivedReadingError):
+        undo.undo(storage, queue)
+    assert undo.next_undo().seq == 1
+
+    storage.error = None
+    undo.undo(storage, queue)
+    storage.error = ArchivedReadingError(1)
+    with pytest.raises(ArchivedReadingError):
+        undo.redo(storage)
+    assert undo.next_redo() is None
+
+
+def test_undo_of_reading_voided_elsewhere_does_nothing():
+    storage, queue, undo = FailingStorage(), CommittedQueue(), history(1)
+    storage.voids.add(1)
+    assert undo.undo(storage, queue) is None
+    assert undo.next_undo() is None
+    assert undo.next_redo() is None
+
+
+def test_undo_and_redo_against_the_store(storage):
+    [seq] = storage.append_many([(AREA, "Pressure", 2.5, "bar", "2026-03-01 08:00:00", "Normal")])
+    undo = history(seq)
+    assert undo.undo(storage, CommittedQueue()).seq == seq
+    assert storage.query() == []
+    assert undo.redo(storage).seq == seq
+    assert [r.seq for r in storage.query()] == [seq]